@@ -5,18 +5,30 @@
 import sys
 import json
 import dateutil.parser
-import datetime
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, stream_with_context, jsonify
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
-import logging
-from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
 
-from models import db, Venue, Artist, Show
+from models import db, Venue, Artist, Show, Genre
+from projections import show_query, show_row_dict, split_show_rows, venue_directory
+import search
+import facets
+import schedule
+import availability
+import counters
+import recommendations
+from pagination import keyset_page, requested_page_size
+from readmodels import names, venue_detail, artist_detail
+import export
+from commands import fyyur_cli
+from formatting import format_datetime
+from querycount import QueryCounter
+from pagecache import PageCache
+from applog import AppLog
+import pagecache
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -27,56 +39,22 @@ moment = Moment(app)
 app.config.from_object('config')
 db.init_app(app)
 
-migrate = Migrate(app, db)
+def include_object(object, name, type_, reflected, compare_to):
+  # database-managed objects alembic autogenerate should leave alone
+  return (search.include_object(object, name, type_, reflected, compare_to) and
+          schedule.include_object(object, name, type_, reflected, compare_to))
+
+migrate = Migrate(app, db, include_object=include_object)
+app.cli.add_command(fyyur_cli)
+querycount = QueryCounter(app)
+pages = PageCache(app)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
-
 app.jinja_env.filters['datetime'] = format_datetime
 
-# ---------------------------------------------------------------------------#
-# Helper functions
-# ---------------------------------------------------------------------------#
-def show_dict(show):
-  return {
-    "artist_id": show.artist_id,
-    "artist_name": Artist.query.get(show.artist_id).name,
-    "artist_image_link": Artist.query.get(show.artist_id).image_link,
-    "venue_id": show.venue_id,
-    "venue_name": Venue.query.get(show.venue_id).name,
-    "venue_image_link": Venue.query.get(show.venue_id).image_link,
-    "start_time": show.start_time.strftime("%Y-%m-%d %H:%M:%S")
-  }
-
-def upcoming_shows(shows):
-  result = []
-  if shows:
-    result = [show_dict(s) for s in shows if s.start_time >= datetime.now()]
-  return result
-
-def past_shows(shows):
-  result = []
-  if shows:
-    result = [show_dict(s) for s in shows if s.start_time < datetime.now()]
-    print(shows)
-  return result
-
-def area_venue_dict(area, venues):
-  return {
-    "city": area[0],
-    "state": area[1],
-    "venues": [{"id": v.id, "name": v.name, "num_upcoming_shows": len(upcoming_shows(v.shows))} for v in venues]
-  }
-  
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -91,12 +69,10 @@ def index():
 
 @app.route('/venues')
 def venues():
-  
-  areas = [(v.city, v.state) for v in Venue.query.distinct(Venue.city, Venue.state)]
-  venues_areas = {a: Venue.query.filter_by(city=a[0], state=a[1]).all() for a in areas}
-  data = [area_venue_dict((k,v),l) for (k,v),l in venues_areas.items()]
-
-  return render_template('pages/venues.html', areas=data)
+  # areas are produced lazily from a single grouped query while the template renders
+  filters = facets.parse_filters(Venue, request.args)
+  return render_template('pages/venues.html', areas=venue_directory(facets.criteria(Venue, filters)),
+                         facets=facets.facet_groups(Venue, filters), filters=facets.params(Venue, filters))
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
@@ -104,30 +80,45 @@ def search_venues():
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
   q = request.form.get('search_term', '')
-  venues = Venue.query.filter(Venue.name.ilike('%' + q + '%')).all()
-  data = [{"id": v.id, "name": v.name, "num_upcoming_shows": len(upcoming_shows(v.shows))} for v in venues]
+  data, next_cursor, total = search.search_venues(q, request.form.get('cursor'))
 
   response={
-    "count": len(data),
+    "count": total,
     "data": data
   }
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''),
+                         next_cursor=next_cursor, per_page=requested_page_size())
+
+@app.route('/venues/available')
+def available_venues():
+  # venues with no show between ?start= and ?end=, optionally in one city or
+  # state, as JSON
+  if not request.args.get('start') or not request.args.get('end'):
+    abort(400)
+  start, end = schedule.parse_window(request.args.get('start'), request.args.get('end'))
+  venues = availability.free_venues(start, end, request.args.get('city'), request.args.get('state'))
+  return jsonify({
+    "start": start.isoformat(),
+    "end": end.isoformat(),
+    "venues": [{"id": id, "name": name, "city": city, "state": state} for id, name, city, state in venues]
+  })
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-
-  venue = Venue.query.get(venue_id)
-  past_shows = db.session.query(Show).join(Venue).filter(Show.venue_id == venue_id) \
-                .filter(Show.start_time < datetime.now()).all()
-
-  upcoming_shows = db.session.query(Show).join(Venue).filter(Show.venue_id == venue_id) \
-                .filter(Show.start_time > datetime.now()).all()
+  page = pages.get('venue', venue_id)
+  if page is not None:
+    return page
+
+  venue = venue_detail(venue_id)
+  if venue is None:
+    abort(404)
+  past_shows, upcoming_shows = split_show_rows(show_query().filter(Show.venue_id == venue_id))
  
   data = {
     "id": venue.id,
     "name": venue.name,
-    "genres": [x.strip() for x in venue.genres.split(",")],
+    "genres": venue.genres,
     "address": venue.address,
     "city": venue.city,
     "state": venue.state,
@@ -137,12 +128,16 @@ def show_venue(venue_id):
     "seeking_talent": venue.seeking_talent,
     "seeking_description": venue.seeking_description,
     "image_link": venue.image_link,
-    "past_shows": [show_dict(s) for s in past_shows],
-    "upcoming_shows": [show_dict(s) for s in upcoming_shows],
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
     "past_shows_count": len(past_shows),
     "upcoming_shows_count": len(upcoming_shows),   
+    "similar_venues": recommendations.similar(Venue, venue_id),
   }
-  return render_template('pages/show_venue.html', venue=data)
+  page = render_template('pages/show_venue.html', venue=data)
+  # cached until the next upcoming show starts
+  pages.set('venue', venue_id, page, upcoming_shows[0]['start_time'] if upcoming_shows else None)
+  return page
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -164,7 +159,7 @@ def create_venue_submission():
     state = request.form.get('state', '')
     address = request.form.get('address', '')
     phone = request.form.get('phone', '')
-    genres = request.form.get('genres', '')
+    genres = Genre.from_names(request.form.getlist('genres'))
     facebook_link = request.form.get('facebook_link', '')
 
     venue = Venue(name=name, city=city, state=state, address=address, phone=phone, genres=genres, facebook_link=facebook_link)
@@ -193,7 +188,7 @@ def create_venue_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   # Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
@@ -201,8 +196,14 @@ def delete_venue(venue_id):
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
   try:
-    Venue.query.filter_by(id=venue_id).delete()
-    db.session.commit()
+    venue = Venue.query.get(venue_id)
+    if venue is not None:
+      # the shows in one statement, then the venue through the ORM so the
+      # search, facet and availability hooks drop it
+      artist_ids = counters.delete_venue_shows(db.session.connection(), venue_id)
+      db.session.delete(venue)
+      db.session.commit()
+      pagecache.invalidate_venue(venue_id, artist_ids)
   except:
     db.session.rollback()
   finally:
@@ -213,10 +214,14 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-  artists = Artist.query.all()
-  data = [{"id": a.id, "name": a.name} for a in artists]
+  filters = facets.parse_filters(Artist, request.args)
+  artists = names(Artist).filter(*facets.criteria(Artist, filters))
+  page = keyset_page(artists, [Artist.id], request.args.get('cursor'))
+  data = [{"id": a.id, "name": a.name} for a in page.items]
 
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', artists=data, facets=facets.facet_groups(Artist, filters),
+                         filters=facets.params(Artist, filters), next_cursor=page.next_cursor,
+                         per_page=requested_page_size())
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
@@ -224,29 +229,30 @@ def search_artists():
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
   q = request.form.get('search_term', '')
-  artists = Artist.query.filter(Artist.name.ilike('%' + q + '%')).all()
-  data = [{"id": a.id, "name": a.name, "num_upcoming_shows": len(upcoming_shows(a.shows))} for a in artists]
+  data, next_cursor, total = search.search_artists(q, request.form.get('cursor'))
 
   response={
-    "count": len(data),
+    "count": total,
     "data": data
   }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''),
+                         next_cursor=next_cursor, per_page=requested_page_size())
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
-
-  artist = Artist.query.get(artist_id)
-  past_shows = db.session.query(Show).join(Artist).filter(Show.artist_id == artist_id) \
-                .filter(Show.start_time < datetime.now()).all()
-
-  upcoming_shows = db.session.query(Show).join(Artist).filter(Show.artist_id == artist_id) \
-                .filter(Show.start_time > datetime.now()).all()
+  page = pages.get('artist', artist_id)
+  if page is not None:
+    return page
+
+  artist = artist_detail(artist_id)
+  if artist is None:
+    abort(404)
+  past_shows, upcoming_shows = split_show_rows(show_query().filter(Show.artist_id == artist_id))
   data={
     "id": artist.id,
     "name": artist.name,
-    "genres": [x.strip() for x in artist.genres.split(",")],
+    "genres": artist.genres,
     "city": artist.city,
     "state": artist.state,
     "phone": artist.phone,
@@ -255,24 +261,29 @@ def show_artist(artist_id):
     "seeking_venue": artist.seeking_venue,
     "seeking_description": artist.seeking_description,
     "image_link": artist.image_link,
-    "past_shows": [show_dict(s) for s in past_shows],
-    "upcoming_shows": [show_dict(s) for s in upcoming_shows],
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
     "past_shows_count": len(past_shows),
     "upcoming_shows_count": len(upcoming_shows),
+    "similar_artists": recommendations.similar(Artist, artist_id),
   }
 
-  return render_template('pages/show_artist.html', artist=data)
+  page = render_template('pages/show_artist.html', artist=data)
+  pages.set('artist', artist_id, page, upcoming_shows[0]['start_time'] if upcoming_shows else None)
+  return page
 
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   form = ArtistForm()
-  art = Artist.query.get(artist_id)
+  art = artist_detail(artist_id)
+  if art is None:
+    abort(404)
   artist={
     "id": art.id,
     "name": art.name,
-    "genres": [x.strip() for x in art.genres.split(",")],
+    "genres": art.genres,
     "city": art.city,
     "state": art.state,
     "phone": art.phone,
@@ -295,9 +306,10 @@ def edit_artist_submission(artist_id):
     artist.city = request.form.get('city', '')
     artist.state = request.form.get('state', '')
     artist.phone = request.form.get('phone', '')
-    artist.genres = request.form.get('genres', '')
+    artist.genres = Genre.from_names(request.form.getlist('genres'))
     artist.facebook_link = request.form.get('facebook_link', '')
     db.session.commit()
+    pagecache.invalidate_artist(artist_id)
   except:
     db.session.rollback()
   finally:
@@ -307,11 +319,13 @@ def edit_artist_submission(artist_id):
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   form = VenueForm()
-  ven = Venue.query.get(venue_id)
+  ven = venue_detail(venue_id)
+  if ven is None:
+    abort(404)
   venue={
     "id": ven.id,
     "name": ven.name,
-    "genres": [x.strip() for x in ven.genres.split(",")],
+    "genres": ven.genres,
     "address": ven.address,
     "city": ven.city,
     "state": ven.state,
@@ -335,9 +349,10 @@ def edit_venue_submission(venue_id):
     venue.city = request.form.get('city', '')
     venue.state = request.form.get('state', '')
     venue.phone = request.form.get('phone', '')
-    venue.genres = request.form.get('genres', '')
+    venue.genres = Genre.from_names(request.form.getlist('genres'))
     venue.facebook_link = request.form.get('facebook_link', '')
     db.session.commit()
+    pagecache.invalidate_venue(venue_id)
   except:
     db.session.rollback()
   finally:
@@ -365,7 +380,7 @@ def create_artist_submission():
     city = request.form.get('city', '')
     state = request.form.get('state', '')
     phone = request.form.get('phone', '')
-    genres = request.form.get('genres', '')
+    genres = Genre.from_names(request.form.getlist('genres'))
     facebook_link = request.form.get('facebook_link', '')
 
     artist = Artist(name=name, city=city, state=state, phone=phone, genres=genres, facebook_link=facebook_link)
@@ -396,8 +411,29 @@ def create_artist_submission():
 def shows():
   # displays list of shows at /shows
 
-  data = [show_dict(s) for s in Show.query.all()]
-  return render_template('pages/shows.html', shows=data)
+  page = keyset_page(show_query(), [Show.start_time, Show.id], request.args.get('cursor'))
+  data = [show_row_dict(r) for r in page.items]
+  return render_template('pages/shows.html', shows=data, next_cursor=page.next_cursor,
+                         per_page=requested_page_size())
+
+@app.route('/calendar')
+def calendar():
+  # shows starting between ?start= and ?end= (a week from start by default),
+  # optionally for one city, state, venue_id or artist_id, as JSON
+  start, end = schedule.parse_window(request.args.get('start'), request.args.get('end'))
+  query = schedule.calendar_query(
+    start, end,
+    city=request.args.get('city'),
+    state=request.args.get('state'),
+    venue_id=request.args.get('venue_id', type=int),
+    artist_id=request.args.get('artist_id', type=int))
+  page = keyset_page(query, [Show.start_time, Show.id], request.args.get('cursor'))
+  return jsonify({
+    "start": start.isoformat(),
+    "end": end.isoformat(),
+    "shows": [schedule.calendar_row(r) for r in page.items],
+    "next_cursor": page.next_cursor
+  })
 
 @app.route('/shows/create')
 def create_shows():
@@ -410,22 +446,36 @@ def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # insert form data as a new Show record in the db, instead
 
+  # the booking check relies on shows lasting at most MAX_DURATION
+  form = ShowForm(meta={'csrf': False})
+  if not form.duration.validate(form):
+    flash('Duration must be between 1 and %d minutes. Show could not be listed.' % availability.MAX_DURATION, 'alert')
+    return render_template('pages/home.html')
+
   error = False
+  booked = False
   try:
     artist_id = request.form.get('artist_id', '')
     venue_id = request.form.get('venue_id', '')
-    start_time = request.form.get('start_time', '')
+    start_time = dateutil.parser.parse(request.form.get('start_time', ''))
+    duration = form.duration.data or availability.DEFAULT_DURATION
 
-    show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
+    show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time, duration=duration)
     db.session.add(show)
     db.session.commit()
+    pagecache.invalidate_show(venue_id, artist_id)
+  except availability.DoubleBooking:
+    booked = True
+    db.session.rollback()
   except:
     error = True
     db.session.rollback()
     print(sys.exc_info())
   finally:
     db.session.close()
-  if error:
+  if booked:
+    flash('The venue is already booked at that time. Show could not be listed.', 'alert')
+  elif error:
     flash('An error occurred. Show could not be listed.', 'alert')
   else:
     # on successful db insert, flash success
@@ -436,6 +486,24 @@ def create_show_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   return render_template('pages/home.html')
 
+#  Export
+#  ----------------------------------------------------------------
+
+@app.route('/export/<kind>.<fmt>')
+def export_catalog(kind, fmt):
+  # streams the venue, artist or show catalog; ?updated_since=<ISO time, UTC>
+  # limits it to rows changed since then
+  if kind not in export.KINDS or fmt not in export.FORMATS:
+    abort(404)
+  updated_since = request.args.get('updated_since')
+  if updated_since:
+    try:
+      updated_since = dateutil.parser.parse(updated_since)
+    except (ValueError, OverflowError):
+      abort(400)
+  return Response(stream_with_context(export.serialize(kind, fmt, updated_since or None)),
+                  mimetype=export.FORMATS[fmt])
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -446,14 +514,8 @@ def server_error(error):
 
 
 if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+    # JSON lines in LOG_FILE, written off the request thread (see applog.py)
+    applog = AppLog(app)
 
 #----------------------------------------------------------------------------#
 # Launch.
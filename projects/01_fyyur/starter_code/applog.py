@@ -0,0 +1,259 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import g, has_request_context, request
+
+#----------------------------------------------------------------------------#
+# Application log.
+#
+# Log calls only put the record on a bounded in-memory queue (a stdlib
+# QueueHandler); a QueueListener thread formats it as one JSON object per
+# line and hands it to a RotatingFileHandler that flushes once per batch and
+# rotates the file by size. When the disk falls behind and the queue is
+# full, records are dropped and counted rather than blocking the request,
+# and the listener notes how many it lost.
+#
+#   LOG_FILE           path of the log (default 'error.log')
+#   LOG_LEVEL          lowest level written (default 'INFO')
+#   LOG_MAX_BYTES      size at which the file is rotated (default 10 MB)
+#   LOG_BACKUPS        rotated files kept as LOG_FILE.1 ... (default 5; 0
+#                      never rotates, like RotatingFileHandler)
+#   LOG_QUEUE_SIZE     records waiting at most (default 10000)
+#   LOG_BATCH          records written per flush at most (default 500)
+#   LOG_FLUSH_SECONDS  time a partial batch waits for more (default 0.5)
+#   LOG_REQUESTS       also log one line per request (default True)
+#
+# Lines written during a request carry its id (the X-Request-Id header, or a
+# new one echoed back in the response) and the milliseconds since it began.
+#----------------------------------------------------------------------------#
+
+# attributes of a LogRecord that are not extra fields
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+
+  def format(self, record):
+    line = {
+      'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+      'level': record.levelname,
+      'logger': record.name,
+      'message': record.getMessage(),
+      'where': '%s:%d' % (record.pathname, record.lineno),
+    }
+    line.update((k, v) for k, v in vars(record).items() if k not in _RECORD_ATTRIBUTES)
+    if record.exc_info and not record.exc_text:
+      record.exc_text = self.formatException(record.exc_info)
+    if record.exc_text:
+      line['exception'] = record.exc_text
+    return json.dumps(line, default=str)
+
+class BatchFileHandler(logging.handlers.RotatingFileHandler):
+  """RotatingFileHandler that leaves flushing to the caller and sizes the
+  file in encoded bytes (tell() would flush every record)."""
+
+  def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=5):
+    logging.handlers.RotatingFileHandler.__init__(self, path, maxBytes=max_bytes, backupCount=backups,
+                                                  encoding='utf-8', delay=True)
+    self.setFormatter(JsonFormatter())
+    self.size = 0
+
+  def _open(self):
+    stream = logging.handlers.RotatingFileHandler._open(self)
+    self.size = os.path.getsize(self.baseFilename)
+    return stream
+
+  def emit(self, record):
+    try:
+      line = self.format(record) + self.terminator
+    except Exception:
+      line = json.dumps({'level': 'ERROR', 'message': 'unformattable log record',
+                         'logger': record.name}) + self.terminator
+    size = len(line.encode(self.encoding))
+    try:
+      if self.stream is None:
+        self.stream = self._open()
+      if self.maxBytes and self.backupCount and self.size and self.size + size > self.maxBytes:
+        self.doRollover()
+        self.stream = self._open()
+      self.stream.write(line)
+      self.size += size
+    except OSError:
+      # a full or missing disk must not kill the listener: give the file up
+      # and open it again for the next record
+      self._discard_stream()
+      self.handleError(record)
+
+  def flush(self):
+    try:
+      logging.handlers.RotatingFileHandler.flush(self)
+    except OSError:
+      self._discard_stream()
+
+  def _discard_stream(self):
+    stream, self.stream = self.stream, None
+    if stream is not None:
+      try:
+        stream.close()
+      except OSError:
+        pass
+
+class BatchListener(logging.handlers.QueueListener):
+  """QueueListener that flushes its handlers once per batch: after `batch`
+  records, or when no record came for `flush_seconds`."""
+
+  def __init__(self, queue, handler, batch=500, flush_seconds=0.5, dropped=None):
+    logging.handlers.QueueListener.__init__(self, queue, handler)
+    self.batch = batch
+    self.flush_seconds = flush_seconds
+    # callable returning the records dropped since it was last called
+    self.dropped = dropped
+    self.pending = 0
+
+  def dequeue(self, block):
+    if self.pending:
+      try:
+        return self.queue.get(timeout=self.flush_seconds)
+      except queue.Empty:
+        self.flush()
+    return self.queue.get(block)
+
+  def handle(self, record):
+    logging.handlers.QueueListener.handle(self, record)
+    self.pending += 1
+    if self.pending >= self.batch:
+      self.flush()
+
+  def flush(self):
+    lost, total = self.dropped() if self.dropped is not None else (0, 0)
+    if lost:
+      logging.handlers.QueueListener.handle(self, logging.makeLogRecord({
+        'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+        'msg': 'dropped %d log records' % lost, 'dropped_total': total}))
+    for handler in self.handlers:
+      handler.flush()
+    self.pending = 0
+
+  def enqueue_sentinel(self):
+    # waits for room: stopping must not be lost to a full queue
+    self.queue.put(self._sentinel)
+
+  def stop(self):
+    logging.handlers.QueueListener.stop(self)
+    # the thread exits on the sentinel with the last batch unflushed
+    self.flush()
+
+class QueuedHandler(logging.handlers.QueueHandler):
+  """QueueHandler with a bounded queue that counts the records it drops,
+  and the BatchListener writing them to target."""
+
+  def __init__(self, target, queue_size=10000, batch=500, flush_seconds=0.5, level=logging.NOTSET):
+    logging.handlers.QueueHandler.__init__(self, queue.Queue(queue_size))
+    self.setLevel(level)
+    self.target = target
+    self.listener = BatchListener(self.queue, target, batch, flush_seconds, self._take_dropped)
+    # records lost to a full queue, in total and not yet reported in the log
+    self.dropped = 0
+    self._unreported = 0
+    self._drop_lock = threading.Lock()
+    self._pid = None
+
+  def enqueue(self, record):
+    if self._pid != os.getpid():
+      self._start()
+    try:
+      self.queue.put_nowait(record)
+    except queue.Full:
+      with self._drop_lock:
+        self.dropped += 1
+        self._unreported += 1
+
+  def _start(self):
+    # started on first use, and again in a process forked after that
+    with self._drop_lock:
+      if self._pid == os.getpid():
+        return
+      self._pid = os.getpid()
+      self.listener._thread = None
+      self.listener.start()
+
+  def _take_dropped(self):
+    with self._drop_lock:
+      unreported, self._unreported = self._unreported, 0
+      return unreported, self.dropped
+
+  def prepare(self, record):
+    # copy what the listener thread cannot look up later: the final message,
+    # the traceback text and the request the record was logged in
+    record = logging.makeLogRecord(vars(record))
+    record.msg, record.args = record.getMessage(), None
+    if record.exc_info:
+      record.exc_text = logging.Formatter().formatException(record.exc_info)
+      record.exc_info = None
+    if has_request_context() and 'request_id' in g:
+      record.request_id = g.request_id
+      if not hasattr(record, 'duration_ms'):
+        record.duration_ms = round((time.perf_counter() - g.request_started) * 1000, 3)
+    return record
+
+  def close(self):
+    """Write what is queued and stop the listener."""
+    if self._pid == os.getpid():
+      self.listener.stop()
+      self._pid = None
+    self.target.close()
+    logging.handlers.QueueHandler.close(self)
+
+class AppLog(object):
+
+  def __init__(self, app=None):
+    self.handler = None
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('LOG_FILE', 'error.log')
+    app.config.setdefault('LOG_LEVEL', 'INFO')
+    app.config.setdefault('LOG_MAX_BYTES', 10 * 1024 * 1024)
+    app.config.setdefault('LOG_BACKUPS', 5)
+    app.config.setdefault('LOG_QUEUE_SIZE', 10000)
+    app.config.setdefault('LOG_BATCH', 500)
+    app.config.setdefault('LOG_FLUSH_SECONDS', 0.5)
+    app.config.setdefault('LOG_REQUESTS', True)
+    app.extensions['applog'] = self
+    target = BatchFileHandler(app.config['LOG_FILE'], app.config['LOG_MAX_BYTES'], app.config['LOG_BACKUPS'])
+    self.handler = QueuedHandler(target, app.config['LOG_QUEUE_SIZE'], app.config['LOG_BATCH'],
+                                 app.config['LOG_FLUSH_SECONDS'], app.config['LOG_LEVEL'])
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+    app.logger.addHandler(self.handler)
+    self.logger = app.logger
+    self.log_requests = app.config['LOG_REQUESTS']
+    app.before_request(self._before_request)
+    app.after_request(self._after_request)
+    # write what is still queued when the process exits
+    atexit.register(self.close)
+
+  def _before_request(self):
+    g.request_id = request.headers.get('X-Request-Id') or uuid.uuid4().hex
+    g.request_started = time.perf_counter()
+
+  def _after_request(self, response):
+    if 'request_id' not in g:
+      return response
+    response.headers['X-Request-Id'] = g.request_id
+    if self.log_requests:
+      self.logger.info('%s %s %d', request.method, request.full_path.rstrip('?'), response.status_code,
+                       extra={'status': response.status_code,
+                              'duration_ms': round((time.perf_counter() - g.request_started) * 1000, 3)})
+    return response
+
+  def close(self):
+    if self.handler is not None:
+      self.handler.close()
@@ -0,0 +1,310 @@
+import threading
+from collections import namedtuple
+from bisect import bisect_left
+from datetime import timedelta
+
+from sqlalchemy import and_, event, exists, func, inspect, not_
+from sqlalchemy.orm import Session
+
+from models import db, Venue, Show
+from readmodels import read
+
+#----------------------------------------------------------------------------#
+# Venue availability.
+#
+# A venue hosts one show at a time: a show occupies [start_time, start_time +
+# duration). Bookings are checked against the database when a Show is
+# flushed, with the venue row locked, so double bookings are rejected however
+# the show was created. "Which venues are free between T1 and T2" is answered
+# per venue with an index range lookup on PostgreSQL (shows are found through
+# ix_Show_venue_id_start_time) and, on other databases, from per-venue
+# interval lists kept in process memory and updated from session events, in
+# O(log n) per venue.
+#----------------------------------------------------------------------------#
+
+DEFAULT_DURATION = 120
+MAX_DURATION = 24 * 60
+
+class DoubleBooking(Exception):
+
+  def __init__(self, venue_id, start, end):
+    Exception.__init__(self, 'Venue %s is already booked between %s and %s.' % (venue_id, start, end))
+    self.venue_id = venue_id
+    self.start = start
+    self.end = end
+
+def show_end(start, duration):
+  return start + timedelta(minutes=duration if duration is not None else DEFAULT_DURATION)
+
+def overlapping(connection, venue_ids, start, end):
+  # (id, venue_id, start_time, end) of shows of the venues overlapping
+  # [start, end); shows last at most MAX_DURATION, so only those starting
+  # after start - MAX_DURATION need a look
+  show = Show.__table__
+  rows = connection.execute(
+    show.select()
+    .with_only_columns([show.c.id, show.c.venue_id, show.c.start_time, show.c.duration])
+    .where(show.c.venue_id.in_(venue_ids))
+    .where(show.c.start_time > start - timedelta(minutes=MAX_DURATION))
+    .where(show.c.start_time < end))
+  return [(r.id, r.venue_id, r.start_time, show_end(r.start_time, r.duration))
+          for r in rows if show_end(r.start_time, r.duration) > start]
+
+def batch_conflicts(connection, rows):
+  """Positions of rows (dicts of venue_id, start_time and duration) that
+  overlap an existing show or an earlier row of the batch."""
+  rows = [(i, r['venue_id'], r['start_time'], show_end(r['start_time'], r.get('duration')))
+          for i, r in enumerate(rows)]
+  if not rows:
+    return set()
+  booked = {}
+  for id, venue_id, start, end in overlapping(connection, set(r[1] for r in rows),
+                                             min(r[2] for r in rows), max(r[3] for r in rows)):
+    booked.setdefault(venue_id, VenueSchedule()).add(id, start, end)
+  conflicts = set()
+  for i, venue_id, start, end in rows:
+    schedule = booked.setdefault(venue_id, VenueSchedule())
+    if schedule.busy(start, end):
+      conflicts.add(i)
+    else:
+      # negative keys keep batch rows apart from stored show ids
+      schedule.add(-1 - i, start, end)
+  return conflicts
+
+#----------------------------------------------------------------------------#
+# Interval index.
+#----------------------------------------------------------------------------#
+
+class VenueSchedule(object):
+  # shows of one venue sorted by (start, id); reach[i] is the latest end
+  # among the first i + 1, so "does anything overlap [t1, t2)" is one bisect
+
+  def __init__(self):
+    self.keys = []
+    self.ends = []
+    self.reach = []
+    self.starts = {}
+
+  def _reindex(self, i):
+    reach = self.reach[i - 1] if i else None
+    del self.reach[i:]
+    for end in self.ends[i:]:
+      reach = end if reach is None or end > reach else reach
+      self.reach.append(reach)
+
+  def add(self, id, start, end):
+    self.discard(id)
+    i = bisect_left(self.keys, (start, id))
+    self.keys.insert(i, (start, id))
+    self.ends.insert(i, end)
+    self.starts[id] = start
+    self._reindex(i)
+
+  def discard(self, id):
+    if id not in self.starts:
+      return
+    i = bisect_left(self.keys, (self.starts.pop(id), id))
+    del self.keys[i]
+    del self.ends[i]
+    self._reindex(i)
+
+  def busy(self, start, end):
+    # shows starting before end are keys[:i]; one of them overlaps if the
+    # latest of their ends is after start
+    i = bisect_left(self.keys, (end,))
+    return i > 0 and self.reach[i - 1] > start
+
+VENUE_COLUMNS = [Venue.id, Venue.name, Venue.city, Venue.state]
+VenueRow = namedtuple('VenueRow', ['id', 'name', 'city', 'state'])
+Booking = namedtuple('Booking', ['id', 'venue_id', 'start_time', 'duration'])
+
+class MemoryAvailability(object):
+
+  def __init__(self):
+    self.venues = None
+    self.lock = threading.Lock()
+
+  def load(self):
+    venues, schedules = {}, {}
+    self.by_city, self.by_state = {}, {}
+    for row in read(VenueRow, VENUE_COLUMNS).yield_per(1000):
+      venues[row.id] = (row.name, row.city, row.state)
+      self.by_city.setdefault(row.city, set()).add(row.id)
+      self.by_state.setdefault(row.state, set()).add(row.id)
+    query = read(Booking, [Show.id, Show.venue_id, Show.start_time, Show.duration]) \
+      .order_by(Show.venue_id, Show.start_time, Show.id)
+    for row in query.yield_per(1000):
+      schedule = schedules.get(row.venue_id)
+      if schedule is None:
+        schedule = schedules[row.venue_id] = VenueSchedule()
+      # rows arrive sorted, so appending keeps the lists ordered
+      end = show_end(row.start_time, row.duration)
+      schedule.keys.append((row.start_time, row.id))
+      schedule.ends.append(end)
+      schedule.reach.append(max(schedule.reach[-1], end) if schedule.reach else end)
+      schedule.starts[row.id] = row.start_time
+    self.schedules = schedules
+    self.show_venues = dict((id, v) for v, s in schedules.items() for id in s.starts)
+    self.venues = venues
+
+  def free_venues(self, start, end, city=None, state=None):
+    with self.lock:
+      if self.venues is None:
+        self.load()
+      if city:
+        candidates = self.by_city.get(city, ())
+      elif state:
+        candidates = self.by_state.get(state, ())
+      else:
+        candidates = self.venues
+      free = []
+      for id in candidates:
+        name, venue_city, venue_state = self.venues[id]
+        if state and venue_state != state:
+          continue
+        schedule = self.schedules.get(id)
+        if schedule is None or not schedule.busy(start, end):
+          free.append((id, name, venue_city, venue_state))
+    return sorted(free, key=lambda v: (v[1] or '', v[0]))
+
+  def apply(self, changes):
+    with self.lock:
+      if self.venues is None:
+        return
+      for op, args in changes:
+        if op == 'show':
+          id, venue_id, start, end = args
+          self.discard_show(id)
+          self.schedules.setdefault(venue_id, VenueSchedule()).add(id, start, end)
+          self.show_venues[id] = venue_id
+        elif op == 'unshow':
+          self.discard_show(args)
+        elif op == 'venue':
+          self.discard_venue(args[0])
+          id, name, city, state = args
+          self.venues[id] = (name, city, state)
+          self.by_city.setdefault(city, set()).add(id)
+          self.by_state.setdefault(state, set()).add(id)
+        elif op == 'unvenue':
+          self.discard_venue(args)
+          # its shows were deleted with it, not necessarily one by one
+          for show_id in self.schedules.pop(args, VenueSchedule()).starts:
+            self.show_venues.pop(show_id, None)
+        else:
+          self.venues = None
+          return
+
+  def discard_show(self, id):
+    venue_id = self.show_venues.pop(id, None)
+    if venue_id in self.schedules:
+      self.schedules[venue_id].discard(id)
+
+  def discard_venue(self, id):
+    if id in self.venues:
+      name, city, state = self.venues.pop(id)
+      self.by_city[city].discard(id)
+      self.by_state[state].discard(id)
+
+  def invalidate(self):
+    with self.lock:
+      self.venues = None
+
+class SqlAvailability(object):
+
+  def free_venues(self, start, end, city=None, state=None):
+    busy = exists().where(and_(
+      Show.venue_id == Venue.id,
+      Show.start_time > start - timedelta(minutes=MAX_DURATION),
+      Show.start_time < end,
+      Show.start_time + func.make_interval(0, 0, 0, 0, 0, Show.duration) > start))
+    query = read(VenueRow, VENUE_COLUMNS).filter(not_(busy))
+    if city:
+      query = query.filter(Venue.city == city)
+    if state:
+      query = query.filter(Venue.state == state)
+    return list(query.order_by(Venue.name, Venue.id))
+
+_memory = {}
+
+def availability():
+  if db.engine.dialect.name == 'postgresql':
+    return SqlAvailability()
+  key = str(db.engine.url)
+  if key not in _memory:
+    _memory[key] = MemoryAvailability()
+  return _memory[key]
+
+def free_venues(start, end, city=None, state=None):
+  # [(id, name, city, state)] of venues with no show overlapping [start, end)
+  return availability().free_venues(start, end, city, state)
+
+def invalidate():
+  # drop in-process indexes after writes that bypass the ORM (bulk loads)
+  for a in _memory.values():
+    a.invalidate()
+
+#----------------------------------------------------------------------------#
+# Booking checks and index maintenance.
+#----------------------------------------------------------------------------#
+
+def _booking_changed(session, show):
+  if show in session.new:
+    return True
+  state = inspect(show)
+  return any(state.attrs[a].history.has_changes() for a in ('venue_id', 'start_time', 'duration'))
+
+@event.listens_for(Session, 'before_flush')
+def _check_bookings(session, flush_context, instances):
+  shows = [s for s in session.new | session.dirty
+           if isinstance(s, Show) and s not in session.deleted and _booking_changed(session, s)]
+  if not shows:
+    return
+  connection = session.connection()
+  pending = {}
+  with session.no_autoflush:
+    for show in sorted(shows, key=lambda s: (int(s.venue_id), s.start_time)):
+      venue_id = int(show.venue_id)
+      start, end = show.start_time, show_end(show.start_time, show.duration)
+      if venue_id not in pending:
+        # serialize bookings of one venue (a no-op on SQLite, whose writers
+        # are serialized anyway)
+        session.query(Venue.id).filter(Venue.id == venue_id).with_for_update().first()
+        pending[venue_id] = VenueSchedule()
+      taken = [r for r in overlapping(connection, [venue_id], start, end) if r[0] != show.id]
+      if taken or pending[venue_id].busy(start, end):
+        raise DoubleBooking(venue_id, start, end)
+      pending[venue_id].add(id(show), start, end)
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+  changes = session.info.setdefault('availability_changes', [])
+  for obj in session.new | session.dirty:
+    if isinstance(obj, Show):
+      # form input may have set venue_id as a string
+      changes.append(('show', (obj.id, int(obj.venue_id), obj.start_time, show_end(obj.start_time, obj.duration))))
+    elif isinstance(obj, Venue):
+      changes.append(('venue', (obj.id, obj.name, obj.city, obj.state)))
+  for obj in session.deleted:
+    if isinstance(obj, Show):
+      changes.append(('unshow', obj.id))
+    elif isinstance(obj, Venue):
+      changes.append(('unvenue', obj.id))
+
+@event.listens_for(Session, 'after_bulk_delete')
+@event.listens_for(Session, 'after_bulk_update')
+def _collect_bulk_changes(context):
+  if context.primary_table in (Show.__table__, Venue.__table__):
+    context.session.info.setdefault('availability_changes', []).append(('reset', None))
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+  changes = session.info.pop('availability_changes', None)
+  if not changes or session.bind is None:
+    return
+  a = _memory.get(str(session.bind.url))
+  if a is not None:
+    a.apply(changes)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+  session.info.pop('availability_changes', None)
@@ -0,0 +1,57 @@
+"""Cost of the `datetime` template filter over a large /shows page.
+
+Formats the start times of 100k synthetic show rows twice: with the filter
+as it used to be (strftime to a string, dateutil parse, babel pattern built
+per call) and with formatting.format_datetime on the datetime itself. Both
+must produce the same text.
+
+    python benchmarks/datetime_filter.py [rows]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formatting import format_datetime
+
+ROWS = 100000
+
+
+def legacy_format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+
+def timed(label, rows, fn):
+  started = time.perf_counter()
+  out = [fn(r) for r in rows]
+  seconds = time.perf_counter() - started
+  print('%-8s %8.2fs %10.1f us/row' % (label, seconds, seconds / len(rows) * 1e6))
+  return out, seconds
+
+
+def main():
+  rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+  random.seed(10)
+  now = datetime.now().replace(microsecond=0)
+  times = [now + timedelta(minutes=random.randint(-525600, 525600)) for _ in range(rows)]
+  print('%d show rows' % rows)
+  old, old_seconds = timed('legacy', times,
+                           lambda t: legacy_format_datetime(t.strftime("%Y-%m-%d %H:%M:%S"), 'full'))
+  new, new_seconds = timed('cached', times, lambda t: format_datetime(t, 'full'))
+  assert old == new, 'formatted output differs'
+  print('speedup  %8.1fx' % (old_seconds / new_seconds))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,67 @@
+"""Query count of the /venues directory as the catalog grows.
+
+Seeds a throwaway SQLite database at increasing sizes and renders /venues
+through the test client, counting the SQL statements issued per request.
+The count should stay the same at every size.
+
+    python benchmarks/directory_queries.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'directory.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DB_PATH
+
+from sqlalchemy import event
+
+from app import app
+from models import db, Venue, Artist, Show
+import counters
+
+SIZES = [(10, 100), (100, 1000), (1000, 10000), (5000, 50000)]
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Chicago', 'IL'), ('Seattle', 'WA')]
+
+
+def seed(num_venues, num_shows):
+  db.drop_all()
+  db.create_all()
+  now = datetime.now()
+  db.session.execute(Venue.__table__.insert(), [
+    {"name": "Venue %d" % i, "city": c, "state": s}
+    for i, (c, s) in enumerate(random.choice(CITIES) for _ in range(num_venues))])
+  db.session.execute(Artist.__table__.insert(), [
+    {"name": "Artist %d" % i} for i in range(num_venues)])
+  db.session.execute(Show.__table__.insert(), [
+    {"venue_id": random.randint(1, num_venues),
+     "artist_id": random.randint(1, num_venues),
+     "start_time": now + timedelta(days=random.randint(-365, 365))}
+    for _ in range(num_shows)])
+  counters.refresh_all(db.session.connection())
+  db.session.commit()
+
+
+def main():
+  statements = []
+  client = app.test_client()
+  with app.app_context():
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    print('%8s %8s %8s %10s' % ('venues', 'shows', 'queries', 'ms'))
+    for num_venues, num_shows in SIZES:
+      seed(num_venues, num_shows)
+      db.session.remove()
+      del statements[:]
+      started = time.perf_counter()
+      response = client.get('/venues')
+      elapsed = (time.perf_counter() - started) * 1000
+      assert response.status_code == 200
+      print('%8d %8d %8d %10.1f' % (num_venues, num_shows, len(statements), elapsed))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,108 @@
+"""ORM instances versus read models on the rows behind the listing pages.
+
+Seeds a throwaway SQLite database and reads the same rows three ways: whole
+ORM instances through Query.all(), an ORM column query (the previous show
+listing path), and the Core read models of readmodels.py. Reports CPU per
+row and the peak memory allocated while reading, and checks that all three
+yield the same values.
+
+    python benchmarks/read_models.py [--venues N] [--artists N] [--shows N]
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'read_models.db')
+
+from app import app
+from models import db, Venue, Artist, Show
+from projections import SHOW_COLUMNS, show_query
+from readmodels import names
+import seeding
+
+ROUNDS = 5
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--venues', type=int, default=2000)
+  parser.add_argument('--artists', type=int, default=4000)
+  parser.add_argument('--shows', type=int, default=100000)
+  return parser.parse_args()
+
+
+def measure(fn):
+  # (seconds of the best round, peak bytes allocated by one round, rows)
+  best = None
+  for _ in range(ROUNDS):
+    db.session.expunge_all()
+    gc.collect()
+    started = time.perf_counter()
+    rows = fn()
+    elapsed = time.perf_counter() - started
+    best = elapsed if best is None else min(best, elapsed)
+    del rows
+  db.session.expunge_all()
+  gc.collect()
+  tracemalloc.start()
+  rows = fn()
+  allocated = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return best, allocated, rows
+
+
+def orm_shows():
+  return [(s.id, s.start_time, s.artist_id, s.artist.name, s.artist.image_link,
+           s.venue_id, s.venue.name, s.venue.image_link)
+          for s in Show.query.order_by(Show.start_time, Show.id)
+                  .options(db.joinedload(Show.artist), db.joinedload(Show.venue)).all()]
+
+
+def column_query_shows():
+  return db.session.query(*SHOW_COLUMNS) \
+    .join(Artist, Show.artist_id == Artist.id) \
+    .join(Venue, Show.venue_id == Venue.id) \
+    .order_by(Show.start_time, Show.id).all()
+
+
+CASES = [
+  ('artists', [
+    ('orm', lambda: [(a.id, a.name) for a in Artist.query.order_by(Artist.id).all()]),
+    ('read model', lambda: names(Artist).order_by(Artist.id).all()),
+  ]),
+  ('shows', [
+    ('orm', orm_shows),
+    ('orm columns', column_query_shows),
+    ('read model', lambda: show_query().all()),
+  ]),
+]
+
+
+def main():
+  args = parse_args()
+  with app.app_context():
+    db.create_all()
+    seeding.seed(args.venues, args.artists, args.shows, random_seed=17)
+    print('%-8s %-12s %8s %12s %12s %10s' % ('rows', 'path', 'count', 'us/row', 'bytes/row', 'vs orm'))
+    for name, paths in CASES:
+      baseline, expected = None, None
+      for label, fn in paths:
+        seconds, allocated, rows = measure(fn)
+        values = [tuple(r) for r in rows]
+        if expected is None:
+          expected, baseline = values, seconds
+        assert values == expected, '%s %s rows differ' % (name, label)
+        print('%-8s %-12s %8d %12.2f %12.1f %9.1fx' % (
+          name, label, len(rows), seconds / len(rows) * 1e6, allocated / float(len(rows)), baseline / seconds))
+        del rows
+      db.session.remove()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,143 @@
+"""Latency, query count and memory of every Fyyur route at a given scale.
+
+Seeds a throwaway SQLite database with seeding.seed (or uses DATABASE_URL
+as it is with --no-seed) and drives each route through the test client,
+reporting p50/p99 latency, SQL statements per request and the peak memory
+allocated while rendering. --json writes the results for comparing runs.
+
+    python benchmarks/routes.py --venues 2000 --artists 4000 --shows 200000 --json run.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--venues', type=int, default=1000)
+  parser.add_argument('--artists', type=int, default=2000)
+  parser.add_argument('--shows', type=int, default=50000)
+  parser.add_argument('--past', type=float, default=0.8)
+  parser.add_argument('--skew', type=float, default=1.1)
+  parser.add_argument('--requests', type=int, default=50, help='requests per route')
+  parser.add_argument('--seed', type=int, default=11)
+  parser.add_argument('--no-seed', action='store_true', help='benchmark DATABASE_URL as it is')
+  parser.add_argument('--json', metavar='PATH', help='write results as JSON')
+  return parser.parse_args()
+
+
+def percentile(values, p):
+  # nearest-rank percentile of a non-empty list
+  values = sorted(values)
+  return values[max(0, min(len(values) - 1, int(round(p / 100.0 * len(values) + 0.5)) - 1))]
+
+
+def routes(rng, venue_ids, artist_ids):
+  # (name, method, url factory, form data factory)
+  term = lambda: rng.choice(['blue', 'hall', 'jazz', 'mid', 'new york', 'velvet band', 'x'])
+  return [
+    ('home', 'get', lambda: '/', None),
+    ('venues', 'get', lambda: '/venues', None),
+    ('venues?genre', 'get', lambda: '/venues?genre=Jazz', None),
+    ('venues?facets', 'get', lambda: '/venues?state=CA&genre=Jazz&has_upcoming=true', None),
+    ('venue', 'get', lambda: '/venues/%d' % rng.choice(venue_ids), None),
+    ('venue/edit', 'get', lambda: '/venues/%d/edit' % rng.choice(venue_ids), None),
+    ('venues/search', 'post', lambda: '/venues/search', lambda: {'search_term': term()}),
+    ('artists', 'get', lambda: '/artists', None),
+    ('artists?facets', 'get', lambda: '/artists?state=NY&seeking_venue=true', None),
+    ('artist', 'get', lambda: '/artists/%d' % rng.choice(artist_ids), None),
+    ('artist/edit', 'get', lambda: '/artists/%d/edit' % rng.choice(artist_ids), None),
+    ('artists/search', 'post', lambda: '/artists/search', lambda: {'search_term': term()}),
+    ('shows', 'get', lambda: '/shows', None),
+  ]
+
+
+def run(client, statements, method, url, data):
+  del statements[:]
+  started = time.perf_counter()
+  response = getattr(client, method)(url(), data=data() if data else None)
+  elapsed = time.perf_counter() - started
+  assert response.status_code == 200, '%s %s: %d' % (method.upper(), url(), response.status_code)
+  return elapsed, len(statements)
+
+
+def main():
+  args = parse_args()
+  if not args.no_seed:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'routes.db')
+
+  from sqlalchemy import event
+
+  from app import app
+  from models import db, Venue, Artist
+  import seeding
+
+  statements = []
+  client = app.test_client()
+  with app.app_context():
+    if not args.no_seed:
+      db.create_all()
+      started = time.perf_counter()
+      seeding.seed(args.venues, args.artists, args.shows, args.past, args.skew, random_seed=args.seed)
+      print('seeded in %.1fs' % (time.perf_counter() - started))
+    venue_ids = [r[0] for r in db.session.query(Venue.id)]
+    artist_ids = [r[0] for r in db.session.query(Artist.id)]
+    dialect = db.engine.dialect.name
+    db.session.remove()
+    event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+
+  rng = random.Random(args.seed)
+  results = []
+  print('%-16s %9s %9s %8s %8s %10s' % ('route', 'p50 ms', 'p99 ms', 'queries', 'max q', 'peak KiB'))
+  for name, method, url, data in routes(rng, venue_ids, artist_ids):
+    # warm up caches (search index, compiled patterns) before timing
+    run(client, statements, method, url, data)
+    timings, queries = [], []
+    for _ in range(args.requests):
+      elapsed, count = run(client, statements, method, url, data)
+      timings.append(elapsed * 1000)
+      queries.append(count)
+    # memory is measured on a separate request, tracing slows everything down
+    tracemalloc.start()
+    run(client, statements, method, url, data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = {
+      'route': name,
+      'p50_ms': round(percentile(timings, 50), 3),
+      'p99_ms': round(percentile(timings, 99), 3),
+      'mean_queries': round(sum(queries) / float(len(queries)), 2),
+      'max_queries': max(queries),
+      'peak_kib': round(peak / 1024.0, 1),
+    }
+    results.append(result)
+    print('%-16s %9.2f %9.2f %8.1f %8d %10.1f' % (
+      name, result['p50_ms'], result['p99_ms'], result['mean_queries'], result['max_queries'], result['peak_kib']))
+
+  if args.json:
+    with open(args.json, 'w') as f:
+      json.dump({
+        'created': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'database': dialect,
+        'scale': {'venues': len(venue_ids), 'artists': len(artist_ids),
+                  'shows': None if args.no_seed else args.shows,
+                  'past': args.past, 'skew': args.skew},
+        'requests_per_route': args.requests,
+        'routes': results,
+      }, f, indent=2)
+    print('wrote %s' % args.json)
+
+
+if __name__ == '__main__':
+  main()
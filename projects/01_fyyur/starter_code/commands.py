@@ -0,0 +1,122 @@
+import time
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+
+from models import db
+import counters
+import importer
+import export
+import seeding
+import schedule
+import recommendations
+
+#----------------------------------------------------------------------------#
+# Commands.
+#
+# Registered on the app as the "fyyur" group, e.g. `flask fyyur roll-shows`.
+#----------------------------------------------------------------------------#
+
+fyyur_cli = AppGroup('fyyur', help='Fyyur maintenance commands.')
+
+@fyyur_cli.command('roll-shows')
+@click.option('--every', type=int, default=0,
+              help='Keep running and roll forward every N seconds.')
+def roll_shows(every):
+  """Move shows that have started from upcoming to past counters."""
+  while True:
+    with db.engine.begin() as connection:
+      venues, artists = counters.roll_forward(connection)
+    click.echo('Rolled forward %d venues and %d artists.' % (venues, artists))
+    if not every:
+      break
+    time.sleep(every)
+
+@fyyur_cli.command('refresh-counters')
+def refresh_counters():
+  """Recompute every venue and artist show counter."""
+  with db.engine.begin() as connection:
+    counters.refresh_all(connection)
+  click.echo('Show counters refreshed.')
+
+@fyyur_cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(importer.KINDS)))
+@click.argument('source', type=click.File('r'))
+@click.option('--format', 'fmt', type=click.Choice(sorted(importer.READERS)),
+              help='Input format; taken from the file extension by default.')
+@click.option('--batch-size', type=int, default=importer.BATCH_SIZE, show_default=True)
+@click.option('--show-errors', type=int, default=20, show_default=True,
+              help='Number of rejected records to print.')
+def import_(kind, source, fmt, batch_size, show_errors):
+  """Bulk load venues, artists or shows from a CSV or NDJSON file.
+
+  Records are checked with the same rules as the create forms. Shows may
+  reference artists and venues by artist_id/venue_id or by
+  artist_name/venue_name.
+  """
+  if fmt is None:
+    fmt = 'ndjson' if source.name.endswith(('.ndjson', '.jsonl')) else 'csv'
+  records = importer.READERS[fmt](source)
+
+  def progress(loaded, rejected, seconds):
+    click.echo('%d loaded, %d rejected (%.0f records/s)' % (
+      loaded, rejected, (loaded + rejected) / seconds if seconds else 0), err=True)
+
+  loaded, rejected, seconds = importer.import_records(kind, records, batch_size, progress)
+  for number, errors in rejected[:show_errors]:
+    click.echo('record %d: %s' % (number, errors), err=True)
+  click.echo('Imported %d %s in %.1fs (%.0f records/s), %d rejected.' % (
+    loaded, kind, seconds, (loaded + len(rejected)) / seconds if seconds else 0, len(rejected)))
+
+@fyyur_cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(export.KINDS)))
+@click.option('--format', 'fmt', type=click.Choice(sorted(export.FORMATS)), default='ndjson', show_default=True)
+@click.option('--updated-since', type=click.DateTime(),
+              help='Only rows changed at or after this UTC time.')
+@click.option('-o', '--output', type=click.File('w'), default='-',
+              help='File to write; standard output by default.')
+def export_(kind, fmt, updated_since, output):
+  """Stream the venue, artist or show catalog as NDJSON or CSV."""
+  for chunk in export.serialize(kind, fmt, updated_since):
+    output.write(chunk)
+
+@fyyur_cli.command('seed')
+@click.option('--venues', type=int, default=1000, show_default=True)
+@click.option('--artists', type=int, default=2000, show_default=True)
+@click.option('--shows', type=int, default=50000, show_default=True)
+@click.option('--past', type=float, default=0.8, show_default=True,
+              help='Share of shows that already happened.')
+@click.option('--skew', type=float, default=1.1, show_default=True,
+              help='Zipf exponent of venue and artist popularity; 0 is uniform.')
+@click.option('--seed', 'random_seed', type=int, help='Random seed, for repeatable data.')
+def seed(venues, artists, shows, past, skew, random_seed):
+  """Add synthetic venues, artists and shows for load testing."""
+  started = time.perf_counter()
+  counts = seeding.seed(venues, artists, shows, past, skew, random_seed=random_seed)
+  click.echo('Added %d venues, %d artists and %d shows in %.1fs.' % (counts + (time.perf_counter() - started,)))
+
+@fyyur_cli.command('partitions')
+@click.option('--ahead', type=int, default=12, show_default=True,
+              help='Months after the current one to cover.')
+@click.option('--since', type=click.DateTime(),
+              help='Also split earlier months out of the default partition.')
+def partitions(ahead, since):
+  """Create monthly Show partitions ahead of time (PostgreSQL)."""
+  with db.engine.begin() as connection:
+    if not schedule.is_partitioned(connection):
+      click.echo('Show is not partitioned; nothing to do.')
+      return
+    now = schedule.month_start(datetime.now())
+    created = schedule.create_partitions(connection, since or now, schedule.add_months(now, ahead))
+  click.echo('Created %d partitions%s' % (len(created), (': ' + ', '.join(created)) if created else '.'))
+
+@fyyur_cli.command('recommend')
+@click.option('--full', is_flag=True, help='Rebuild every list instead of those new shows can change.')
+@click.option('--top-k', type=int, default=recommendations.TOP_K, show_default=True,
+              help='Similar artists or venues kept per artist or venue.')
+def recommend(full, top_k):
+  """Update the similar artists and venues lists."""
+  started = time.perf_counter()
+  counts = recommendations.build(full=full, top_k=top_k)
+  click.echo('Updated %d artists and %d venues in %.1fs.' % (counts + (time.perf_counter() - started,)))
@@ -7,4 +7,31 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 DEBUG = True
 
 # Connect to the database
-SQLALCHEMY_DATABASE_URI = 'postgres://prashantraghuvanshi@localhost:5432/fyyurdb'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgres://prashantraghuvanshi@localhost:5432/fyyurdb')
+
+# Read replicas: DATABASE_REPLICA_URLS is a comma separated list of database
+# URLs that GET requests read from (see routing.py). After a write, a client
+# reads from the primary for REPLICA_STICKY_SECONDS.
+SQLALCHEMY_BINDS = dict(('replica%d' % i, url) for i, url in enumerate(
+  u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()))
+SQLALCHEMY_REPLICA_BINDS = sorted(SQLALCHEMY_BINDS)
+REPLICA_STICKY_SECONDS = 10
+
+# Rendered venue and artist pages: 'lru' keeps them in process memory,
+# 'filesystem' in PAGE_CACHE_DIR (instance/pages by default, shareable by
+# several processes), an empty value turns caching off
+PAGE_CACHE = os.environ.get('PAGE_CACHE', 'lru') or None
+
+# Rows per page on paginated listings and search results (?per_page= may ask
+# for up to MAX_PAGE_SIZE)
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Per-request SQL counts: X-Query-* response headers follow DEBUG, and the
+# last requests are listed at this URL (None to disable)
+QUERYCOUNT_ENDPOINT = '/_debug/queries' if DEBUG else None
+
+# Outside debug mode the app log is written as JSON lines to LOG_FILE by a
+# background thread, rotated at LOG_MAX_BYTES (see applog.py for the rest)
+LOG_FILE = 'error.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024
@@ -0,0 +1,70 @@
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import app
+from models import db, Venue, Artist, Show, Genre, venue_genres, artist_genres
+import counters
+import pagecache
+import recommendations
+
+NUM_VENUES = 300
+NUM_ARTISTS = 600
+NUM_SHOWS = 6000
+GENRES = ['Jazz', 'Reggae', 'Swing', 'Classical', 'Folk', 'Rock n Roll', 'Hip-Hop', 'Blues']
+
+
+def seed():
+    random.seed(6)
+    now = datetime.now()
+    db.drop_all()
+    db.create_all()
+    db.session.execute(Genre.__table__.insert(), [{'name': g} for g in GENRES])
+    db.session.execute(Venue.__table__.insert(), [
+        {'name': 'Venue %d' % i, 'city': 'City %d' % (i % 20), 'state': 'CA'}
+        for i in range(NUM_VENUES)])
+    db.session.execute(Artist.__table__.insert(), [
+        {'name': 'Artist %d' % i, 'city': 'City %d' % (i % 20), 'state': 'CA'}
+        for i in range(NUM_ARTISTS)])
+    db.session.execute(venue_genres.insert(), [
+        {'venue_id': i, 'genre_id': g}
+        for i in range(1, NUM_VENUES + 1) for g in random.sample(range(1, len(GENRES) + 1), 2)])
+    db.session.execute(artist_genres.insert(), [
+        {'artist_id': i, 'genre_id': g}
+        for i in range(1, NUM_ARTISTS + 1) for g in random.sample(range(1, len(GENRES) + 1), 2)])
+    db.session.execute(Show.__table__.insert(), [
+        {'venue_id': random.randint(1, NUM_VENUES),
+         'artist_id': random.randint(1, NUM_ARTISTS),
+         'start_time': now + timedelta(hours=random.randint(-24 * 365, 24 * 365))}
+        for _ in range(NUM_SHOWS)])
+    counters.refresh_all(db.session.connection())
+    db.session.commit()
+    recommendations.build(full=True)
+    pagecache.clear()
+    db.session.execute('ANALYZE')
+    db.session.commit()
+
+
+@pytest.fixture(scope='session', autouse=True)
+def database(tmp_path_factory):
+    """The scratch database of the suite: TEST_DATABASE_URL may point at a
+    PostgreSQL database, otherwise a temporary SQLite file is used."""
+    scratch = tmp_path_factory.mktemp('fyyur')
+    url = os.environ.get('TEST_DATABASE_URL') or 'sqlite:///' + str(scratch / 'test.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['PAGE_CACHE_STAMP'] = str(scratch / 'pagecache.stamp')
+    return url
+
+
+@pytest.fixture(scope='class')
+def seeded(database):
+    """Reseeds the database for a test class and keeps an app context pushed
+    while it runs."""
+    ctx = app.app_context()
+    ctx.push()
+    seed()
+    yield
+    db.session.remove()
+    ctx.pop()
@@ -0,0 +1,163 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, bindparam, case, event, func, select
+
+from models import Venue, Artist, Show
+from history import keep_previous, previous
+import facets
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#
+# Venue and Artist carry upcoming_shows_count, past_shows_count and
+# next_show_at so listing pages read a column instead of counting shows.
+# A Show inserted, moved or deleted through the ORM (or loaded by the
+# importer) adjusts the counters in the same transaction with relative
+# updates (upcoming_shows_count + 1), so concurrent bookings of one venue or
+# artist add up instead of overwriting each other's recount; roll_forward()
+# recounts the venues and artists whose next show has started. Both keep the
+# facet counts (see facets.py) in step.
+#----------------------------------------------------------------------------#
+
+shows = Show.__table__
+
+def counter_values(key, owner, now):
+  # correlated subqueries recomputing the counters of one Venue/Artist row;
+  # updated_at is kept as is since counters are derived data
+  upcoming = (key == owner.c.id) & (shows.c.start_time >= now)
+  past = (key == owner.c.id) & (shows.c.start_time < now)
+  return {
+    'updated_at': owner.c.updated_at,
+    'upcoming_shows_count': select([func.count()]).where(upcoming).as_scalar(),
+    'past_shows_count': select([func.count()]).where(past).as_scalar(),
+    'next_show_at': select([func.min(shows.c.start_time)]).where(upcoming).as_scalar(),
+  }
+
+def refresh_show_counters(connection, venue_ids=(), artist_ids=(), now=None):
+  now = now or datetime.now()
+  for owner, key, ids in ((Venue.__table__, shows.c.venue_id, venue_ids),
+                          (Artist.__table__, shows.c.artist_id, artist_ids)):
+    ids = sorted(set(i for i in ids if i is not None))
+    if ids:
+      connection.execute(owner.update()
+                         .where(owner.c.id.in_(ids))
+                         .values(**counter_values(key, owner, now)))
+
+def _owner_deltas(shows_changed, index, now, sign, deltas):
+  # deltas: owner id -> [upcoming, past, earliest added upcoming start,
+  # earliest removed upcoming start]
+  for show in shows_changed:
+    start = show[2]
+    if show[index] is None or start is None:
+      continue
+    delta = deltas.setdefault(show[index], [0, 0, None, None])
+    slot = 2 if sign > 0 else 3
+    if start >= now:
+      delta[0] += sign
+      if delta[slot] is None or start < delta[slot]:
+        delta[slot] = start
+    else:
+      delta[1] += sign
+
+def apply_show_changes(connection, removed=(), added=(), now=None):
+  """Adjust the counters for shows, as (venue_id, artist_id, start_time),
+  already deleted from or inserted into Show in this transaction."""
+  now = now or datetime.now()
+  for index, (owner, key) in enumerate(((Venue.__table__, shows.c.venue_id),
+                                        (Artist.__table__, shows.c.artist_id))):
+    deltas = {}
+    _owner_deltas(removed, index, now, -1, deltas)
+    _owner_deltas(added, index, now, 1, deltas)
+    if not deltas:
+      continue
+    # the next show only needs a lookup when it is the one removed (the
+    # lookup already sees the added shows); otherwise the earliest wins
+    kept = case([(owner.c.next_show_at == bindparam('removed_next', type_=DateTime),
+                  select([func.min(shows.c.start_time)])
+                  .where((key == owner.c.id) & (shows.c.start_time >= now)).as_scalar())],
+                else_=owner.c.next_show_at)
+    added_next = bindparam('added_next', type_=DateTime)
+    connection.execute(owner.update().where(owner.c.id == bindparam('owner_id')).values(
+      updated_at=owner.c.updated_at,
+      upcoming_shows_count=owner.c.upcoming_shows_count + bindparam('upcoming'),
+      past_shows_count=owner.c.past_shows_count + bindparam('past'),
+      next_show_at=case([(added_next == None, kept), (kept == None, added_next), (kept > added_next, added_next)],
+                        else_=kept)), [
+        {'owner_id': id, 'upcoming': u, 'past': p, 'added_next': a, 'removed_next': r}
+        for id, (u, p, a, r) in sorted(deltas.items())])
+
+def delete_venue_shows(connection, venue_id, now=None):
+  """Delete the shows of a venue that is being deleted in one statement, and
+  adjust the counters and facet groups of their artists once; returns the
+  artist ids."""
+  removed = connection.execute(select([shows.c.artist_id, shows.c.start_time])
+                               .where(shows.c.venue_id == venue_id)).fetchall()
+  connection.execute(shows.delete().where(shows.c.venue_id == venue_id))
+  # the venue's own counters go with its row
+  apply_show_changes(connection, removed=[(None, artist_id, start) for artist_id, start in removed], now=now)
+  artist_ids = sorted(set(artist_id for artist_id, start in removed))
+  facets.refresh_owners(connection, Artist, artist_ids)
+  return artist_ids
+
+def roll_forward(connection, now=None):
+  # refresh every venue and artist whose next show has started; returns the
+  # number of (venues, artists) updated
+  now = now or datetime.now()
+  due = []
+  for owner in (Venue.__table__, Artist.__table__):
+    due.append([r.id for r in connection.execute(
+      select([owner.c.id]).where(owner.c.next_show_at <= now))])
+  refresh_show_counters(connection, due[0], due[1], now)
+  # some of them no longer have upcoming shows
+  facets.refresh_owners(connection, Venue, due[0])
+  facets.refresh_owners(connection, Artist, due[1])
+  return len(due[0]), len(due[1])
+
+def refresh_all(connection, now=None):
+  # recompute every counter in one pass over Show, e.g. after loading shows
+  # outside the ORM
+  now = now or datetime.now()
+  upcoming = shows.c.start_time >= now
+  for owner, key in ((Venue.__table__, shows.c.venue_id), (Artist.__table__, shows.c.artist_id)):
+    totals = connection.execute(select([
+        key,
+        func.sum(case([(upcoming, 1)], else_=0)),
+        func.sum(case([(upcoming, 0)], else_=1)),
+        func.min(case([(upcoming, shows.c.start_time)]))]).group_by(key)).fetchall()
+    connection.execute(owner.update().values(
+      upcoming_shows_count=0, past_shows_count=0, next_show_at=None, updated_at=owner.c.updated_at))
+    if totals:
+      connection.execute(owner.update().where(owner.c.id == bindparam('owner_id')).values(
+        updated_at=owner.c.updated_at,
+        upcoming_shows_count=bindparam('upcoming'),
+        past_shows_count=bindparam('past'),
+        next_show_at=bindparam('next_show')), [
+          {'owner_id': k, 'upcoming': u, 'past': p, 'next_show': n} for k, u, p, n in totals])
+  facets.refresh_all(connection)
+
+#----------------------------------------------------------------------------#
+# ORM hooks.
+#----------------------------------------------------------------------------#
+
+def _row(venue_id, artist_id, start_time):
+  # form input may have set the ids as strings
+  return (int(venue_id) if venue_id is not None else None,
+          int(artist_id) if artist_id is not None else None, start_time)
+
+# the owner and start time a show moved away from
+keep_previous(Show.venue_id, Show.artist_id, Show.start_time)
+
+@event.listens_for(Show, 'after_insert')
+def _show_inserted(mapper, connection, target):
+  apply_show_changes(connection, added=[_row(target.venue_id, target.artist_id, target.start_time)])
+
+@event.listens_for(Show, 'after_delete')
+def _show_deleted(mapper, connection, target):
+  apply_show_changes(connection, removed=[_row(target.venue_id, target.artist_id, target.start_time)])
+
+@event.listens_for(Show, 'after_update')
+def _show_updated(mapper, connection, target):
+  before = _row(*(previous(target, a) for a in ('venue_id', 'artist_id', 'start_time')))
+  current = _row(target.venue_id, target.artist_id, target.start_time)
+  if before != current:
+    apply_show_changes(connection, removed=[before], added=[current])
@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, Venue, Artist, Show, Genre
+from projections import GENRE_LINKS
+
+#----------------------------------------------------------------------------#
+# Catalog export.
+#
+# Venues, artists and shows are streamed as NDJSON or CSV, oldest change
+# first. Rows are read through a server-side cursor (yield_per) and
+# serialized one at a time, so memory use does not depend on table size.
+# With updated_since only rows changed at or after that UTC time are sent;
+# deletions are not reported.
+#----------------------------------------------------------------------------#
+
+CHUNK_SIZE = 1000
+
+KINDS = {
+  'venues': (Venue, ['id', 'name', 'city', 'state', 'address', 'phone', 'image_link',
+                     'facebook_link', 'website', 'seeking_talent', 'seeking_description',
+                     'genres', 'updated_at']),
+  'artists': (Artist, ['id', 'name', 'city', 'state', 'phone', 'image_link',
+                       'facebook_link', 'website', 'seeking_venue', 'seeking_description',
+                       'genres', 'updated_at']),
+  'shows': (Show, ['id', 'artist_id', 'venue_id', 'start_time', 'duration', 'updated_at']),
+}
+
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+def records(kind, updated_since=None):
+  # yields one dict per row
+  model, fields = KINDS[kind]
+  columns = [getattr(model, f) for f in fields if f != 'genres']
+  query = db.session.query(*columns).order_by(model.updated_at, model.id)
+  if updated_since is not None:
+    query = query.filter(model.updated_at >= updated_since)
+  rows = iter(query.yield_per(CHUNK_SIZE))
+  while True:
+    chunk = list(islice(rows, CHUNK_SIZE))
+    if not chunk:
+      return
+    genres = chunk_genres(model, [r.id for r in chunk]) if 'genres' in fields else None
+    for row in chunk:
+      record = row._asdict()
+      if genres is not None:
+        record['genres'] = genres.get(row.id, [])
+      yield record
+
+def chunk_genres(model, ids):
+  key = GENRE_LINKS[model]
+  names = {}
+  for entity_id, name in db.session.query(key, Genre.name) \
+      .join(Genre, Genre.id == key.table.c.genre_id) \
+      .filter(key.in_(ids)) \
+      .order_by(key, Genre.name):
+    names.setdefault(entity_id, []).append(name)
+  return names
+
+def _value(value):
+  if isinstance(value, datetime):
+    return value.isoformat()
+  if isinstance(value, list):
+    return ', '.join(value)
+  return value
+
+def serialize(kind, fmt, updated_since=None):
+  # yields the export as text lines
+  fields = KINDS[kind][1]
+  if fmt == 'ndjson':
+    for record in records(kind, updated_since):
+      yield json.dumps(record, default=_value) + '\n'
+    return
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  writer.writerow(fields)
+  for record in records(kind, updated_since):
+    writer.writerow([_value(record[f]) for f in fields])
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+  yield buffer.getvalue()
+
+#----------------------------------------------------------------------------#
+# updated_at maintenance.
+#----------------------------------------------------------------------------#
+
+@event.listens_for(Session, 'before_flush')
+def _touch_relationship_changes(session, flush_context, instances):
+  # a change to genres alone issues no UPDATE of the owner row, so the
+  # column onupdate would not fire
+  for obj in session.dirty:
+    if isinstance(obj, (Venue, Artist)) and session.is_modified(obj):
+      obj.updated_at = datetime.utcnow()
@@ -0,0 +1,265 @@
+from collections import namedtuple
+from datetime import datetime
+
+from flask import abort
+from sqlalchemy import Integer, String, and_, cast, event, false, func, literal, null, or_, select, union_all
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from models import db, Venue, Artist, Show, Genre, venue_genres, artist_genres, facet_counts
+from history import keep_previous, previous
+from projections import genre_members
+
+#----------------------------------------------------------------------------#
+# Facets.
+#
+# /venues and /artists can be narrowed by state, city, genre, seeking flag and
+# whether there are upcoming shows, and list how many venues or artists each
+# value of a facet would leave given the other filters. The counts come from
+# the facet_counts summary table, whose rows are small enough that a page
+# sums a few hundred of them instead of scanning Venue or Artist.
+#
+# Writes through the ORM recompute the rows of the (state, city) groups they
+# touch in the same transaction: venue and artist changes directly, show
+# changes only when an owner gains its first or loses its last upcoming show.
+# counters.refresh_all() and bulk deletes rebuild the table.
+#----------------------------------------------------------------------------#
+
+FacetKind = namedtuple('FacetKind', ['name', 'model', 'link', 'seeking'])
+
+KINDS = {
+  Venue: FacetKind('venue', Venue, venue_genres.c.venue_id, 'seeking_talent'),
+  Artist: FacetKind('artist', Artist, artist_genres.c.artist_id, 'seeking_venue'),
+}
+
+FACETS = ('state', 'city', 'genre', 'seeking', 'upcoming')
+FLAGS = ('seeking', 'upcoming')
+# genre_id of the rows counting every venue or artist once
+ALL_GENRES = 0
+# values listed per facet, most common first
+FACET_LIMIT = 20
+
+COLUMNS = ['kind', 'state', 'city', 'seeking', 'upcoming', 'genre_id', 'count']
+
+def _same(column, value):
+  # NULL and '' are one group, as coalesced in facet_counts
+  return column == value if value else or_(column.is_(None), column == '')
+
+def _in_groups(owner, groups):
+  return or_(*[and_(_same(owner.c.state, state), _same(owner.c.city, city)) for state, city in groups])
+
+def summary(kind, where=None):
+  # SELECT of the facet_counts rows of the owners matching where
+  owner = kind.model.__table__
+  state = func.coalesce(owner.c.state, '')
+  city = func.coalesce(owner.c.city, '')
+  seeking = func.coalesce(owner.c[kind.seeking], false())
+  upcoming = owner.c.upcoming_shows_count > 0
+  link = kind.link
+  totals = select([literal(kind.name), state, city, seeking, upcoming, literal(ALL_GENRES), func.count()]) \
+    .group_by(state, city, seeking, upcoming)
+  genres = select([literal(kind.name), state, city, seeking, upcoming, link.table.c.genre_id, func.count()]) \
+    .select_from(owner.join(link.table, link == owner.c.id)) \
+    .group_by(state, city, seeking, upcoming, link.table.c.genre_id)
+  if where is not None:
+    totals, genres = totals.where(where), genres.where(where)
+  return union_all(totals, genres)
+
+def refresh_groups(connection, model, groups):
+  # recompute the facet counts of venues or artists in the (state, city) groups
+  kind = KINDS[model]
+  groups = set((state or '', city or '') for state, city in groups)
+  if not groups:
+    return
+  fc = facet_counts.c
+  connection.execute(facet_counts.delete().where(fc.kind == kind.name).where(
+    or_(*[and_(fc.state == state, fc.city == city) for state, city in groups])))
+  connection.execute(facet_counts.insert().from_select(
+    COLUMNS, summary(kind, _in_groups(kind.model.__table__, groups))))
+
+def refresh_owners(connection, model, ids):
+  # recompute the groups of the given venue or artist ids
+  ids = sorted(set(i for i in ids if i is not None))
+  if ids:
+    owner = model.__table__
+    groups = connection.execute(select([owner.c.state, owner.c.city]).where(owner.c.id.in_(ids)).distinct())
+    refresh_groups(connection, model, groups.fetchall())
+
+def refresh_all(connection, model=None):
+  for kind in KINDS.values():
+    if model is None or kind.model is model:
+      connection.execute(facet_counts.delete().where(facet_counts.c.kind == kind.name))
+      connection.execute(facet_counts.insert().from_select(COLUMNS, summary(kind)))
+
+#----------------------------------------------------------------------------#
+# Filters and counts.
+#----------------------------------------------------------------------------#
+
+def param_names(model):
+  # query string argument of each facet
+  return {'state': 'state', 'city': 'city', 'genre': 'genre',
+          'seeking': KINDS[model].seeking, 'upcoming': 'has_upcoming'}
+
+def params(model, filters):
+  # query string arguments of filters, e.g. for url_for
+  names = param_names(model)
+  return dict((names[facet], ('true' if value else 'false') if facet in FLAGS else value)
+              for facet, value in filters.items())
+
+def parse_filters(model, args):
+  # {facet: value} of ?state=&city=&genre=&seeking_talent= (or seeking_venue=)
+  # &has_upcoming=, with the flags as booleans
+  filters = {}
+  for facet, param in param_names(model).items():
+    value = args.get(param)
+    if not value:
+      continue
+    if facet in FLAGS:
+      if value not in ('true', 'false'):
+        abort(400)
+      value = value == 'true'
+    filters[facet] = value
+  return filters
+
+def criteria(model, filters):
+  # WHERE clauses narrowing a venue or artist query to filters
+  kind = KINDS[model]
+  seeking = getattr(model, kind.seeking)
+  where = []
+  if 'state' in filters:
+    where.append(model.state == filters['state'])
+  if 'city' in filters:
+    where.append(model.city == filters['city'])
+  if 'genre' in filters:
+    where.append(model.id.in_(genre_members(kind.link, filters['genre'])))
+  if 'seeking' in filters:
+    where.append(seeking == True if filters['seeking'] else or_(seeking == False, seeking.is_(None)))
+  if 'upcoming' in filters:
+    where.append(model.upcoming_shows_count > 0 if filters['upcoming'] else model.upcoming_shows_count == 0)
+  return where
+
+def counts(model, filters):
+  # {facet: {value: count}} with every facet counted under the other filters
+  kind = KINDS[model]
+  fc = facet_counts.c
+  genre_id = select([Genre.id]).where(Genre.name == filters.get('genre')).as_scalar()
+  parts = []
+  for facet in FACETS:
+    where = [fc.kind == kind.name]
+    where.extend(fc[f] == value for f, value in filters.items() if f not in (facet, 'genre'))
+    name, flag = cast(null(), String), cast(null(), Integer)
+    if facet == 'genre':
+      key = name = Genre.name
+      where.extend([fc.genre_id > ALL_GENRES, fc.genre_id == Genre.id])
+    else:
+      where.append(fc.genre_id == (genre_id if 'genre' in filters else ALL_GENRES))
+      key = fc[facet]
+      if facet in FLAGS:
+        flag = cast(key, Integer)
+      else:
+        name = key
+    parts.append(select([literal(facet).label('facet'), name.label('name'), flag.label('flag'),
+                         func.sum(fc.count).label('count')])
+                 .where(and_(*where)).group_by(key))
+  result = dict((facet, {}) for facet in FACETS)
+  for facet, name, flag, count in db.session.execute(union_all(*parts)):
+    if facet in FLAGS:
+      result[facet][bool(flag)] = int(count)
+    elif name:
+      result[facet][name] = int(count)
+  return result
+
+FACET_LABELS = {'state': 'State', 'city': 'City', 'genre': 'Genre', 'upcoming': 'Upcoming shows'}
+
+def facet_groups(model, filters):
+  # [{"name", "label", "options": [{"label", "count", "selected", "args"}]}] for
+  # the template; args are the query string of the page with that value
+  # toggled
+  groups = []
+  for facet, values in counts(model, filters).items():
+    selected = filters.get(facet)
+    if selected is not None and selected not in values:
+      values[selected] = 0
+    ranked = sorted(values.items(), key=lambda v: (-v[1], str(v[0])))[:FACET_LIMIT]
+    if selected is not None and selected not in dict(ranked):
+      ranked.append((selected, values[selected]))
+    items = []
+    for value, count in ranked:
+      toggled = dict(filters)
+      if value == selected:
+        del toggled[facet]
+      else:
+        toggled[facet] = value
+      items.append({
+        "label": ('Yes' if value else 'No') if facet in FLAGS else value,
+        "count": count,
+        "selected": value == selected,
+        "args": params(model, toggled),
+      })
+    label = FACET_LABELS.get(facet, 'Seeking talent' if model is Venue else 'Seeking venue')
+    groups.append({"name": facet, "label": label, "options": items})
+  return groups
+
+#----------------------------------------------------------------------------#
+# ORM hooks.
+#----------------------------------------------------------------------------#
+
+FACET_ATTRIBUTES = ('state', 'city', 'seeking_talent', 'seeking_venue', 'genres')
+
+def _upcoming(start_time, now):
+  return start_time is not None and start_time >= now
+
+# the group a venue or artist moved out of, and the owner and start time a
+# show moved away from
+keep_previous(Venue.state, Venue.city, Artist.state, Artist.city, Show.venue_id, Show.artist_id, Show.start_time)
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_touched(session, flush_context):
+  groups = dict((model, set()) for model in KINDS)
+  # net change of upcoming shows per (model, owner id) this flush
+  net = {}
+  now = datetime.now()
+  for obj in session.new | session.dirty | session.deleted:
+    model = type(obj)
+    if model in KINDS:
+      if obj in session.dirty and not any(
+          get_history(obj, a).has_changes() for a in FACET_ATTRIBUTES if hasattr(obj, a)):
+        continue
+      groups[model].add((obj.state, obj.city))
+      groups[model].add((previous(obj, 'state'), previous(obj, 'city')))
+    elif model is Show:
+      for owner, attribute in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+        if obj not in session.new:
+          id = previous(obj, attribute)
+          if id is not None and _upcoming(previous(obj, 'start_time'), now):
+            net[owner, int(id)] = net.get((owner, int(id)), 0) - 1
+        if obj not in session.deleted:
+          id = getattr(obj, attribute)
+          if id is not None and _upcoming(obj.start_time, now):
+            net[owner, int(id)] = net.get((owner, int(id)), 0) + 1
+  changed = dict(((model, id), n) for (model, id), n in net.items() if n)
+  if not changed and not any(groups.values()):
+    return
+  connection = session.connection()
+  if changed:
+    # an owner's group changes when its count crossed zero
+    lookups = []
+    for model in KINDS:
+      ids = [id for m, id in changed if m is model]
+      if ids:
+        lookups.append(select([literal(KINDS[model].name).label('kind'), model.id, model.state, model.city,
+                               model.upcoming_shows_count]).where(model.id.in_(ids)))
+    by_name = dict((kind.name, model) for model, kind in KINDS.items())
+    for kind, id, state, city, upcoming in connection.execute(union_all(*lookups) if len(lookups) > 1 else lookups[0]):
+      model = by_name[kind]
+      if (upcoming - changed[model, id] > 0) != (upcoming > 0):
+        groups[model].add((state, city))
+  for model, touched in groups.items():
+    refresh_groups(connection, model, touched)
+
+@event.listens_for(Session, 'after_bulk_delete')
+@event.listens_for(Session, 'after_bulk_update')
+def _refresh_bulk(context):
+  for model in KINDS:
+    if context.primary_table is model.__table__:
+      refresh_all(context.session.connection(), model)
@@ -0,0 +1,36 @@
+from datetime import date, datetime
+from functools import lru_cache
+
+import babel
+import babel.dates
+import dateutil.parser
+
+#----------------------------------------------------------------------------#
+# Date formatting.
+#
+# Templates format thousands of show times per page. Values are passed in as
+# datetime objects, and the babel pattern and locale for each
+# (format, locale) pair are compiled once and reused.
+#----------------------------------------------------------------------------#
+
+FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+@lru_cache(maxsize=64)
+def compiled_pattern(format, locale=None):
+  # (DateTimePattern, Locale) for a named or literal babel format
+  return (babel.dates.parse_pattern(FORMATS.get(format, format)),
+          babel.Locale.parse(locale or babel.dates.LC_TIME))
+
+def format_datetime(value, format='medium', locale=None):
+  if value is None:
+    return ''
+  if not isinstance(value, date):
+    # strings still work, at the cost of a parse per call
+    value = dateutil.parser.parse(value)
+  elif not isinstance(value, datetime):
+    value = datetime(value.year, value.month, value.day)
+  pattern, locale = compiled_pattern(format, locale)
+  return pattern.apply(value, locale)
@@ -0,0 +1,31 @@
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import get_history
+
+#----------------------------------------------------------------------------#
+# Attribute history.
+#
+# The show counters and facet counts are kept in step by flush hooks that
+# need the values a flush replaced: the venue a show moved away from, the
+# city a venue moved out of. An attribute only records what an assignment
+# replaced when the old value was loaded at the time, so keep_previous()
+# asks for it to be loaded on assignment.
+#----------------------------------------------------------------------------#
+
+# (class, attribute name) of the attributes keep_previous() was called for
+_kept = set()
+
+def _load_replaced(target, value, oldvalue, initiator):
+  pass
+
+def keep_previous(*attributes):
+  # e.g. keep_previous(Show.venue_id, Show.start_time)
+  for attribute in attributes:
+    key = (attribute.class_, attribute.key)
+    if key not in _kept:
+      _kept.add(key)
+      event.listen(attribute, 'set', _load_replaced, active_history=True)
+
+def previous(target, attribute):
+  # value of attribute before the flush
+  history = get_history(target, attribute)
+  return history.deleted[0] if history.deleted else getattr(target, attribute)
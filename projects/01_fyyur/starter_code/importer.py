@@ -0,0 +1,242 @@
+import csv
+import io
+import json
+import time
+
+from sqlalchemy import false, func, select
+from werkzeug.datastructures import MultiDict
+
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Artist, Show, Genre, venue_genres, artist_genres
+import availability
+import counters
+import facets
+import pagecache
+import search
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#
+# Streams CSV or NDJSON records, validates each one with the same forms the
+# create pages use, and loads them BATCH_SIZE at a time: one executemany (COPY
+# on PostgreSQL) per table per batch, with genre names and show artist/venue
+# references resolved for the whole batch in a single query each.
+#----------------------------------------------------------------------------#
+
+BATCH_SIZE = 1000
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y', 'on')
+
+class Kind(object):
+
+  def __init__(self, model, form, fields, booleans=(), links=None):
+    self.model = model
+    self.form = form
+    self.fields = fields
+    self.booleans = booleans
+    self.links = links
+
+KINDS = {
+  'venues': Kind(Venue, VenueForm,
+                 ['name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+                  'website', 'seeking_talent', 'seeking_description'],
+                 booleans=('seeking_talent',), links=(venue_genres, 'venue_id')),
+  'artists': Kind(Artist, ArtistForm,
+                  ['name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+                   'website', 'seeking_venue', 'seeking_description'],
+                  booleans=('seeking_venue',), links=(artist_genres, 'artist_id')),
+  'shows': Kind(Show, ShowForm, ['artist_id', 'venue_id', 'start_time', 'duration']),
+}
+
+#----------------------------------------------------------------------------#
+# Readers.
+#----------------------------------------------------------------------------#
+
+def read_csv(stream):
+  for record in csv.DictReader(stream):
+    yield record
+
+def read_ndjson(stream):
+  for line in stream:
+    line = line.strip()
+    if line:
+      yield json.loads(line)
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+def batched(records, size):
+  batch = []
+  for number, record in enumerate(records, 1):
+    batch.append((number, record))
+    if len(batch) == size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+#----------------------------------------------------------------------------#
+# Validation.
+#----------------------------------------------------------------------------#
+
+def formdata(record):
+  data = MultiDict()
+  for key, value in record.items():
+    if key == 'genres':
+      for name in Genre.split(value if isinstance(value, (str, list)) else ''):
+        data.add(key, name)
+    elif value is not None:
+      data.add(key, value if isinstance(value, str) else str(value))
+  return data
+
+def validate(kind, record):
+  # (row, genre names) for a valid record, or (None, errors)
+  form = kind.form(formdata=formdata(record), meta={'csrf': False})
+  if kind.model is Venue or kind.model is Artist:
+    # genres are free text in imports; the form's choices list is the
+    # vocabulary of the create page only
+    form.genres.choices = [(g, g) for g in form.genres.data]
+  if not form.validate():
+    return None, form.errors
+  row = {}
+  for field in kind.fields:
+    value = form.data[field] if field in form.data else record.get(field)
+    if field in kind.booleans:
+      value = str(value).strip().lower() in TRUE_VALUES
+    elif value == '':
+      value = None
+    elif field.endswith('_id'):
+      value = int(value)
+    elif field == 'duration' and value is None:
+      value = availability.DEFAULT_DURATION
+    row[field] = value
+  genres = (form.data.get('genres') or []) if kind.links else []
+  return row, genres
+
+#----------------------------------------------------------------------------#
+# Loading.
+#----------------------------------------------------------------------------#
+
+def reserve_ids(connection, table, count):
+  # primary keys for rows about to be inserted, so genre links can be written
+  # in the same batch
+  if connection.dialect.name == 'postgresql':
+    sequence = "pg_get_serial_sequence('\"%s\"', 'id')" % table.name
+    rows = connection.execute('SELECT nextval(%s) FROM generate_series(1, %d)' % (sequence, count))
+    return [r[0] for r in rows]
+  # SQLite has no sequences: take the database's write lock with a write
+  # that matches no rows before reading max(id), so a web write or another
+  # import waits for this batch instead of taking the same ids
+  connection.execute(table.update().where(false()).values(id=table.c.id))
+  start = connection.execute(select([func.coalesce(func.max(table.c.id), 0)])).scalar()
+  return list(range(start + 1, start + count + 1))
+
+def insert_rows(connection, table, rows):
+  if not rows:
+    return
+  if connection.dialect.name != 'postgresql':
+    connection.execute(table.insert(), rows)
+    return
+  columns = list(rows[0])
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for row in rows:
+    writer.writerow(['\\N' if row[c] is None else row[c] for c in columns])
+  buffer.seek(0)
+  cursor = connection.connection.cursor()
+  cursor.copy_expert('COPY "%s" (%s) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')' % (
+    table.name, ', '.join('"%s"' % c for c in columns)), buffer)
+
+def genre_ids(connection, names):
+  genre = Genre.__table__
+  names = sorted(set(names))
+  if not names:
+    return {}
+  known = dict((r.name, r.id) for r in connection.execute(
+    select([genre.c.name, genre.c.id]).where(genre.c.name.in_(names))))
+  missing = [n for n in names if n not in known]
+  if missing:
+    connection.execute(genre.insert(), [{'name': n} for n in missing])
+    known.update((r.name, r.id) for r in connection.execute(
+      select([genre.c.name, genre.c.id]).where(genre.c.name.in_(missing))))
+  return known
+
+def resolve_references(connection, batch):
+  # swap artist_name/venue_name for ids and check that every referenced
+  # artist and venue exists, with one query per table
+  for model, key in ((Artist, 'artist'), (Venue, 'venue')):
+    table = model.__table__
+    names = set(r[key + '_name'] for n, r in batch if not r.get(key + '_id') and r.get(key + '_name'))
+    by_name = {}
+    if names:
+      for row in connection.execute(select([table.c.name, table.c.id]).where(table.c.name.in_(names))):
+        by_name.setdefault(row.name, row.id)
+    ids = set()
+    for number, record in batch:
+      if not record.get(key + '_id') and record.get(key + '_name') in by_name:
+        record[key + '_id'] = by_name[record[key + '_name']]
+      try:
+        ids.add(int(record.get(key + '_id')))
+      except (TypeError, ValueError):
+        pass
+    existing = set(r[0] for r in connection.execute(select([table.c.id]).where(table.c.id.in_(ids)))) if ids else set()
+    for number, record in batch:
+      try:
+        if int(record.get(key + '_id')) in existing:
+          continue
+      except (TypeError, ValueError):
+        pass
+      record.setdefault('_errors', {})[key + '_id'] = ['Unknown %s.' % key]
+
+def load_batch(connection, kind, batch):
+  # returns (loaded, [(record number, errors)])
+  if kind.model is Show:
+    resolve_references(connection, batch)
+  rows, numbers, genres, rejected = [], [], [], []
+  for number, record in batch:
+    errors = record.pop('_errors', None)
+    row, extra = validate(kind, record)
+    if row is None or errors:
+      rejected.append((number, errors or extra))
+      continue
+    rows.append(row)
+    numbers.append(number)
+    genres.append(extra)
+  table = kind.model.__table__
+  if kind.links and rows:
+    link, key = kind.links
+    for row, id in zip(rows, reserve_ids(connection, table, len(rows))):
+      row['id'] = id
+    insert_rows(connection, table, rows)
+    ids = genre_ids(connection, [g for names in genres for g in names])
+    insert_rows(connection, link, [
+      {key: row['id'], 'genre_id': ids[name]} for row, names in zip(rows, genres) for name in names])
+    facets.refresh_owners(connection, kind.model, [row['id'] for row in rows])
+  elif rows:
+    # double bookings are rejected like invalid records
+    conflicts = availability.batch_conflicts(connection, rows)
+    if conflicts:
+      rejected.extend((numbers[i], {'start_time': ['Venue is already booked at that time.']}) for i in sorted(conflicts))
+      rows = [r for i, r in enumerate(rows) if i not in conflicts]
+    insert_rows(connection, table, rows)
+    counters.apply_show_changes(connection, added=[(r['venue_id'], r['artist_id'], r['start_time']) for r in rows])
+    facets.refresh_owners(connection, Venue, [r['venue_id'] for r in rows])
+    facets.refresh_owners(connection, Artist, [r['artist_id'] for r in rows])
+  return len(rows), rejected
+
+def import_records(kind_name, records, batch_size=BATCH_SIZE, progress=None):
+  # load an iterable of dict records; returns (loaded, rejected, seconds)
+  kind = KINDS[kind_name]
+  loaded, rejected = 0, []
+  started = time.perf_counter()
+  for batch in batched(records, batch_size):
+    with db.engine.begin() as connection:
+      count, errors = load_batch(connection, kind, batch)
+    loaded += count
+    rejected.extend(errors)
+    if progress:
+      progress(loaded, len(rejected), time.perf_counter() - started)
+  if kind.model is not Show:
+    search.invalidate(kind.model)
+  if kind.model is not Artist:
+    availability.invalidate()
+  pagecache.clear()
+  return loaded, rejected, time.perf_counter() - started
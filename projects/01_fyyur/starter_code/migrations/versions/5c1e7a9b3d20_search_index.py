@@ -0,0 +1,49 @@
+"""search index for venues and artists
+
+Revision ID: 5c1e7a9b3d20
+Revises: 37e09f49d469
+Create Date: 2020-06-14 11:02:18.412907
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e7a9b3d20'
+down_revision = '37e09f49d469'
+branch_labels = None
+depends_on = None
+
+# search_vector is maintained by PostgreSQL itself: name weighs most, then
+# genres, then city and state. Other databases use the in-process index in
+# search.py and need no schema change.
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(genres, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(state, '')), 'C')
+"""
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('Venue', 'Artist'):
+        op.execute(
+            'ALTER TABLE "{0}" ADD COLUMN search_vector tsvector '
+            'GENERATED ALWAYS AS ({1}) STORED'.format(table, SEARCH_VECTOR))
+        op.execute(
+            'CREATE INDEX "ix_{0}_search_vector" ON "{0}" '
+            'USING gin (search_vector)'.format(table))
+        op.execute(
+            'CREATE INDEX "ix_{0}_name_trgm" ON "{0}" '
+            'USING gin (name gin_trgm_ops)'.format(table))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('Venue', 'Artist'):
+        op.execute('DROP INDEX IF EXISTS "ix_{0}_name_trgm"'.format(table))
+        op.execute('DROP INDEX IF EXISTS "ix_{0}_search_vector"'.format(table))
+        op.drop_column(table, 'search_vector')
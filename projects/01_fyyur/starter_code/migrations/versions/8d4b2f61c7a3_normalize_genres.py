@@ -0,0 +1,153 @@
+"""move comma-joined genres into Genre and association tables
+
+Revision ID: 8d4b2f61c7a3
+Revises: 5c1e7a9b3d20
+Create Date: 2020-06-21 09:47:03.318562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4b2f61c7a3'
+down_revision = '5c1e7a9b3d20'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# search_vector (see 5c1e7a9b3d20) is generated from the genres column, so it
+# is rebuilt around the column change on PostgreSQL
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(state, '')), 'C')
+"""
+SEARCH_VECTOR_WITH_GENRES = """
+    setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(genres, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(state, '')), 'C')
+"""
+
+genre = sa.table('Genre', sa.column('id', sa.Integer), sa.column('name', sa.String))
+
+# (entity table, association table, association key, genres column length)
+LINKS = [
+    ('Venue', 'venue_genres', 'venue_id', 500),
+    ('Artist', 'artist_genres', 'artist_id', 120),
+]
+
+
+def drop_search_vector(table):
+    op.execute('DROP INDEX IF EXISTS "ix_{0}_search_vector"'.format(table))
+    op.drop_column(table, 'search_vector')
+
+
+def add_search_vector(table, expression):
+    op.execute(
+        'ALTER TABLE "{0}" ADD COLUMN search_vector tsvector '
+        'GENERATED ALWAYS AS ({1}) STORED'.format(table, expression))
+    op.execute(
+        'CREATE INDEX "ix_{0}_search_vector" ON "{0}" '
+        'USING gin (search_vector)'.format(table))
+
+
+def batches(conn, table, columns):
+    # keyset walk over a table so large catalogs are read BATCH_SIZE rows at a time
+    source = sa.table(table, *[sa.column(c) for c in columns])
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select([source.c[c] for c in columns])
+            .where(source.c[columns[0]] > last_id)
+            .order_by(source.c[columns[0]])
+            .limit(BATCH_SIZE)).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def genre_ids(conn, names, known):
+    # resolve genre names to ids, inserting the ones not seen yet
+    missing = sorted(set(names) - set(known))
+    if missing:
+        for row in conn.execute(sa.select([genre.c.id, genre.c.name]).where(genre.c.name.in_(missing))):
+            known[row.name] = row.id
+        new = [n for n in missing if n not in known]
+        if new:
+            conn.execute(genre.insert(), [{'name': n} for n in new])
+            for row in conn.execute(sa.select([genre.c.id, genre.c.name]).where(genre.c.name.in_(new))):
+                known[row.name] = row.id
+    return known
+
+
+def upgrade():
+    conn = op.get_bind()
+    postgres = conn.dialect.name == 'postgresql'
+
+    op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for table, link, key, length in LINKS:
+        op.create_table(link,
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([key], [table + '.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+        sa.PrimaryKeyConstraint(key, 'genre_id')
+        )
+        op.create_index('ix_{0}_genre_id'.format(link), link, ['genre_id', key], unique=False)
+
+    known = {}
+    for table, link, key, length in LINKS:
+        association = sa.table(link, sa.column(key), sa.column('genre_id'))
+        for rows in batches(conn, table, ['id', 'genres']):
+            pairs = []
+            for entity_id, genres in rows:
+                names = []
+                for name in (genres or '').split(','):
+                    name = name.strip()
+                    if name and name not in names:
+                        names.append(name)
+                pairs.extend((entity_id, name) for name in names)
+            known = genre_ids(conn, [name for _, name in pairs], known)
+            if pairs:
+                conn.execute(association.insert(), [{key: e, 'genre_id': known[n]} for e, n in pairs])
+
+        if postgres:
+            drop_search_vector(table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('genres')
+        if postgres:
+            add_search_vector(table, SEARCH_VECTOR)
+
+
+def downgrade():
+    conn = op.get_bind()
+    postgres = conn.dialect.name == 'postgresql'
+
+    for table, link, key, length in LINKS:
+        op.add_column(table, sa.Column('genres', sa.String(length=length), nullable=True))
+        entity = sa.table(table, sa.column('id'), sa.column('genres'))
+        association = sa.table(link, sa.column(key), sa.column('genre_id'))
+        for rows in batches(conn, table, ['id']):
+            ids = [r[0] for r in rows]
+            names = {}
+            for entity_id, name in conn.execute(
+                    sa.select([association.c[key], genre.c.name])
+                    .select_from(association.join(genre, genre.c.id == association.c.genre_id))
+                    .where(association.c[key].in_(ids))
+                    .order_by(association.c[key], genre.c.name)):
+                names.setdefault(entity_id, []).append(name)
+            for entity_id, genres in names.items():
+                conn.execute(entity.update().where(entity.c.id == entity_id).values(genres=', '.join(genres)))
+        if postgres:
+            drop_search_vector(table)
+            add_search_vector(table, SEARCH_VECTOR_WITH_GENRES)
+        op.drop_index('ix_{0}_genre_id'.format(link), table_name=link)
+        op.drop_table(link)
+    op.drop_table('Genre')
@@ -0,0 +1,48 @@
+"""upcoming/past show counters on Venue and Artist
+
+Revision ID: a3f96e0d2b14
+Revises: 8d4b2f61c7a3
+Create Date: 2020-06-28 15:12:40.771305
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f96e0d2b14'
+down_revision = '8d4b2f61c7a3'
+branch_labels = None
+depends_on = None
+
+show = sa.table('Show', sa.column('venue_id'), sa.column('artist_id'), sa.column('start_time'))
+
+
+def upgrade():
+    for table, key in (('Venue', show.c.venue_id), ('Artist', show.c.artist_id)):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('next_show_at', sa.DateTime(), nullable=True))
+        op.create_index(op.f('ix_{0}_next_show_at'.format(table)), table, ['next_show_at'], unique=False)
+
+        # backfill; later changes are kept current by counters.py
+        now = datetime.now()
+        owner = sa.table(table, sa.column('id'), sa.column('upcoming_shows_count'),
+                         sa.column('past_shows_count'), sa.column('next_show_at'))
+        upcoming = (key == owner.c.id) & (show.c.start_time >= now)
+        past = (key == owner.c.id) & (show.c.start_time < now)
+        op.execute(owner.update().values(
+            upcoming_shows_count=sa.select([sa.func.count()]).where(upcoming).as_scalar(),
+            past_shows_count=sa.select([sa.func.count()]).where(past).as_scalar(),
+            next_show_at=sa.select([sa.func.min(show.c.start_time)]).where(upcoming).as_scalar()))
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index(op.f('ix_{0}_next_show_at'.format(table)), table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('next_show_at')
+            batch_op.drop_column('past_shows_count')
+            batch_op.drop_column('upcoming_shows_count')
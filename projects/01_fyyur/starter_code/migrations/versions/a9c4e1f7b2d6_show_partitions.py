@@ -0,0 +1,127 @@
+"""partition Show by month on PostgreSQL
+
+Revision ID: a9c4e1f7b2d6
+Revises: f2a5d8c1e637
+Create Date: 2020-07-26 10:21:37.904415
+
+"""
+from datetime import datetime
+
+from alembic import context, op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c4e1f7b2d6'
+down_revision = 'f2a5d8c1e637'
+branch_labels = None
+depends_on = None
+
+# Show becomes a table range partitioned by start_time with one partition per
+# month, from the oldest show to MONTHS_AHEAD months from now, plus a default
+# partition (kept small and BRIN indexed) for anything outside them. Later
+# months are added with `flask fyyur partitions`.
+#
+# `flask db upgrade -x show_partitions=off` keeps Show a plain table and adds
+# a BRIN index on start_time instead. Other databases are left as they are.
+MONTHS_AHEAD = 12
+
+INDEXES = [
+    ('ix_Show_venue_id_start_time', ['venue_id', 'start_time']),
+    ('ix_Show_artist_id_start_time', ['artist_id', 'start_time']),
+    ('ix_Show_start_time_id', ['start_time', 'id']),
+    ('ix_Show_updated_at', ['updated_at']),
+]
+
+COLUMNS = 'id, start_time, venue_id, artist_id, updated_at'
+
+
+def use_partitions():
+    return context.get_x_argument(as_dictionary=True).get('show_partitions', 'on') != 'off'
+
+
+def is_partitioned(conn):
+    return conn.execute(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = '\"Show\"'::regclass").scalar()
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def months(first, last):
+    month = datetime(first.year, first.month, 1)
+    while month <= last:
+        yield month, add_months(month, 1)
+        month = add_months(month, 1)
+
+
+def create_indexes(table='Show'):
+    for name, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def drop_indexes():
+    for name, columns in INDEXES:
+        op.execute('DROP INDEX IF EXISTS "{0}"'.format(name))
+
+
+def swap_table(primary_key, partitioned):
+    # recreate Show, plain or partitioned by start_time; finish_swap copies
+    # the rows over
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    drop_indexes()
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_old"')
+    op.execute('ALTER TABLE "Show_old" RENAME CONSTRAINT "Show_pkey" TO "Show_old_pkey"')
+    op.execute('ALTER TABLE "Show_old" DROP CONSTRAINT IF EXISTS "Show_venue_id_fkey"')
+    op.execute('ALTER TABLE "Show_old" DROP CONSTRAINT IF EXISTS "Show_artist_id_fkey"')
+    op.execute(
+        'CREATE TABLE "Show" ('
+        ' id integer NOT NULL DEFAULT nextval(\'"Show_id_seq"\'::regclass),'
+        ' start_time timestamp without time zone{1},'
+        ' venue_id integer NOT NULL,'
+        ' artist_id integer NOT NULL,'
+        ' updated_at timestamp without time zone DEFAULT timezone(\'utc\', now()),'
+        ' CONSTRAINT "Show_venue_id_fkey" FOREIGN KEY (venue_id) REFERENCES "Venue" (id),'
+        ' CONSTRAINT "Show_artist_id_fkey" FOREIGN KEY (artist_id) REFERENCES "Artist" (id),'
+        ' CONSTRAINT "Show_pkey" PRIMARY KEY ({0}))'
+        '{2}'.format(primary_key, ' NOT NULL' if partitioned else '',
+                     ' PARTITION BY RANGE (start_time)' if partitioned else ''))
+
+
+def finish_swap():
+    op.execute('INSERT INTO "Show" ({0}) SELECT {0} FROM "Show_old"'.format(COLUMNS))
+    op.execute('DROP TABLE "Show_old"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    create_indexes()
+
+
+def upgrade():
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        return
+    if not use_partitions():
+        op.execute('CREATE INDEX "ix_Show_start_time_brin" ON "Show" USING brin (start_time)')
+        return
+    first = conn.execute('SELECT min(start_time) FROM "Show"').scalar() or datetime.now()
+    last = add_months(datetime.now(), MONTHS_AHEAD)
+    # the partition key must be part of the primary key
+    swap_table('id, start_time', partitioned=True)
+    for month, following in months(first, last):
+        op.execute(
+            'CREATE TABLE "Show_p{0:%Y_%m}" PARTITION OF "Show" '
+            'FOR VALUES FROM (\'{0:%Y-%m-%d}\') TO (\'{1:%Y-%m-%d}\')'.format(month, following))
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+    op.execute('CREATE INDEX "ix_Show_default_start_time_brin" ON "Show_default" USING brin (start_time)')
+    finish_swap()
+
+
+def downgrade():
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        return
+    if not is_partitioned(conn):
+        op.execute('DROP INDEX IF EXISTS "ix_Show_start_time_brin"')
+        return
+    swap_table('id', partitioned=False)
+    finish_swap()
@@ -0,0 +1,30 @@
+"""duration of a show, in minutes
+
+Revision ID: b6d1f3e8a295
+Revises: a9c4e1f7b2d6
+Create Date: 2020-08-02 15:44:09.736120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d1f3e8a295'
+down_revision = 'a9c4e1f7b2d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing shows are taken to last the default two hours
+    op.add_column('Show', sa.Column('duration', sa.Integer(), server_default='120', nullable=False))
+    # the booking check in availability.py only looks back MAX_DURATION
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.create_check_constraint('ck_Show_duration', 'duration BETWEEN 1 AND 1440')
+
+
+def downgrade():
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_constraint('ck_Show_duration', type_='check')
+        batch_op.drop_column('duration')
@@ -0,0 +1,59 @@
+"""facet counts of venues and artists
+
+Revision ID: d3a7c9e1f4b8
+Revises: b6d1f3e8a295
+Create Date: 2020-08-09 11:26:53.104872
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7c9e1f4b8'
+down_revision = 'b6d1f3e8a295'
+branch_labels = None
+depends_on = None
+
+OWNERS = (('venue', 'Venue', 'venue_genres', 'venue_id', 'seeking_talent'),
+          ('artist', 'Artist', 'artist_genres', 'artist_id', 'seeking_venue'))
+COLUMNS = ['kind', 'state', 'city', 'seeking', 'upcoming', 'genre_id', 'count']
+
+
+def upgrade():
+    facet_counts = op.create_table('facet_counts',
+        sa.Column('kind', sa.String(length=10), nullable=False),
+        sa.Column('state', sa.String(length=120), nullable=False),
+        sa.Column('city', sa.String(length=120), nullable=False),
+        sa.Column('seeking', sa.Boolean(), nullable=False),
+        sa.Column('upcoming', sa.Boolean(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('kind', 'state', 'city', 'seeking', 'upcoming', 'genre_id')
+    )
+    op.create_index('ix_facet_counts_kind_genre_id', 'facet_counts', ['kind', 'genre_id'], unique=False)
+    for kind, table, link_table, key, seeking_column in OWNERS:
+        op.create_index('ix_{0}_state_city'.format(table), table, ['state', 'city'], unique=False)
+
+        # backfill; later changes are kept current by facets.py
+        owner = sa.table(table, sa.column('id'), sa.column('state'), sa.column('city'),
+                         sa.column(seeking_column), sa.column('upcoming_shows_count'))
+        link = sa.table(link_table, sa.column(key), sa.column('genre_id'))
+        state = sa.func.coalesce(owner.c.state, '')
+        city = sa.func.coalesce(owner.c.city, '')
+        seeking = sa.func.coalesce(owner.c[seeking_column], sa.false())
+        upcoming = owner.c.upcoming_shows_count > 0
+        totals = sa.select([sa.literal(kind), state, city, seeking, upcoming, sa.literal(0), sa.func.count()]) \
+            .select_from(owner) \
+            .group_by(state, city, seeking, upcoming)
+        genres = sa.select([sa.literal(kind), state, city, seeking, upcoming, link.c.genre_id, sa.func.count()]) \
+            .select_from(owner.join(link, link.c[key] == owner.c.id)) \
+            .group_by(state, city, seeking, upcoming, link.c.genre_id)
+        op.execute(facet_counts.insert().from_select(COLUMNS, sa.union_all(totals, genres)))
+
+
+def downgrade():
+    for kind, table, link_table, key, seeking_column in reversed(OWNERS):
+        op.drop_index('ix_{0}_state_city'.format(table), table_name=table)
+    op.drop_index('ix_facet_counts_kind_genre_id', table_name='facet_counts')
+    op.drop_table('facet_counts')
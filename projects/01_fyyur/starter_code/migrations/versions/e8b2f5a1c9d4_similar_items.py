@@ -0,0 +1,42 @@
+"""similar artists and venues
+
+Revision ID: e8b2f5a1c9d4
+Revises: d3a7c9e1f4b8
+Create Date: 2020-08-16 10:41:27.318905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b2f5a1c9d4'
+down_revision = 'd3a7c9e1f4b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # filled by `flask fyyur recommend`
+    op.create_table('similar_items',
+        sa.Column('kind', sa.String(length=10), nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('rank', sa.Integer(), nullable=False),
+        sa.Column('similar_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('kind', 'item_id', 'rank')
+    )
+    op.create_table('similar_builds',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('built_at', sa.DateTime(), nullable=False),
+        sa.Column('watermark', sa.DateTime(), nullable=True),
+        sa.Column('full', sa.Boolean(), nullable=False),
+        sa.Column('artists', sa.Integer(), nullable=False),
+        sa.Column('venues', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('similar_builds')
+    op.drop_table('similar_items')
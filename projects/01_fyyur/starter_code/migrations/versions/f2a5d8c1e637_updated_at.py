@@ -0,0 +1,39 @@
+"""updated_at on Venue, Artist and Show for incremental exports
+
+Revision ID: f2a5d8c1e637
+Revises: e41b8c07f5d9
+Create Date: 2020-07-19 13:05:46.582231
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a5d8c1e637'
+down_revision = 'e41b8c07f5d9'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show')
+
+
+def upgrade():
+    now = datetime.utcnow()
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute(sa.table(table, sa.column('updated_at')).update().values(updated_at=now))
+        if op.get_bind().dialect.name == 'postgresql':
+            # rows loaded with COPY get a timestamp without the ORM default,
+            # in UTC like datetime.utcnow whatever the server's time zone
+            op.alter_column(table, 'updated_at', server_default=sa.text("timezone('utc', now())"))
+        op.create_index(op.f('ix_{0}_updated_at'.format(table)), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_index(op.f('ix_{0}_updated_at'.format(table)), table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
@@ -1,13 +1,116 @@
-from flask_sqlalchemy import SQLAlchemy
+from datetime import datetime, timedelta
 
-db = SQLAlchemy()
+from sqlalchemy import DateTime
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+from routing import RoutingSQLAlchemy
+
+# reads of GET requests may go to a replica; see routing.py
+db = RoutingSQLAlchemy()
+
+# server default of the updated_at columns: rows written outside the ORM
+# (COPY, raw SQL) get UTC like datetime.utcnow, whatever the server time zone
+class utcnow(FunctionElement):
+  type = DateTime()
+
+@compiles(utcnow)
+def _utcnow(element, compiler, **kw):
+  # UTC in SQLite
+  return 'CURRENT_TIMESTAMP'
+
+@compiles(utcnow, 'postgresql')
+def _utcnow_postgresql(element, compiler, **kw):
+  return "timezone('utc', now())"
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+# genre association tables; the (genre_id, ...) indexes serve ?genre= filters
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id', 'genre_id', 'venue_id'))
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id', 'genre_id', 'artist_id'))
+
+# facet counts of the /venues and /artists filters, maintained by facets.py:
+# how many venues or artists share a state, city, seeking flag and
+# has-upcoming-shows flag, in total (genre_id 0) and per genre
+facet_counts = db.Table('facet_counts',
+    db.Column('kind', db.String(10), primary_key=True),
+    db.Column('state', db.String(120), primary_key=True),
+    db.Column('city', db.String(120), primary_key=True),
+    db.Column('seeking', db.Boolean, primary_key=True),
+    db.Column('upcoming', db.Boolean, primary_key=True),
+    db.Column('genre_id', db.Integer, primary_key=True),
+    db.Column('count', db.Integer, nullable=False),
+    db.Index('ix_facet_counts_kind_genre_id', 'kind', 'genre_id'))
+
+# top-k most similar artists and venues by the shows they share, rebuilt by
+# the recommendations job (see recommendations.py)
+similar_items = db.Table('similar_items',
+    db.Column('kind', db.String(10), primary_key=True),
+    db.Column('item_id', db.Integer, primary_key=True),
+    db.Column('rank', db.Integer, primary_key=True),
+    db.Column('similar_id', db.Integer, nullable=False),
+    db.Column('score', db.Float, nullable=False))
+
+# one row per recommendations build; watermark is the Show.updated_at up to
+# which shows were included, where the next incremental build starts
+similar_builds = db.Table('similar_builds',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('built_at', db.DateTime, nullable=False),
+    db.Column('watermark', db.DateTime),
+    db.Column('full', db.Boolean, nullable=False),
+    db.Column('artists', db.Integer, nullable=False),
+    db.Column('venues', db.Integer, nullable=False))
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    @staticmethod
+    def split(values):
+      # form values may be a multi-select list or comma-joined strings
+      if isinstance(values, str):
+        values = [values]
+      names = []
+      for value in values or []:
+        for name in value.split(','):
+          name = name.strip()
+          if name and name not in names:
+            names.append(name)
+      return names
+
+    @classmethod
+    def from_names(cls, values):
+      # Genre rows for the given names, creating the missing ones
+      names = cls.split(values)
+      if not names:
+        return []
+      existing = {g.name: g for g in cls.query.filter(cls.name.in_(names))}
+      genres = []
+      for name in names:
+        if name not in existing:
+          existing[name] = cls(name=name)
+          db.session.add(existing[name])
+        genres.append(existing[name])
+      return genres
+
+    def __repr__(self):
+      return f'<Genre {self.id} {self.name}>'
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    # facets.py recomputes the facet counts of a (state, city) group at a time
+    __table_args__ = (db.Index('ix_Venue_state_city', 'state', 'city'),)
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -17,10 +120,17 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
-    genres = db.Column(db.String(500))
+    genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name')
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500))
+    # maintained by counters.py; next_show_at drives the roll-forward job
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime, index=True)
+    # UTC time of the last change, for incremental exports (see export.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=utcnow(), index=True)
     shows = db.relationship('Show', backref = 'venue', lazy=True)
 
     def __repr__(self):
@@ -28,30 +138,57 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    # facets.py recomputes the facet counts of a (state, city) group at a time
+    __table_args__ = (db.Index('ix_Artist_state_city', 'state', 'city'),)
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name')
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500))   
+    # maintained by counters.py; next_show_at drives the roll-forward job
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime, index=True)
+    # UTC time of the last change, for incremental exports (see export.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=utcnow(), index=True)
     shows = db.relationship('Show', backref='artist', lazy=True)
 
     def __repr__(self):
       return f'<Artist {self.id} {self.name}>'
 
 class Show(db.Model):
+  # range partitioned by month of start_time on PostgreSQL, where the primary
+  # key is (id, start_time); see schedule.py
   __tablename__ = 'Show'
+  __table_args__ = (
+    db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+    # availability.MAX_DURATION
+    db.CheckConstraint('duration BETWEEN 1 AND 1440', name='ck_Show_duration'),
+  )
 
   id = db.Column(db.Integer, primary_key=True)
   start_time = db.Column(db.DateTime)
+  # minutes; a venue hosts one show at a time (see availability.py)
+  duration = db.Column(db.Integer, nullable=False, default=120, server_default='120')
   venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
   artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+  # UTC time of the last change, for incremental exports (see export.py)
+  updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                         server_default=utcnow(), index=True)
+
+  @property
+  def end_time(self):
+    return self.start_time + timedelta(minutes=self.duration)
 
   def __repr__(self):
     return f'<Show {self.id} {self.start_time} Artist: {self.artist_id} Venue: {self.venue_id}>'
@@ -0,0 +1,246 @@
+import hashlib
+import os
+import stat
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app, session
+
+from models import db, Show
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#
+# Rendered venue and artist pages are kept per entity id until a write
+# invalidates them or the next upcoming show starts (which moves it from the
+# upcoming to the past list), whichever comes first.
+#
+#   PAGE_CACHE              'lru' (in process), 'filesystem' or None
+#   PAGE_CACHE_MAX_ENTRIES  \  bounds of the LRU store
+#   PAGE_CACHE_MAX_BYTES    /
+#   PAGE_CACHE_DIR          directory of the filesystem store, which can be
+#                           shared by several processes of the same user
+#                           (default 'pages' in the instance folder)
+#   PAGE_CACHE_TTL          seconds an entry lives at most
+#   PAGE_CACHE_STAMP        file replaced by clear() (default
+#                           'pagecache.stamp' in the instance folder)
+#
+# clear() empties this process's store and replaces the stamp file; the
+# other processes of the app (a server, when a `flask fyyur` command loaded
+# data) see the new stamp on their next cache read and empty theirs too.
+# Pages are not cached or served from cache while flash messages are pending,
+# since the layout renders them. When reads go to replicas (see routing.py) an
+# invalidated page is not cached again for REPLICA_STICKY_SECONDS, so a
+# lagging replica cannot put the old version back.
+#----------------------------------------------------------------------------#
+
+class LRUStore(object):
+
+  def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.entries = OrderedDict()
+    self.size = 0
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None:
+        self.entries.move_to_end(key)
+      return entry
+
+  def set(self, key, expires, body):
+    with self.lock:
+      self._pop(key)
+      self.entries[key] = (expires, body)
+      self.size += len(body or '')
+      while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+        self._pop(next(iter(self.entries)))
+
+  def _pop(self, key):
+    entry = self.entries.pop(key, None)
+    if entry is not None:
+      self.size -= len(entry[1] or '')
+
+  def delete(self, key):
+    with self.lock:
+      self._pop(key)
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.size = 0
+
+class FileSystemStore(object):
+  """Pages as files of one header line (the expiry, and whether a page
+  follows or the entry only holds an invalidation) and the page itself."""
+
+  SUFFIX = '.page'
+
+  def __init__(self, directory):
+    self.directory = directory
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    # the files are served as they are, so nobody else may be able to write them
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode):
+      raise ValueError('PAGE_CACHE_DIR %r is not a directory' % directory)
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+      raise ValueError('PAGE_CACHE_DIR %r belongs to another user' % directory)
+    if info.st_mode & 0o077:
+      os.chmod(directory, 0o700)
+
+  def _path(self, key):
+    return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + self.SUFFIX)
+
+  def get(self, key):
+    try:
+      with open(self._path(key), 'rb') as f:
+        expires, kind = f.readline().decode('ascii').split()
+        return datetime.strptime(expires, '%Y-%m-%dT%H:%M:%S.%f'), f.read().decode() if kind == 'page' else None
+    except (OSError, UnicodeDecodeError, ValueError):
+      return None
+
+  def set(self, key, expires, body):
+    header = '%s %s\n' % (expires.strftime('%Y-%m-%dT%H:%M:%S.%f'), 'page' if body is not None else 'hold')
+    # write to a temporary file and rename, so readers never see half a page
+    fd, temp = tempfile.mkstemp(dir=self.directory)
+    with os.fdopen(fd, 'wb') as f:
+      f.write(header.encode('ascii'))
+      if body is not None:
+        f.write(body.encode())
+    os.replace(temp, self._path(key))
+
+  def delete(self, key):
+    try:
+      os.remove(self._path(key))
+    except OSError:
+      pass
+
+  def clear(self):
+    for name in os.listdir(self.directory):
+      if name.endswith(self.SUFFIX):
+        try:
+          os.remove(os.path.join(self.directory, name))
+        except OSError:
+          pass
+
+class PageCache(object):
+
+  def __init__(self, app=None):
+    self.store = None
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('PAGE_CACHE', 'lru')
+    app.config.setdefault('PAGE_CACHE_MAX_ENTRIES', 1000)
+    app.config.setdefault('PAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+    app.config.setdefault('PAGE_CACHE_DIR', os.path.join(app.instance_path, 'pages'))
+    app.config.setdefault('PAGE_CACHE_TTL', 3600)
+    app.config.setdefault('PAGE_CACHE_STAMP', os.path.join(app.instance_path, 'pagecache.stamp'))
+    backend = app.config['PAGE_CACHE']
+    if backend == 'lru':
+      self.store = LRUStore(app.config['PAGE_CACHE_MAX_ENTRIES'], app.config['PAGE_CACHE_MAX_BYTES'])
+    elif backend == 'filesystem':
+      self.store = FileSystemStore(app.config['PAGE_CACHE_DIR'])
+    elif backend:
+      raise ValueError('Unknown PAGE_CACHE backend %r' % backend)
+    app.extensions['pagecache'] = self
+    self.stamp = self._read_stamp(app.config['PAGE_CACHE_STAMP'])
+
+  @staticmethod
+  def _read_stamp(path):
+    try:
+      info = os.stat(path)
+    except OSError:
+      return None
+    return info.st_ino, info.st_mtime_ns
+
+  def _usable(self):
+    if self.store is None or session.get('_flashes'):
+      return False
+    stamp = self._read_stamp(current_app.config['PAGE_CACHE_STAMP'])
+    if stamp != self.stamp:
+      # another process cleared the cache
+      self.stamp = stamp
+      self.store.clear()
+    return True
+
+  def get(self, kind, id):
+    # the cached page, or None
+    if not self._usable():
+      return None
+    entry = self.store.get('%s:%s' % (kind, id))
+    if entry is None or entry[1] is None or entry[0] <= datetime.now():
+      return None
+    return entry[1]
+
+  def set(self, kind, id, body, expires=None):
+    if not self._usable():
+      return
+    key = '%s:%s' % (kind, id)
+    now = datetime.now()
+    entry = self.store.get(key)
+    if entry is not None and entry[1] is None and entry[0] > now:
+      # recently invalidated; see the note on replicas above
+      return
+    latest = now + timedelta(seconds=current_app.config['PAGE_CACHE_TTL'])
+    expires = min(expires, latest) if expires is not None else latest
+    if expires > now:
+      self.store.set(key, expires, body)
+
+  def invalidate(self, kind, *ids):
+    if self.store is None:
+      return
+    hold = 0
+    if current_app.config.get('SQLALCHEMY_REPLICA_BINDS'):
+      hold = current_app.config.get('REPLICA_STICKY_SECONDS', 0)
+    for id in ids:
+      key = '%s:%s' % (kind, id)
+      if hold:
+        self.store.set(key, datetime.now() + timedelta(seconds=hold), None)
+      else:
+        self.store.delete(key)
+
+  def clear(self):
+    if self.store is None:
+      return
+    self.store.clear()
+    path = current_app.config['PAGE_CACHE_STAMP']
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # a new file rather than a touch, so the change shows even within the
+    # resolution of the file system's timestamps
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path))
+    os.close(fd)
+    os.replace(temp, path)
+    self.stamp = self._read_stamp(path)
+
+#----------------------------------------------------------------------------#
+# Fyyur pages.
+#----------------------------------------------------------------------------#
+
+def cache():
+  return current_app.extensions.get('pagecache') or PageCache()
+
+def invalidate_venue(venue_id, artist_ids=None):
+  # the venue page and the pages of artists that list it next to their shows
+  # (artist_ids when they can no longer be looked up)
+  if artist_ids is None:
+    artist_ids = [r[0] for r in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+  cache().invalidate('venue', venue_id)
+  cache().invalidate('artist', *artist_ids)
+
+def invalidate_artist(artist_id):
+  venue_ids = [r[0] for r in db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()]
+  cache().invalidate('artist', artist_id)
+  cache().invalidate('venue', *venue_ids)
+
+def invalidate_show(venue_id, artist_id):
+  cache().invalidate('venue', venue_id)
+  cache().invalidate('artist', artist_id)
+
+def clear():
+  cache().clear()
@@ -0,0 +1,63 @@
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from flask import abort, current_app, request
+from sqlalchemy import tuple_
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#
+# Listing pages are walked with an opaque cursor holding the sort key of the
+# last row shown, so fetching any page is an index range scan of PAGE_SIZE
+# rows however deep into the table it is.
+#----------------------------------------------------------------------------#
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+def encode_cursor(values):
+  values = [{'dt': v.strftime(DATETIME_FORMAT)} if isinstance(v, datetime) else v for v in values]
+  return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+  # sort key values of the last row of the previous page, or None
+  if not cursor:
+    return None
+  try:
+    values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+    return [datetime.strptime(v['dt'], DATETIME_FORMAT) if isinstance(v, dict) else v for v in values]
+  except (ValueError, TypeError, KeyError):
+    abort(400)
+
+def page_size():
+  # ?per_page= bounded by MAX_PAGE_SIZE, PAGE_SIZE by default
+  default = current_app.config.get('PAGE_SIZE', 50)
+  size = request.values.get('per_page', default, type=int)
+  return max(1, min(size, current_app.config.get('MAX_PAGE_SIZE', 200)))
+
+def requested_page_size():
+  # ?per_page= as the client asked for it, to carry on to the next page
+  return request.values.get('per_page', type=int)
+
+def keyset_page(query, columns, cursor=None, per_page=None, key=None):
+  # one page of an ascending query ordered by columns (the last one unique);
+  # key maps a result row to its sort values, by default the named columns
+  per_page = per_page or page_size()
+  after = decode_cursor(cursor)
+  if after is not None:
+    if len(after) != len(columns):
+      abort(400)
+    if len(columns) == 1:
+      query = query.filter(columns[0] > after[0])
+    else:
+      query = query.filter(tuple_(*columns) > tuple_(*after))
+  rows = query.order_by(None).order_by(*columns).limit(per_page + 1).all()
+  next_cursor = None
+  if len(rows) > per_page:
+    rows = rows[:per_page]
+    last = rows[-1]
+    next_cursor = encode_cursor(key(last) if key else [getattr(last, c.key) for c in columns])
+  return Page(rows, next_cursor)
@@ -0,0 +1,105 @@
+from collections import namedtuple
+from datetime import datetime
+from itertools import groupby
+
+from models import db, Venue, Artist, Show, Genre, venue_genres, artist_genres
+from readmodels import read, row_type
+
+#----------------------------------------------------------------------------#
+# Show projections.
+#
+# Show rows are rendered together with the name and image of their artist and
+# venue. Building them one Show at a time costs four lookups per row, so these
+# helpers fetch every column the templates need in a single joined SELECT.
+#----------------------------------------------------------------------------#
+
+SHOW_COLUMNS = [
+  Show.id,
+  Show.start_time,
+  Show.artist_id,
+  Artist.name.label('artist_name'),
+  Artist.image_link.label('artist_image_link'),
+  Show.venue_id,
+  Venue.name.label('venue_name'),
+  Venue.image_link.label('venue_image_link')]
+
+ShowRow = row_type('ShowRow', SHOW_COLUMNS)
+
+def show_query(row_type=ShowRow, extra_columns=()):
+  # joined query yielding one flat row per show, ordered by start time;
+  # extra_columns are appended and must match the fields of row_type
+  joined = Show.__table__ \
+    .join(Artist.__table__, Show.artist_id == Artist.id) \
+    .join(Venue.__table__, Show.venue_id == Venue.id)
+  return read(row_type, SHOW_COLUMNS + list(extra_columns), joined) \
+    .order_by(Show.start_time, Show.id)
+
+def show_row_dict(row):
+  return {
+    "artist_id": row.artist_id,
+    "artist_name": row.artist_name,
+    "artist_image_link": row.artist_image_link,
+    "venue_id": row.venue_id,
+    "venue_name": row.venue_name,
+    "venue_image_link": row.venue_image_link,
+    "start_time": row.start_time
+  }
+
+def split_show_rows(query, now=None):
+  # split the shows of a venue or artist page into (past, upcoming) rows
+  now = now or datetime.now()
+  past, upcoming = [], []
+  for row in query:
+    (past if row.start_time < now else upcoming).append(show_row_dict(row))
+  return past, upcoming
+
+UpcomingCount = namedtuple('UpcomingCount', ['id', 'upcoming_shows_count'])
+
+def upcoming_show_counts(model, ids):
+  # {id: upcoming show count} for venues or artists, read from the counter
+  # column maintained by counters.py
+  if not ids:
+    return {}
+  return dict(read(UpcomingCount, [model.id, model.upcoming_shows_count]).filter(model.id.in_(ids)))
+
+#----------------------------------------------------------------------------#
+# Venue directory.
+#----------------------------------------------------------------------------#
+
+DIRECTORY_COLUMNS = [
+  Venue.city,
+  Venue.state,
+  Venue.id,
+  Venue.name,
+  Venue.upcoming_shows_count.label('num_upcoming_shows')]
+
+DirectoryRow = row_type('DirectoryRow', DIRECTORY_COLUMNS)
+
+def venue_directory_query(where=()):
+  # one row per venue with its upcoming show count, ordered so that venues of
+  # the same area are adjacent; where narrows it (see facets.criteria)
+  return read(DirectoryRow, DIRECTORY_COLUMNS).filter(*where).order_by(Venue.city, Venue.state, Venue.id)
+
+def venue_directory(where=()):
+  # yields {"city", "state", "venues"} areas as the rows stream in
+  rows = venue_directory_query(where).yield_per(500)
+  for (city, state), venues in groupby(rows, key=lambda r: (r.city, r.state)):
+    yield {
+      "city": city,
+      "state": state,
+      "venues": [{"id": v.id, "name": v.name, "num_upcoming_shows": v.num_upcoming_shows} for v in venues]
+    }
+
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
+
+GENRE_LINKS = {Venue: venue_genres.c.venue_id, Artist: artist_genres.c.artist_id}
+
+def genre_members(key, genre):
+  # subquery of venue or artist ids tagged with the named genre, answered
+  # from the unique Genre.name index and the (genre_id, ...) link index
+  return db.session.query(key) \
+    .join(Genre, Genre.id == key.table.c.genre_id) \
+    .filter(Genre.name == genre) \
+    .subquery()
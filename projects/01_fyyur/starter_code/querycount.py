@@ -0,0 +1,154 @@
+import json
+import logging
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Query counting.
+#
+# QueryCounter listens to every SQLAlchemy engine and records the statements
+# each request runs: how many, how long they took, and which statements ran
+# repeatedly with different parameters -- the signature of an N+1 lazy load.
+#
+#   QUERYCOUNT_HEADERS     add X-Query-Count / X-Query-Time / X-Query-Repeated
+#                          to responses (default: app.debug)
+#   QUERYCOUNT_ENDPOINT    serve recent requests as JSON at this URL when set,
+#                          e.g. '/_debug/queries'
+#   QUERYCOUNT_REPEATED    executions of one statement that count as an N+1
+#                          (default 3)
+#   QUERYCOUNT_HISTORY     requests kept for the endpoint (default 50)
+#----------------------------------------------------------------------------#
+
+logger = logging.getLogger(__name__)
+
+# QueryStats of the open capture() blocks
+_captures = []
+
+class QueryStats(object):
+  """Statements recorded for one request or one capture() block."""
+
+  def __init__(self, repeated_threshold=3):
+    self.repeated_threshold = repeated_threshold
+    self.count = 0
+    self.seconds = 0.0
+    # statement text -> set of parameter reprs
+    self.statements = {}
+
+  def record(self, statement, parameters, seconds):
+    self.count += 1
+    self.seconds += seconds
+    self.statements.setdefault(statement, set()).add(repr(parameters))
+
+  @property
+  def repeated(self):
+    # statements run at least repeated_threshold times with different parameters
+    return dict((s, len(p)) for s, p in self.statements.items() if len(p) >= self.repeated_threshold)
+
+  def as_dict(self):
+    return {
+      'count': self.count,
+      'ms': round(self.seconds * 1000, 3),
+      'repeated': [{'statement': _squash(s), 'times': n} for s, n in self.repeated.items()],
+    }
+
+def _squash(statement):
+  return re.sub(r'\s+', ' ', statement).strip()
+
+class QueryCounter(object):
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('QUERYCOUNT_HEADERS', app.debug)
+    app.config.setdefault('QUERYCOUNT_ENDPOINT', None)
+    app.config.setdefault('QUERYCOUNT_REPEATED', 3)
+    app.config.setdefault('QUERYCOUNT_HISTORY', 50)
+    app.extensions['querycount'] = self
+    self.history = deque(maxlen=app.config['QUERYCOUNT_HISTORY'])
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+      event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+      event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+      event.listen(Engine, 'handle_error', _handle_error)
+
+    app.after_request(self._after_request)
+    if app.config['QUERYCOUNT_ENDPOINT']:
+      app.add_url_rule(app.config['QUERYCOUNT_ENDPOINT'], 'querycount', self._endpoint)
+
+  def _after_request(self, response):
+    stats = g.pop('_querycount', None)
+    if stats is None:
+      return response
+    repeated = stats.repeated
+    for statement, times in repeated.items():
+      logger.warning('%s %s ran %d times: %s', request.method, request.path, times, _squash(statement))
+    self.history.append(dict(stats.as_dict(), method=request.method, path=request.full_path.rstrip('?'),
+                             status=response.status_code))
+    if current_app.config['QUERYCOUNT_HEADERS']:
+      response.headers['X-Query-Count'] = str(stats.count)
+      response.headers['X-Query-Time'] = '%.3f' % (stats.seconds * 1000)
+      response.headers['X-Query-Repeated'] = str(len(repeated))
+    return response
+
+  def _endpoint(self):
+    return Response(json.dumps(list(reversed(self.history)), indent=2), mimetype='application/json')
+
+  @contextmanager
+  def capture(self, repeated_threshold=3):
+    """Record every statement run inside the block, in or out of a request.
+
+      with counter.capture() as stats:
+        client.get('/venues')
+      assert stats.count <= 2
+    """
+    stats = QueryStats(repeated_threshold)
+    _captures.append(stats)
+    try:
+      yield stats
+    finally:
+      _captures.remove(stats)
+
+  @contextmanager
+  def budget(self, max_queries, allow_repeated=False):
+    """Fail with AssertionError when the block runs more than max_queries
+    statements, or repeats one with different parameters."""
+    with self.capture() as stats:
+      yield stats
+    if stats.count > max_queries:
+      raise AssertionError('%d queries, budget is %d' % (stats.count, max_queries))
+    if stats.repeated and not allow_repeated:
+      raise AssertionError('repeated queries: %s' % json.dumps(stats.as_dict()['repeated']))
+
+def _targets():
+  # QueryStats objects that should see the statement being executed
+  targets = list(_captures)
+  if has_request_context() and 'querycount' in current_app.extensions:
+    if '_querycount' not in g:
+      g._querycount = QueryStats(current_app.config['QUERYCOUNT_REPEATED'])
+    targets.append(g._querycount)
+  return targets
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  conn.info.setdefault('_querycount_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  started = conn.info['_querycount_started'].pop()
+  seconds = time.perf_counter() - started
+  for stats in _targets():
+    stats.record(statement, parameters, seconds)
+
+def _handle_error(context):
+  # a failed statement still counts
+  if context.connection is None or not context.connection.info.get('_querycount_started'):
+    return
+  started = context.connection.info['_querycount_started'].pop()
+  for stats in _targets():
+    stats.record(context.statement, context.parameters, time.perf_counter() - started)
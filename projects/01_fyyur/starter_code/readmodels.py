@@ -0,0 +1,106 @@
+from collections import namedtuple
+
+from sqlalchemy import func, select
+
+from models import db, Venue, Artist, Genre, venue_genres, artist_genres
+
+#----------------------------------------------------------------------------#
+# Read models.
+#
+# Read-only pages only need a handful of columns, so they select exactly
+# those with Core and get plain namedtuples back: no ORM instances, identity
+# map entries or attribute instrumentation per row. ReadQuery mirrors the
+# parts of the Query API the listing helpers use (filter, order_by, limit,
+# all, iteration, count), so pagination works on either.
+#----------------------------------------------------------------------------#
+
+def row_type(name, columns):
+  # namedtuple class whose fields are the (label) keys of columns
+  return namedtuple(name, [c.key for c in columns])
+
+class ReadQuery(object):
+
+  def __init__(self, row_type, statement):
+    self.row_type = row_type
+    self.statement = statement
+
+  def _with(self, statement):
+    return ReadQuery(self.row_type, statement)
+
+  def filter(self, *criteria):
+    statement = self.statement
+    for criterion in criteria:
+      statement = statement.where(criterion)
+    return self._with(statement)
+
+  def order_by(self, *clauses):
+    return self._with(self.statement.order_by(*clauses))
+
+  def limit(self, limit):
+    return self._with(self.statement.limit(limit))
+
+  def yield_per(self, count):
+    # stream rows from the cursor instead of buffering the whole result
+    return self._with(self.statement.execution_options(stream_results=True))
+
+  def __iter__(self):
+    make = self.row_type._make
+    for row in db.session.execute(self.statement):
+      yield make(row)
+
+  def all(self):
+    make = self.row_type._make
+    return [make(row) for row in db.session.execute(self.statement).fetchall()]
+
+  def first(self):
+    rows = self.limit(1).all()
+    return rows[0] if rows else None
+
+  def count(self):
+    counted = self.statement.order_by(None).alias('counted')
+    return db.session.execute(select([func.count()]).select_from(counted)).scalar()
+
+def read(row_type, columns, from_obj=None):
+  # ReadQuery selecting columns into row_type, from the tables of the columns
+  # unless a join is given
+  statement = select(columns)
+  if from_obj is not None:
+    statement = statement.select_from(from_obj)
+  return ReadQuery(row_type, statement)
+
+NamedRow = namedtuple('NamedRow', ['id', 'name'])
+
+def names(model):
+  # (id, name) rows of venues or artists
+  return read(NamedRow, [model.id, model.name])
+
+#----------------------------------------------------------------------------#
+# Venue and artist details.
+#----------------------------------------------------------------------------#
+
+VENUE_COLUMNS = [Venue.id, Venue.name, Venue.address, Venue.city, Venue.state, Venue.phone,
+                 Venue.website, Venue.facebook_link, Venue.seeking_talent, Venue.seeking_description,
+                 Venue.image_link]
+ARTIST_COLUMNS = [Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone, Artist.website,
+                  Artist.facebook_link, Artist.seeking_venue, Artist.seeking_description, Artist.image_link]
+
+VenueDetail = namedtuple('VenueDetail', [c.key for c in VENUE_COLUMNS] + ['genres'])
+ArtistDetail = namedtuple('ArtistDetail', [c.key for c in ARTIST_COLUMNS] + ['genres'])
+
+def _detail(detail_type, columns, model, link, key, id):
+  row = db.session.execute(select(columns).where(model.id == id)).first()
+  if row is None:
+    return None
+  genres = db.session.execute(
+    select([Genre.name])
+    .select_from(link.join(Genre.__table__, Genre.id == link.c.genre_id))
+    .where(key == id)
+    .order_by(Genre.name))
+  return detail_type(*row, genres=[g for g, in genres])
+
+def venue_detail(venue_id):
+  # VenueDetail of the venue with its genre names, or None
+  return _detail(VenueDetail, VENUE_COLUMNS, Venue, venue_genres, venue_genres.c.venue_id, venue_id)
+
+def artist_detail(artist_id):
+  return _detail(ArtistDetail, ARTIST_COLUMNS, Artist, artist_genres, artist_genres.c.artist_id, artist_id)
@@ -0,0 +1,151 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from models import db, Venue, Artist, Show, similar_items, similar_builds
+from importer import insert_rows
+from readmodels import read
+import pagecache
+
+#----------------------------------------------------------------------------#
+# Recommendations.
+#
+# Artists are similar when they play the same venues, and venues when they
+# host the same artists: the cosine similarity of the rows (or columns) of
+# the artist x venue matrix of show counts, damped with log1p. build() works
+# out the top TOP_K of every artist and venue offline with NumPy/SciPy, which
+# only the job imports, and stores them in similar_items, so a page reads
+# its list with one primary key range scan.
+#
+# An incremental build redoes only what can have changed since the
+# watermark of the last build: artists and venues with new or moved shows,
+# and every artist or venue sharing a venue or artist with them. Deleted
+# shows are only accounted for by a full build.
+#----------------------------------------------------------------------------#
+
+TOP_K = 10
+# rows of the similarity product computed at a time
+CHUNK = 1000
+# shows written shortly before the watermark are looked at again, in case
+# their transaction committed after it was taken
+OVERLAP = timedelta(minutes=5)
+KINDS = {Artist: 'artist', Venue: 'venue'}
+
+def _unit_rows(matrix, np, sparse):
+  # matrix with every row scaled to length 1
+  norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+  norms[norms == 0] = 1
+  return (sparse.diags(1 / norms) @ matrix).tocsr()
+
+def _neighbors(unit, rows, np):
+  # rows sharing at least one column with any of rows
+  found = set()
+  for start in range(0, len(rows), CHUNK):
+    found.update((unit[rows[start:start + CHUNK]] @ unit.T).indices.tolist())
+  return np.array(sorted(found), dtype=np.int64)
+
+def _top_k(unit, rows, k, np):
+  # yields (row, columns, scores) of the k rows most similar to each of rows
+  for start in range(0, len(rows), CHUNK):
+    chunk = rows[start:start + CHUNK]
+    product = (unit[chunk] @ unit.T).tocsr()
+    for i, row in enumerate(chunk):
+      lo, hi = product.indptr[i], product.indptr[i + 1]
+      columns, scores = product.indices[lo:hi], product.data[lo:hi]
+      keep = columns != row
+      columns, scores = columns[keep], scores[keep]
+      if len(scores) > k:
+        best = np.argpartition(-scores, k)[:k]
+        columns, scores = columns[best], scores[best]
+      order = np.lexsort((columns, -scores))
+      yield row, columns[order], scores[order]
+
+def _store(connection, kind, ids, results, replaced):
+  # write the results of kind; replaced are the item ids whose rows go,
+  # None for all of them
+  items = similar_items
+  if replaced is None:
+    connection.execute(items.delete().where(items.c.kind == kind))
+  else:
+    replaced = sorted(replaced)
+    for start in range(0, len(replaced), CHUNK):
+      connection.execute(items.delete().where(items.c.kind == kind)
+                         .where(items.c.item_id.in_(replaced[start:start + CHUNK])))
+  rows = []
+  for row, columns, scores in results:
+    rows.extend({'kind': kind, 'item_id': int(ids[row]), 'rank': rank,
+                 'similar_id': int(ids[column]), 'score': float(score)}
+                for rank, (column, score) in enumerate(zip(columns, scores)))
+    if len(rows) >= 10000:
+      insert_rows(connection, items, rows)
+      rows = []
+  insert_rows(connection, items, rows)
+
+def build(full=False, top_k=TOP_K):
+  """Recompute the similar artists and venues that may have changed since
+  the last build, or all of them; returns the (artists, venues) updated."""
+  import numpy as np
+  from scipy import sparse
+
+  shows = Show.__table__
+  with db.engine.connect() as connection:
+    last = connection.execute(
+      select([similar_builds.c.watermark]).order_by(similar_builds.c.id.desc()).limit(1)).first()
+    full = full or last is None
+    watermark = connection.execute(select([func.max(shows.c.updated_at)])).scalar()
+    changed = None
+    if not full:
+      query = select([shows.c.artist_id, shows.c.venue_id]).distinct()
+      if last.watermark is not None:
+        query = query.where(shows.c.updated_at > last.watermark - OVERLAP)
+      changed = connection.execute(query).fetchall()
+    pairs = []
+    if full or changed:
+      pairs = connection.execute(
+        select([shows.c.artist_id, shows.c.venue_id, func.count()])
+        .group_by(shows.c.artist_id, shows.c.venue_id)).fetchall()
+
+  pairs = np.array(pairs, dtype=np.int64).reshape(-1, 3)
+  artist_ids, artist_rows = np.unique(pairs[:, 0], return_inverse=True)
+  venue_ids, venue_columns = np.unique(pairs[:, 1], return_inverse=True)
+  counts = sparse.csr_matrix((np.log1p(pairs[:, 2]), (artist_rows, venue_columns)),
+                             shape=(len(artist_ids), len(venue_ids)))
+
+  updated = {}
+  with db.engine.begin() as connection:
+    for model, ids, matrix, position in ((Artist, artist_ids, counts, 0), (Venue, venue_ids, counts.T, 1)):
+      unit = _unit_rows(matrix.tocsr(), np, sparse)
+      if full:
+        rows, replaced = np.arange(len(ids)), None
+      else:
+        seeds = set(c[position] for c in changed)
+        index = dict(zip(ids.tolist(), range(len(ids))))
+        rows = _neighbors(unit, np.array(sorted(index[i] for i in seeds if i in index), dtype=np.int64), np)
+        # items with no shows left lose their list
+        replaced = seeds | set(ids[rows].tolist())
+      _store(connection, KINDS[model], ids, _top_k(unit, rows, top_k, np), replaced)
+      updated[model] = len(ids) if full else len(replaced)
+      if not full:
+        pagecache.cache().invalidate(KINDS[model], *sorted(replaced))
+    connection.execute(similar_builds.insert().values(
+      built_at=datetime.utcnow(), watermark=watermark, full=full, artists=updated[Artist], venues=updated[Venue]))
+  if full:
+    pagecache.clear()
+  return updated[Artist], updated[Venue]
+
+#----------------------------------------------------------------------------#
+# Pages.
+#----------------------------------------------------------------------------#
+
+SimilarRow = namedtuple('SimilarRow', ['id', 'name', 'image_link', 'score'])
+
+def similar(model, id, limit=TOP_K):
+  # [(id, name, image_link, score)] of the artists or venues most like id
+  items = similar_items
+  return read(SimilarRow, [model.id, model.name, model.image_link, items.c.score],
+              items.join(model.__table__, model.id == items.c.similar_id)) \
+    .filter(items.c.kind == KINDS[model], items.c.item_id == id) \
+    .order_by(items.c.rank) \
+    .limit(limit) \
+    .all()
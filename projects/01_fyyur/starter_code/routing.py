@@ -0,0 +1,77 @@
+import random
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+
+#----------------------------------------------------------------------------#
+# Read/write routing.
+#
+# GET and HEAD requests read from one of the replica binds named in
+# SQLALCHEMY_REPLICA_BINDS (entries of SQLALCHEMY_BINDS), picked at random
+# once per request. Everything else -- form submissions, deletes, CLI
+# commands, anything outside a request -- uses the primary, and so does a
+# request once it has flushed a write. After a request that wrote, the client
+# gets a cookie sending its reads to the primary for REPLICA_STICKY_SECONDS,
+# so people see their own changes while the replicas catch up.
+#----------------------------------------------------------------------------#
+
+READ_METHODS = ('GET', 'HEAD')
+STICKY_COOKIE = 'fyyur_primary_until'
+
+class RoutingSession(SignallingSession):
+
+  def __init__(self, db, **options):
+    self.db = db
+    SignallingSession.__init__(self, db, **options)
+
+  def replica(self):
+    # bind key of the replica this request reads from, or None for the primary
+    if self._flushing or not has_request_context():
+      return None
+    if g.get('db_route') != 'replica' or g.get('db_wrote'):
+      return None
+    keys = self.app.config.get('SQLALCHEMY_REPLICA_BINDS')
+    if not keys:
+      return None
+    if g.get('db_replica') not in keys:
+      g.db_replica = random.choice(keys)
+    return g.db_replica
+
+  def get_bind(self, mapper=None, clause=None):
+    if mapper is None or not getattr(mapper.persist_selectable, 'info', {}).get('bind_key'):
+      replica = self.replica()
+      if replica is not None:
+        return self.db.get_engine(self.app, bind=replica)
+    return SignallingSession.get_bind(self, mapper, clause)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_write(session, flush_context):
+  if has_request_context():
+    g.db_wrote = True
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+  def init_app(self, app):
+    app.config.setdefault('SQLALCHEMY_REPLICA_BINDS', [])
+    app.config.setdefault('REPLICA_STICKY_SECONDS', 10)
+    SQLAlchemy.init_app(self, app)
+    app.before_request(_choose_route)
+    app.after_request(_stick_to_primary)
+
+def _choose_route():
+  sticky = request.cookies.get(STICKY_COOKIE, 0, type=float) > time.time()
+  g.db_route = 'replica' if request.method in READ_METHODS and not sticky else 'primary'
+  g.db_replica = None
+  g.db_wrote = False
+
+def _stick_to_primary(response):
+  seconds = current_app.config['REPLICA_STICKY_SECONDS']
+  if current_app.config['SQLALCHEMY_REPLICA_BINDS'] and seconds and \
+      (g.get('db_wrote') or request.method not in READ_METHODS):
+    response.set_cookie(STICKY_COOKIE, '%.3f' % (time.time() + seconds), max_age=seconds, httponly=True)
+  return response
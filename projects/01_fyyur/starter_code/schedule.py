@@ -0,0 +1,117 @@
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import dateutil.parser
+from flask import abort
+
+from models import Venue, Show
+from projections import show_query, ShowRow
+
+#----------------------------------------------------------------------------#
+# Show calendar.
+#
+# Shows starting inside a time window, optionally narrowed to a city, state,
+# venue or artist. On PostgreSQL the Show table is range partitioned by month
+# (see migration a9c4e1f7b2d6), so a window query only reads the partitions it
+# overlaps; shows outside every monthly partition land in "Show_default".
+#----------------------------------------------------------------------------#
+
+DEFAULT_WINDOW = timedelta(days=7)
+MAX_WINDOW = timedelta(days=93)
+PARTITION_PREFIX = 'Show_p'
+DEFAULT_PARTITION = 'Show_default'
+
+def parse_window(start=None, end=None, now=None):
+  # (start, end) of a calendar request; a bare end date includes that day
+  try:
+    start = dateutil.parser.parse(start) if start else (now or datetime.now())
+    if end and re.match(r'^\d{4}-\d{2}-\d{2}$', end):
+      end = dateutil.parser.parse(end) + timedelta(days=1)
+    else:
+      end = dateutil.parser.parse(end) if end else start + DEFAULT_WINDOW
+  except (ValueError, OverflowError):
+    abort(400)
+  if start.tzinfo is not None or end.tzinfo is not None or not start < end <= start + MAX_WINDOW:
+    abort(400)
+  return start, end
+
+CalendarRow = namedtuple('CalendarRow', ShowRow._fields + ('duration', 'city', 'state'))
+
+def calendar_query(start, end, city=None, state=None, venue_id=None, artist_id=None):
+  # shows starting in [start, end), in show_query order plus venue city and state
+  query = show_query(CalendarRow, [Show.duration, Venue.city, Venue.state]) \
+    .filter(Show.start_time >= start, Show.start_time < end)
+  if city:
+    query = query.filter(Venue.city == city)
+  if state:
+    query = query.filter(Venue.state == state)
+  if venue_id is not None:
+    query = query.filter(Show.venue_id == venue_id)
+  if artist_id is not None:
+    query = query.filter(Show.artist_id == artist_id)
+  return query
+
+def calendar_row(row):
+  return {
+    "id": row.id,
+    "start_time": row.start_time.isoformat(),
+    "duration": row.duration,
+    "venue_id": row.venue_id,
+    "venue_name": row.venue_name,
+    "city": row.city,
+    "state": row.state,
+    "artist_id": row.artist_id,
+    "artist_name": row.artist_name,
+    "artist_image_link": row.artist_image_link,
+  }
+
+#----------------------------------------------------------------------------#
+# Monthly partitions (PostgreSQL).
+#----------------------------------------------------------------------------#
+
+def month_start(value):
+  return datetime(value.year, value.month, 1)
+
+def add_months(month, count):
+  index = month.year * 12 + month.month - 1 + count
+  return datetime(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+  return '%s%04d_%02d' % (PARTITION_PREFIX, month.year, month.month)
+
+def include_object(object, name, type_, reflected, compare_to):
+  # partitions are managed here and by `flask fyyur partitions`, not by
+  # alembic autogenerate
+  return not (type_ == 'table' and (name.startswith(PARTITION_PREFIX) or name == DEFAULT_PARTITION))
+
+def is_partitioned(connection):
+  if connection.dialect.name != 'postgresql':
+    return False
+  return connection.execute(
+    "SELECT relkind = 'p' FROM pg_class WHERE oid = '\"Show\"'::regclass").scalar()
+
+def create_partitions(connection, first, last):
+  """Create the monthly partitions from first to last (inclusive) that do not
+  exist yet, moving any of their rows out of the default partition; returns
+  the names created."""
+  existing = set(r[0] for r in connection.execute(
+    "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+    "WHERE i.inhparent = '\"Show\"'::regclass"))
+  created = []
+  month = month_start(first)
+  while month <= last:
+    name = partition_name(month)
+    if name not in existing:
+      bounds = (month.strftime('%Y-%m-%d'), add_months(month, 1).strftime('%Y-%m-%d'))
+      # attaching checks that the default partition holds no rows of the new
+      # range, so they are moved over first
+      connection.execute('CREATE TABLE "%s" (LIKE "Show" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)' % name)
+      connection.execute(
+        'WITH moved AS (DELETE FROM "%s" WHERE start_time >= %%s AND start_time < %%s RETURNING *) '
+        'INSERT INTO "%s" SELECT * FROM moved' % (DEFAULT_PARTITION, name), bounds)
+      connection.execute(
+        'ALTER TABLE "Show" ATTACH PARTITION "%s" FOR VALUES FROM (\'%s\') TO (\'%s\')' % ((name,) + bounds))
+      created.append(name)
+    month = add_months(month, 1)
+  return created
@@ -0,0 +1,276 @@
+import re
+import threading
+from collections import namedtuple
+from bisect import bisect_left, bisect_right
+
+from sqlalchemy import and_, case, event, func, literal_column, or_, select, union
+from sqlalchemy.orm import Session
+
+from models import db, Venue, Artist, Genre
+from projections import upcoming_show_counts, GENRE_LINKS
+from readmodels import read
+from pagination import decode_cursor, encode_cursor, page_size
+
+#----------------------------------------------------------------------------#
+# Search.
+#
+# Venue and artist search ranks matches on name, genres, city and state.
+# PostgreSQL answers from the search_vector and trigram indexes created by
+# migration 5c1e7a9b3d20 (genres are matched through the Genre tables since
+# 8d4b2f61c7a3). Other databases (SQLite for local and test runs) use
+# an inverted index kept in process memory, which is filled on first use and
+# kept current from the session's flush/commit events.
+#----------------------------------------------------------------------------#
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text):
+  return TOKEN.findall((text or '').lower())
+
+def like_pattern(term):
+  # the term matched literally in LIKE, with / escaping the wildcards
+  return term.replace('/', '//').replace('%', '/%').replace('_', '/_')
+
+def include_object(object, name, type_, reflected, compare_to):
+  # keep alembic autogenerate from dropping the database-maintained column
+  return not (type_ == 'column' and name == 'search_vector')
+
+
+class InvertedIndex(object):
+  # every suffix of every token is a key, so a prefix lookup over the sorted
+  # keys finds substrings as well as word starts; word starts score double
+  FIELD_WEIGHTS = {'name': 4, 'genres': 2, 'city': 1, 'state': 1}
+
+  def __init__(self):
+    self.postings = {}
+    self.docs = {}
+    self._keys = None
+
+  def add(self, doc_id, name, fields):
+    self.discard(doc_id)
+    keys = {}
+    for field, text in fields.items():
+      weight = self.FIELD_WEIGHTS[field]
+      for token in tokenize(text):
+        for i in range(len(token)):
+          score = weight * (2 if i == 0 else 1)
+          if keys.get(token[i:], 0) < score:
+            keys[token[i:]] = score
+    for key, score in keys.items():
+      self.postings.setdefault(key, {})[doc_id] = score
+    self.docs[doc_id] = (name, list(keys))
+    self._keys = None
+
+  def discard(self, doc_id):
+    doc = self.docs.pop(doc_id, None)
+    if doc is None:
+      return
+    for key in doc[1]:
+      postings = self.postings[key]
+      del postings[doc_id]
+      if not postings:
+        del self.postings[key]
+    self._keys = None
+
+  def _lookup(self, prefix):
+    if self._keys is None:
+      self._keys = sorted(self.postings)
+    keys = self._keys
+    matches = {}
+    i = bisect_left(keys, prefix)
+    while i < len(keys) and keys[i].startswith(prefix):
+      for doc_id, score in self.postings[keys[i]].items():
+        if matches.get(doc_id, 0) < score:
+          matches[doc_id] = score
+      i += 1
+    return matches
+
+  def search(self, term):
+    # [(id, name, score)], best first; every token of the term must match
+    tokens = tokenize(term)
+    if not tokens:
+      scores = dict.fromkeys(self.docs, 0)
+    else:
+      scores = self._lookup(tokens[0])
+      for token in tokens[1:]:
+        if not scores:
+          break
+        matches = self._lookup(token)
+        scores = {d: s + matches[d] for d, s in scores.items() if d in matches}
+    ranked = sorted(scores, key=lambda d: (-scores[d], d))
+    return [(d, self.docs[d][0], scores[d]) for d in ranked]
+
+
+def document(id, name, genres, city, state):
+  return id, name, {'name': name, 'genres': ' '.join(genres), 'city': city, 'state': state}
+
+def object_document(obj):
+  return document(obj.id, obj.name, [g.name for g in obj.genres], obj.city, obj.state)
+
+
+GenreLink = namedtuple('GenreLink', ['id', 'genre'])
+Document = namedtuple('Document', ['id', 'name', 'city', 'state'])
+Match = namedtuple('Match', ['id', 'name', 'rank'])
+
+class MemorySearch(object):
+
+  def __init__(self, model):
+    self.model = model
+    self.index = None
+    self.lock = threading.Lock()
+
+  def load(self):
+    index = InvertedIndex()
+    m = self.model
+    key = GENRE_LINKS[m]
+    genres = {}
+    links = read(GenreLink, [key, Genre.name], key.table.join(Genre.__table__, Genre.id == key.table.c.genre_id))
+    for entity_id, name in links:
+      genres.setdefault(entity_id, []).append(name)
+    for row in read(Document, [m.id, m.name, m.city, m.state]).yield_per(1000):
+      index.add(*document(row.id, row.name, genres.get(row.id, ()), row.city, row.state))
+    return index
+
+  def search(self, term):
+    with self.lock:
+      if self.index is None:
+        self.index = self.load()
+      return self.index.search(term)
+
+  def page(self, term, after, per_page):
+    # (rows, total) of the ranked matches following the (score, id) cursor
+    ranked = self.search(term)
+    start = 0
+    if after is not None:
+      start = bisect_right([(-score, i) for i, name, score in ranked], (-after[0], after[1]))
+    return ranked[start:start + per_page + 1], len(ranked)
+
+  def apply(self, changes):
+    with self.lock:
+      if self.index is None:
+        return
+      for op, args in changes:
+        if op == 'add':
+          self.index.add(*args)
+        elif op == 'discard':
+          self.index.discard(args)
+        else:
+          self.index = None
+          return
+
+  def invalidate(self):
+    with self.lock:
+      self.index = None
+
+
+class PostgresSearch(object):
+
+  def __init__(self, model):
+    self.model = model
+    self.vector = literal_column('"%s".search_vector' % model.__tablename__)
+
+  def query(self, term):
+    m = self.model
+    tokens = tokenize(term)
+    if not tokens:
+      rank = literal_column('0.0').label('rank')
+      return read(Match, [m.id, m.name, rank]), rank
+    tsquery = func.to_tsquery('simple', ' & '.join(t + ':*' for t in tokens))
+    pattern = like_pattern(term)
+    key = GENRE_LINKS[m]
+    genre_ids = select([key]) \
+      .select_from(key.table.join(Genre.__table__, Genre.id == key.table.c.genre_id)) \
+      .where(Genre.name.ilike(pattern + '%', escape='/'))
+    # one branch per index (search_vector, name trigrams, the genre links):
+    # ORed together in one WHERE, the genre EXISTS keeps PostgreSQL from
+    # using any of them
+    matches = union(select([m.id]).where(self.vector.op('@@')(tsquery)),
+                    select([m.id]).where(m.name.ilike('%' + pattern + '%', escape='/')),
+                    genre_ids)
+    rank = (func.ts_rank(self.vector, tsquery) + func.similarity(m.name, term)
+            + case([(m.id.in_(genre_ids), 0.5)], else_=0))
+    query = read(Match, [m.id, m.name, rank.label('rank')]).filter(m.id.in_(matches))
+    return query, rank
+
+  def search(self, term):
+    query, rank = self.query(term)
+    return list(query.order_by(rank.desc(), self.model.id))
+
+  def page(self, term, after, per_page):
+    query, rank = self.query(term)
+    total = query.order_by(None).count()
+    if after is not None:
+      query = query.filter(or_(rank < after[0], and_(rank == after[0], self.model.id > after[1])))
+    rows = query.order_by(rank.desc(), self.model.id).limit(per_page + 1)
+    return list(rows), total
+
+
+_memory = {}
+
+def searcher(model):
+  if db.engine.dialect.name == 'postgresql':
+    return PostgresSearch(model)
+  key = (str(db.engine.url), model)
+  if key not in _memory:
+    _memory[key] = MemorySearch(model)
+  return _memory[key]
+
+def invalidate(model=None):
+  # drop in-process indexes after writes that bypass the ORM (bulk loads)
+  for (url, m), s in _memory.items():
+    if model is None or m is model:
+      s.invalidate()
+
+def _search(model, term, cursor=None, per_page=None):
+  # one page of ranked matches: (data, next_cursor, total)
+  per_page = per_page or page_size()
+  rows, total = searcher(model).page(term, decode_cursor(cursor), per_page)
+  next_cursor = None
+  if len(rows) > per_page:
+    rows = rows[:per_page]
+    next_cursor = encode_cursor([float(rows[-1][2]), rows[-1][0]])
+  counts = upcoming_show_counts(model, [r[0] for r in rows])
+  data = [{"id": i, "name": name, "num_upcoming_shows": counts.get(i, 0)} for i, name, score in rows]
+  return data, next_cursor, total
+
+def search_venues(term, cursor=None, per_page=None):
+  return _search(Venue, term, cursor, per_page)
+
+def search_artists(term, cursor=None, per_page=None):
+  return _search(Artist, term, cursor, per_page)
+
+#----------------------------------------------------------------------------#
+# Index maintenance.
+#----------------------------------------------------------------------------#
+
+SEARCHABLE = (Venue, Artist)
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+  changes = session.info.setdefault('search_changes', [])
+  for obj in session.new | session.dirty:
+    if isinstance(obj, SEARCHABLE):
+      changes.append((type(obj), ('add', object_document(obj))))
+  for obj in session.deleted:
+    if isinstance(obj, SEARCHABLE):
+      changes.append((type(obj), ('discard', obj.id)))
+
+@event.listens_for(Session, 'after_bulk_delete')
+@event.listens_for(Session, 'after_bulk_update')
+def _collect_bulk_changes(context):
+  for model in SEARCHABLE:
+    if context.primary_table is model.__table__:
+      context.session.info.setdefault('search_changes', []).append((model, ('reset', None)))
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+  changes = session.info.pop('search_changes', None)
+  if not changes or session.bind is None:
+    return
+  for (url, model), s in list(_memory.items()):
+    if url == str(session.bind.url):
+      s.apply([c for m, c in changes if m is model])
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+  session.info.pop('search_changes', None)
@@ -0,0 +1,106 @@
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from forms import VenueForm
+from models import db, Venue, Artist, Show, venue_genres, artist_genres
+from importer import reserve_ids, insert_rows, genre_ids
+import counters
+import search
+import availability
+import pagecache
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#
+# Fills the database with venues, artists and shows shaped like a live
+# catalog rather than a uniform one: a few hot venues and artists carry most
+# of the shows (Zipf weights), cities are unevenly sized, and most shows are
+# in the past. Rows are written in batches through the importer's loaders.
+#----------------------------------------------------------------------------#
+
+BATCH_SIZE = 5000
+GENRES = [value for value, label in VenueForm.genres.kwargs['choices']]
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'),
+          ('Austin', 'TX'), ('Seattle', 'WA'), ('Nashville', 'TN'), ('New Orleans', 'LA'),
+          ('Portland', 'OR'), ('Denver', 'CO'), ('Atlanta', 'GA'), ('Boston', 'MA')]
+WORDS = ['Blue', 'Velvet', 'Electric', 'Midnight', 'Golden', 'Wild', 'Silver', 'Hidden',
+         'Broken', 'Neon', 'Lucky', 'Little', 'Grand', 'Rusty', 'Crimson', 'Echo']
+VENUE_KINDS = ['Hall', 'Lounge', 'Club', 'Bar', 'Theatre', 'Room', 'Garden', 'Stage']
+ARTIST_KINDS = ['Band', 'Trio', 'Quartet', 'Collective', 'Orchestra', 'Project', 'Sound', 'Kids']
+
+def zipf_weights(count, exponent):
+  # cumulative weights of ranks 1..count, for random.choices(cum_weights=)
+  return list(accumulate(1.0 / (rank ** exponent) for rank in range(1, count + 1)))
+
+def _name(rng, kinds, number):
+  return '%s %s %s %d' % (rng.choice(WORDS), rng.choice(WORDS), rng.choice(kinds), number)
+
+def _owners(connection, model, link, key, count, kinds, rng, city_weights):
+  # insert count venues or artists with one to three genres each; returns their ids
+  table = model.__table__
+  ids = []
+  for start in range(0, count, BATCH_SIZE):
+    size = min(BATCH_SIZE, count - start)
+    batch_ids = reserve_ids(connection, table, size)
+    rows, links = [], []
+    for id in batch_ids:
+      city, state = rng.choices(CITIES, cum_weights=city_weights)[0]
+      row = {'id': id, 'name': _name(rng, kinds, id), 'city': city, 'state': state,
+             'phone': '%03d-%03d-%04d' % (rng.randint(200, 999), rng.randint(0, 999), rng.randint(0, 9999)),
+             'image_link': 'https://picsum.photos/seed/%s%d/300' % (key[0], id)}
+      if model is Venue:
+        row['address'] = '%d %s St' % (rng.randint(1, 9999), rng.choice(WORDS))
+        row['seeking_talent'] = rng.random() < 0.3
+      else:
+        row['seeking_venue'] = rng.random() < 0.3
+      rows.append(row)
+      links.extend((id, g) for g in rng.sample(GENRES, rng.randint(1, 3)))
+    insert_rows(connection, table, rows)
+    by_name = genre_ids(connection, [g for id, g in links])
+    insert_rows(connection, link, [{key: id, 'genre_id': by_name[g]} for id, g in links])
+    ids.extend(batch_ids)
+  return ids
+
+def seed(venues=1000, artists=2000, shows=50000, past=0.8, skew=1.1, years=3, random_seed=None):
+  """Add synthetic venues, artists and shows; returns the row counts added.
+
+  past is the share of shows that already happened, spread over the last
+  `years` years (upcoming ones fall within the next year); skew is the Zipf
+  exponent of venue and artist popularity, 0 for uniform.
+  """
+  rng = random.Random(random_seed)
+  now = datetime.now().replace(second=0, microsecond=0)
+  city_weights = zipf_weights(len(CITIES), 0.8)
+  with db.engine.begin() as connection:
+    venue_ids = _owners(connection, Venue, venue_genres, 'venue_id', venues, VENUE_KINDS, rng, city_weights)
+    artist_ids = _owners(connection, Artist, artist_genres, 'artist_id', artists, ARTIST_KINDS, rng, city_weights)
+  # popularity rank is independent of id, so hot rows are spread over the table
+  rng.shuffle(venue_ids)
+  rng.shuffle(artist_ids)
+  venue_weights = zipf_weights(len(venue_ids), skew)
+  artist_weights = zipf_weights(len(artist_ids), skew)
+  past_minutes, future_minutes = years * 365 * 24 * 60, 365 * 24 * 60
+  table = Show.__table__
+  for start in range(0, shows if venue_ids and artist_ids else 0, BATCH_SIZE):
+    size = min(BATCH_SIZE, shows - start)
+    venue_batch = rng.choices(venue_ids, cum_weights=venue_weights, k=size)
+    artist_batch = rng.choices(artist_ids, cum_weights=artist_weights, k=size)
+    rows = []
+    for venue_id, artist_id in zip(venue_batch, artist_batch):
+      if rng.random() < past:
+        offset = -rng.randint(1, past_minutes)
+      else:
+        offset = rng.randint(1, future_minutes)
+      # shows start on the quarter hour, mostly in the evening
+      start_time = (now + timedelta(minutes=offset)).replace(hour=rng.choice([18, 19, 20, 20, 21, 21, 22]),
+                                                            minute=rng.choice([0, 15, 30, 45]))
+      rows.append({'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time})
+    with db.engine.begin() as connection:
+      insert_rows(connection, table, rows)
+  with db.engine.begin() as connection:
+    counters.refresh_all(connection)
+  search.invalidate()
+  availability.invalidate()
+  pagecache.clear()
+  return len(venue_ids), len(artist_ids), shows if venue_ids and artist_ids else 0
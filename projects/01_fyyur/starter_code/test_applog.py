@@ -0,0 +1,83 @@
+import glob
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+
+import applog
+
+
+class AppLogTestCase(unittest.TestCase):
+    """Checks the queued JSON log written outside debug mode"""
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'error.log')
+        self.app = Flask(__name__)
+        self.app.config.update(LOG_FILE=self.path, LOG_MAX_BYTES=4096, LOG_BACKUPS=2, LOG_FLUSH_SECONDS=0.01)
+        self.log = applog.AppLog(self.app)
+
+        @self.app.route('/fail')
+        def fail():
+            try:
+                1 / 0
+            except ZeroDivisionError:
+                self.app.logger.exception('could not divide')
+            return 'ok'
+
+    def tearDown(self):
+        self.app.logger.removeHandler(self.log.handler)
+        self.log.close()
+
+    def lines(self, path):
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_request_lines(self):
+        res = self.app.test_client().get('/fail', headers={'X-Request-Id': 'abc123'})
+        self.assertEqual(res.headers['X-Request-Id'], 'abc123')
+        self.log.close()
+        error, access = self.lines(self.path)
+        self.assertEqual((error['level'], error['message'], error['request_id']),
+                         ('ERROR', 'could not divide', 'abc123'))
+        self.assertIn('ZeroDivisionError', error['exception'])
+        self.assertEqual((access['message'], access['status'], access['request_id']),
+                         ('GET /fail 200', 200, 'abc123'))
+        self.assertGreaterEqual(access['duration_ms'], error['duration_ms'])
+
+    def test_rotation(self):
+        for i in range(200):
+            self.app.logger.info('line %d', i)
+        self.log.close()
+        self.assertEqual(sorted(glob.glob(self.path + '*')), [self.path, self.path + '.1', self.path + '.2'])
+        for path in glob.glob(self.path + '*'):
+            self.assertLessEqual(os.path.getsize(path), 4096)
+        self.assertEqual(self.lines(self.path)[-1]['message'], 'line 199')
+
+    def test_full_queue_drops(self):
+        target = applog.BatchFileHandler(self.path)
+        handler = applog.QueuedHandler(target, queue_size=10, batch=1)
+        # a stalled disk: the listener blocks on its first record
+        with target.lock:
+            for i in range(100):
+                handler.handle(logging.makeLogRecord({'msg': 'line %d' % i}))
+            self.assertGreaterEqual(handler.dropped, 89)
+        handler.close()
+        lines = self.lines(self.path)
+        self.assertEqual([l['dropped_total'] for l in lines if 'dropped_total' in l], [handler.dropped])
+        self.assertEqual(len(lines), 100 - handler.dropped + 1)
+
+    def test_rotation_counts_bytes(self):
+        handler = applog.BatchFileHandler(self.path, max_bytes=4096, backups=2)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        for i in range(100):
+            handler.handle(logging.makeLogRecord({'msg': '\u00e9' * 100}))
+        handler.close()
+        for path in glob.glob(self.path + '*'):
+            self.assertLessEqual(os.path.getsize(path), 4096)
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
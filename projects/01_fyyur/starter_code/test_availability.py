@@ -0,0 +1,52 @@
+import unittest
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import app, querycount
+from models import db, Show
+import availability
+
+
+@pytest.mark.usefixtures('seeded')
+class BookingTestCase(unittest.TestCase):
+    """A venue is never booked for two shows at once"""
+
+    def test_booking_budget(self):
+        start = datetime(2031, 1, 1, 20)
+        # venue lock, overlap check, insert, the two counter updates and the
+        # facet check of whether the venue or artist got its first upcoming show
+        with querycount.budget(6):
+            db.session.add(Show(venue_id=3, artist_id=3, start_time=start, duration=90))
+            db.session.commit()
+        db.session.add(Show(venue_id=3, artist_id=4, start_time=start + timedelta(minutes=60)))
+        with self.assertRaises(availability.DoubleBooking):
+            db.session.commit()
+        db.session.rollback()
+        db.session.add(Show(venue_id=3, artist_id=4, start_time=start + timedelta(minutes=90)))
+        db.session.commit()
+
+
+@pytest.mark.usefixtures('seeded')
+class ShowDurationTestCase(unittest.TestCase):
+    """Shows last between 1 minute and availability.MAX_DURATION"""
+
+    def test_form_rejects_duration(self):
+        client = app.test_client()
+        count = Show.query.count()
+        for duration in ['0', '-30', str(availability.MAX_DURATION + 1)]:
+            res = client.post('/shows/create', data={'artist_id': '5', 'venue_id': '5',
+                                                      'start_time': '2033-01-01 20:00', 'duration': duration})
+            self.assertIn(b'Duration must be between', res.data)
+        self.assertEqual(Show.query.count(), count)
+        res = client.post('/shows/create', data={'artist_id': '5', 'venue_id': '5',
+                                                  'start_time': '2033-01-01 20:00', 'duration': '90'})
+        self.assertIn(b'successfully listed', res.data)
+
+    def test_database_rejects_duration(self):
+        db.session.add(Show(venue_id=6, artist_id=6, start_time=datetime(2033, 1, 1, 20),
+                            duration=availability.MAX_DURATION + 1))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
@@ -0,0 +1,50 @@
+import unittest
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import app, querycount
+from models import db, Venue, Artist, Show, facet_counts
+import counters
+
+
+@pytest.mark.usefixtures('seeded')
+class ShowCounterTestCase(unittest.TestCase):
+    """Show counters follow writes as a full recount would"""
+
+    def stored(self):
+        return [tuple(r) for model in (Venue, Artist) for r in db.session.query(
+            model.id, model.upcoming_shows_count, model.past_shows_count, model.next_show_at).order_by(model.id)]
+
+    def facets(self):
+        return sorted(tuple(r) for r in db.session.execute(facet_counts.select()))
+
+    def test_show_counters_follow_writes(self):
+        soon = datetime.now() + timedelta(days=500)
+        first = Show(venue_id=21, artist_id=21, start_time=soon)
+        second = Show(venue_id=21, artist_id=22, start_time=soon + timedelta(days=1))
+        db.session.add_all([first, second])
+        db.session.commit()
+        first.start_time = datetime.now() - timedelta(days=500)
+        second.venue_id, second.artist_id = 22, 21
+        db.session.commit()
+        db.session.delete(first)
+        db.session.commit()
+        incremental = self.stored()
+        counters.refresh_all(db.session.connection())
+        db.session.commit()
+        self.assertEqual(incremental, self.stored())
+
+    def test_delete_venue(self):
+        venue_id = 9
+        shows = Show.query.filter(Show.venue_id == venue_id).count()
+        self.assertTrue(shows > 10)
+        # the same statements however many shows the venue has
+        with querycount.budget(13):
+            app.test_client().delete('/venues/%d' % venue_id)
+        self.assertIsNone(Venue.query.get(venue_id))
+        self.assertEqual(Show.query.filter(Show.venue_id == venue_id).count(), 0)
+        incremental = self.stored(), self.facets()
+        counters.refresh_all(db.session.connection())
+        db.session.commit()
+        self.assertEqual(incremental, (self.stored(), self.facets()))
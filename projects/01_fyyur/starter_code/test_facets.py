@@ -0,0 +1,33 @@
+import unittest
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import app, querycount
+from models import db, Venue, Show, Genre, facet_counts
+import facets
+
+
+@pytest.mark.usefixtures('seeded')
+class FacetTestCase(unittest.TestCase):
+    """The facet summary follows writes as a full refresh would"""
+
+    def summary(self):
+        return sorted(tuple(r) for r in db.session.execute(facet_counts.select()))
+
+    def test_facet_counts_follow_writes(self):
+        venue = Venue(name='Facet Venue', city='City 3', state='CA', seeking_talent=True,
+                      genres=Genre.from_names(['Jazz']))
+        db.session.add(venue)
+        db.session.commit()
+        db.session.add(Show(venue_id=venue.id, artist_id=11, start_time=datetime.now() + timedelta(days=400)))
+        db.session.commit()
+        venue.city = 'City 4'
+        db.session.commit()
+        with querycount.budget(2):
+            res = app.test_client().get('/venues?city=City%204&seeking_talent=true&has_upcoming=true')
+        self.assertIn(b'Facet Venue', res.data)
+        incremental = self.summary()
+        facets.refresh_all(db.session.connection())
+        db.session.commit()
+        self.assertEqual(incremental, self.summary())
@@ -0,0 +1,62 @@
+import os
+import stat
+import tempfile
+import unittest
+from datetime import datetime
+
+import pytest
+
+from app import app, querycount
+import pagecache
+
+
+@pytest.mark.usefixtures('seeded')
+class PageCacheTestCase(unittest.TestCase):
+    """Venue and artist pages are served from cache until a write"""
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def test_cached_page_budget(self):
+        self.client.get('/artists/9')
+        with querycount.budget(0):
+            self.assertEqual(self.client.get('/artists/9').status_code, 200)
+        self.client.post('/artists/9/edit', data={'name': 'Renamed Artist', 'city': 'City 9', 'state': 'CA'})
+        with querycount.budget(4):
+            res = self.client.get('/artists/9')
+        self.assertIn(b'Renamed Artist', res.data)
+
+    def test_clear_in_another_process(self):
+        self.client.get('/venues/9')
+        with querycount.budget(0):
+            self.client.get('/venues/9')
+        # what clear() leaves behind when a command runs in another process
+        stamp = app.config['PAGE_CACHE_STAMP']
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(stamp))
+        os.close(fd)
+        os.replace(temp, stamp)
+        with querycount.capture() as stats:
+            self.client.get('/venues/9')
+        self.assertTrue(stats.count)
+
+
+class FileSystemStoreTestCase(unittest.TestCase):
+    """Pages stored as files are read back as they were written"""
+
+    def setUp(self):
+        self.directory = os.path.join(tempfile.mkdtemp(), 'pages')
+        self.store = pagecache.FileSystemStore(self.directory)
+
+    def test_round_trip(self):
+        expires = datetime(2030, 1, 2, 3, 4, 5, 6)
+        self.store.set('venue:1', expires, u'<h1>Caf\xe9</h1>')
+        self.store.set('venue:2', expires, None)
+        self.assertEqual(self.store.get('venue:1'), (expires, u'<h1>Caf\xe9</h1>'))
+        self.assertEqual(self.store.get('venue:2'), (expires, None))
+        self.assertIsNone(self.store.get('venue:3'))
+        self.assertEqual(stat.S_IMODE(os.stat(self.directory).st_mode), 0o700)
+
+    def test_unreadable_entry(self):
+        with open(self.store._path('venue:1'), 'wb') as f:
+            f.write(b'\x80\x04\x95 not a page')
+        self.assertIsNone(self.store.get('venue:1'))
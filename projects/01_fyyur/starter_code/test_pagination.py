@@ -0,0 +1,29 @@
+import re
+import unittest
+
+import pytest
+
+from app import app
+
+
+@pytest.mark.usefixtures('seeded')
+class PaginationTestCase(unittest.TestCase):
+    """A ?per_page= page size applies to every page it leads to"""
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def test_next_page_keeps_page_size(self):
+        for url, item in (('/artists?per_page=5', r'href="/artists/\d+"'),
+                          ('/shows?per_page=5', r'href="/artists/\d+"')):
+            page = self.client.get(url).data.decode()
+            next_url = re.search(r'href="(/\w+\?[^"]*cursor=[^"]+)"', page).group(1).replace('&amp;', '&')
+            self.assertIn('per_page=5', next_url)
+            self.assertEqual(len(re.findall(item, self.client.get(next_url).data.decode())), 5, url)
+
+    def test_more_results_keeps_page_size(self):
+        page = self.client.post('/venues/search', data={'search_term': 'Venue', 'per_page': '5'}).data.decode()
+        self.assertIn('name="per_page" value="5"', page)
+        cursor = re.search(r'name="cursor" value="([^"]+)"', page).group(1)
+        more = self.client.post('/venues/search', data={'search_term': 'Venue', 'per_page': '5', 'cursor': cursor})
+        self.assertEqual(len(re.findall(r'href="/venues/\d+"', more.data.decode())), 5)
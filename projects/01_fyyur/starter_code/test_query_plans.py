@@ -0,0 +1,131 @@
+import re
+import unittest
+
+import pytest
+from sqlalchemy import event
+
+from app import app
+from models import db
+import availability
+
+
+def sequential_scans(connection, statement, parameters):
+    """Tables the database would read in full to run the statement, with the
+    planner's default settings, so a plan that regresses to a full read
+    fails as well as one with no index to use."""
+    if connection.dialect.name == 'postgresql':
+        plan = connection.execute('EXPLAIN ' + statement, parameters)
+        lines = [row[0] for row in plan]
+        scans = set(m.group(1) for m in (re.search(r'Seq Scan on "?(\w+)"?', l) for l in lines) if m)
+        # a table of one page is read as cheaply as an index probe
+        tiny = set(r[0] for r in connection.execute(
+            'SELECT relname FROM pg_class WHERE relpages <= 1 AND relname = ANY(%(names)s)', {'names': list(scans)}))
+        return scans - tiny
+    plan = connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+    lines = [row[-1] for row in plan]
+    # "SCAN Show" is a full table read; "SCAN ... USING INDEX" walks an index
+    scans = set(m.group(1) for m in (re.match(r'SCAN (?:TABLE )?"?(\w+)"?$', l) for l in lines) if m)
+    # except an unfiltered walk in rowid order with no sort behind it, which
+    # a LIMIT stops after one page (the first page of a keyset listing)
+    ordered = re.search(r'ORDER BY "?(\w+)"?\.id(?: ASC)?\s+LIMIT\b', statement)
+    if ordered and ' WHERE ' not in statement and not any('FOR ORDER BY' in l for l in lines):
+        scans.discard(ordered.group(1))
+    return scans
+
+
+@pytest.fixture(scope='class')
+def statements(request, seeded):
+    # the SELECTs sent to the database, for the test to explain
+    captured = request.cls.statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            captured.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    yield
+    event.remove(db.engine, 'before_cursor_execute', capture)
+
+
+@pytest.mark.usefixtures('statements')
+class QueryPlanTestCase(unittest.TestCase):
+    """Fails when a Fyyur route query falls back to a sequential scan"""
+
+    # tables a route reads in full by design (the venue directory and search
+    # index loads); paginated listings and facet counts must not
+    LISTINGS = {
+        'Venue': {'Venue', 'Genre', 'venue_genres'},
+        'Artist': {'Artist', 'Genre', 'artist_genres'},
+    }
+
+    def setUp(self):
+        self.client = app.test_client()
+        del self.statements[:]
+
+    def assertIndexed(self, method, url, allowed=(), **kwargs):
+        del self.statements[:]
+        res = getattr(self.client, method)(url, **kwargs)
+        self.assertEqual(res.status_code, 200)
+        captured = list(self.statements)
+        self.assertTrue(captured)
+        with db.engine.connect() as connection:
+            for statement, parameters in captured:
+                scans = sequential_scans(connection, statement, parameters) - set(allowed)
+                self.assertEqual(scans, set(), '%s %s: %s' % (method.upper(), url, statement))
+
+    def test_venue_page_plan(self):
+        self.assertIndexed('get', '/venues/7')
+
+    def test_artist_page_plan(self):
+        self.assertIndexed('get', '/artists/7')
+
+    def test_edit_venue_plan(self):
+        self.assertIndexed('get', '/venues/7/edit')
+
+    def test_edit_artist_plan(self):
+        self.assertIndexed('get', '/artists/7/edit')
+
+    def test_venues_plan(self):
+        self.assertIndexed('get', '/venues', self.LISTINGS['Venue'])
+
+    def test_venues_by_genre_plan(self):
+        self.assertIndexed('get', '/venues?genre=Jazz', self.LISTINGS['Venue'])
+
+    def test_artists_plan(self):
+        self.assertIndexed('get', '/artists')
+
+    def test_artists_next_page_plan(self):
+        res = self.client.get('/artists')
+        cursor = re.search(r'cursor=([\w-]+)', res.data.decode()).group(1)
+        self.assertIndexed('get', '/artists?cursor=' + cursor)
+
+    def test_artists_faceted_plan(self):
+        self.assertIndexed('get', '/artists?state=CA&city=City%203&genre=Jazz&has_upcoming=true')
+
+    def test_shows_plan(self):
+        self.assertIndexed('get', '/shows')
+
+    def test_shows_next_page_plan(self):
+        res = self.client.get('/shows')
+        cursor = re.search(r'cursor=([\w-]+)', res.data.decode()).group(1)
+        self.assertIndexed('get', '/shows?cursor=' + cursor)
+
+    def test_calendar_plan(self):
+        self.assertIndexed('get', '/calendar?city=City%203')
+
+    def test_calendar_venue_plan(self):
+        self.assertIndexed('get', '/calendar?venue_id=7&start=2030-06-05&end=2030-06-07')
+
+    def test_available_venues_plan(self):
+        # SQLite answers from the in-memory interval index, loaded in full once
+        availability.invalidate()
+        self.assertIndexed('get', '/venues/available?city=City%203&start=2030-06-05T20:00&end=2030-06-05T23:00',
+                           {'Venue', 'Show'})
+
+    def test_incremental_export_plan(self):
+        self.assertIndexed('get', '/export/shows.ndjson?updated_since=2999-01-01')
+
+    def test_search_venues_plan(self):
+        self.assertIndexed('post', '/venues/search', self.LISTINGS['Venue'], data={'search_term': 'Venue 1'})
+
+    def test_search_artists_plan(self):
+        self.assertIndexed('post', '/artists/search', self.LISTINGS['Artist'], data={'search_term': 'Artist 1'})
@@ -0,0 +1,68 @@
+import unittest
+from datetime import datetime
+
+import pytest
+
+from app import app, querycount
+from models import Venue, db
+
+
+@pytest.mark.usefixtures('seeded')
+class QueryBudgetTestCase(unittest.TestCase):
+    """Fails when a Fyyur route runs more statements than its budget"""
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def assertBudget(self, max_queries, method, url, **kwargs):
+        with querycount.budget(max_queries):
+            res = getattr(self.client, method)(url, **kwargs)
+        self.assertEqual(res.status_code, 200)
+        return res
+
+    def test_venues_budget(self):
+        self.assertBudget(2, 'get', '/venues')
+
+    def test_venue_page_budget(self):
+        self.assertBudget(4, 'get', '/venues/7')
+
+    def test_artists_budget(self):
+        self.assertBudget(2, 'get', '/artists')
+
+    def test_artist_page_budget(self):
+        self.assertBudget(4, 'get', '/artists/7')
+
+    def test_shows_budget(self):
+        self.assertBudget(1, 'get', '/shows')
+
+    def test_calendar_budget(self):
+        res = self.assertBudget(1, 'get', '/calendar?state=CA')
+        self.assertTrue(res.get_json()['shows'])
+
+    def test_available_venues_budget(self):
+        url = '/venues/available?state=CA&start=%s&end=%s' % (
+            datetime.now().strftime('%Y-%m-%dT18:00'), datetime.now().strftime('%Y-%m-%dT23:00'))
+        self.client.get(url)
+        res = self.assertBudget(0, 'get', url)
+        self.assertTrue(res.get_json()['venues'])
+
+    def test_search_budget(self):
+        # the first search loads the in-memory index
+        self.client.post('/venues/search', data={'search_term': 'Venue'})
+        self.assertBudget(1, 'post', '/venues/search', data={'search_term': 'Venue 1'})
+
+    def test_response_headers(self):
+        res = self.assertBudget(2, 'get', '/artists')
+        self.assertEqual(res.headers['X-Query-Count'], '2')
+        self.assertEqual(res.headers['X-Query-Repeated'], '0')
+
+    def test_repeated_statements_flagged(self):
+        with querycount.capture() as stats:
+            for id in range(1, 6):
+                Venue.query.get(id)
+                db.session.expunge_all()
+        self.assertEqual(list(stats.repeated.values()), [5])
+        with self.assertRaises(AssertionError):
+            with querycount.budget(10):
+                for id in range(1, 6):
+                    Venue.query.get(id)
@@ -0,0 +1,26 @@
+import unittest
+
+import pytest
+from sqlalchemy import event
+
+from app import app
+from models import db
+
+
+@pytest.mark.usefixtures('seeded')
+class ReadModelTestCase(unittest.TestCase):
+    """Read-only pages are rendered from Core rows, not ORM objects"""
+
+    def test_read_pages_load_no_orm_objects(self):
+        client = app.test_client()
+        loaded = []
+        listener = lambda target, context: loaded.append(target)
+        event.listen(db.Model, 'load', listener, propagate=True)
+        try:
+            for url in ['/venues', '/venues/8', '/venues/8/edit', '/artists', '/artists/8',
+                        '/artists/8/edit', '/shows', '/calendar?state=CA']:
+                self.assertEqual(client.get(url).status_code, 200)
+        finally:
+            event.remove(db.Model, 'load', listener)
+        self.assertEqual(loaded, [])
+        self.assertEqual(client.get('/venues/999999').status_code, 404)
@@ -0,0 +1,32 @@
+import unittest
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import app
+from models import db, Venue, Artist, Show, similar_items
+import recommendations
+
+
+@pytest.mark.usefixtures('seeded')
+class SimilarItemsTestCase(unittest.TestCase):
+    """Incremental builds of similar items match a full build"""
+
+    def stored(self):
+        return sorted(tuple(r) for r in db.session.execute(
+            similar_items.select().order_by(similar_items.c.kind, similar_items.c.item_id, similar_items.c.rank)))
+
+    def test_similar_items_follow_shows(self):
+        recommendations.build(full=True)
+        # only shows written after the last build are looked at again
+        db.session.execute(Show.__table__.update().values(updated_at=datetime.utcnow() - timedelta(days=1)))
+        db.session.add(Show(venue_id=5, artist_id=12, start_time=datetime(2032, 1, 1, 20)))
+        db.session.commit()
+        artists, venues = recommendations.build()
+        self.assertTrue(0 < artists < Artist.query.count())
+        self.assertTrue(0 < venues < Venue.query.count())
+        incremental = self.stored()
+        recommendations.build(full=True)
+        self.assertEqual(incremental, self.stored())
+        res = app.test_client().get('/artists/12')
+        self.assertIn(b'Similar Artists', res.data)
@@ -0,0 +1,35 @@
+import unittest
+
+import pytest
+
+from app import app
+from models import db, Venue
+
+
+@pytest.fixture(scope='class')
+def lagging_replica(seeded, tmp_path_factory):
+    # a replica that has fallen behind: it only knows one venue
+    config = app.config['SQLALCHEMY_BINDS'], app.config['SQLALCHEMY_REPLICA_BINDS']
+    app.config['SQLALCHEMY_BINDS'] = {'replica0': 'sqlite:///' + str(tmp_path_factory.mktemp('replica') / 'replica.db')}
+    app.config['SQLALCHEMY_REPLICA_BINDS'] = ['replica0']
+    replica = db.get_engine(app, 'replica0')
+    db.Model.metadata.create_all(replica)
+    replica.execute(Venue.__table__.insert(), {'id': 1, 'name': 'Replica Venue', 'city': 'Nowhere', 'state': 'CA'})
+    yield
+    app.config['SQLALCHEMY_BINDS'], app.config['SQLALCHEMY_REPLICA_BINDS'] = config
+
+
+@pytest.mark.usefixtures('lagging_replica')
+class ReadRoutingTestCase(unittest.TestCase):
+    """GET requests read from a replica, writes and the reads after them from the primary"""
+
+    def test_get_reads_replica(self):
+        res = app.test_client().get('/venues/1')
+        self.assertIn(b'Replica Venue', res.data)
+
+    def test_reads_after_write_stick_to_primary(self):
+        client = app.test_client()
+        res = client.post('/venues/1/edit', data={'name': 'Edited Venue', 'city': 'City 0', 'state': 'CA'})
+        self.assertEqual(res.status_code, 302)
+        self.assertIn(b'Edited Venue', client.get('/venues/1').data)
+        self.assertIn(b'Replica Venue', app.test_client().get('/venues/1').data)
@@ -0,0 +1,100 @@
+"""Latency of drawing a quiz question, scanning versus the id arrays.
+
+Fills a throwaway SQLite database with --questions questions over six
+categories and draws questions the way /quizzes did before sampler.py
+(select the whole category, drop previous_questions in Python, pick one)
+and with QuestionSampler (rank draw from the id arrays, one primary key
+read). Reports the one-off array load and per-draw latency and memory.
+
+    python benchmarks/quizzes.py [--questions 1000000] [--draws 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from flask import Flask
+
+from models import setup_db, db, Question, Category, question_rows
+from sampler import QuestionSampler
+from catalog import CategoryCatalog
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+BATCH = 50000
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--questions', type=int, default=1000000)
+  parser.add_argument('--draws', type=int, default=200, help='draws per path (the scan path does at most 10)')
+  parser.add_argument('--previous', type=int, default=5, help='previous_questions per draw')
+  parser.add_argument('--seed', type=int, default=5)
+  return parser.parse_args()
+
+
+def fill(count):
+  db.session.execute(Category.__table__.insert(), [{'type': t} for t in CATEGORIES])
+  for start in range(0, count, BATCH):
+    db.session.execute(Question.__table__.insert(), [
+      {'question': 'Question %d' % i, 'answer': 'Answer %d' % i,
+       'category': i % len(CATEGORIES) + 1, 'difficulty': i % 5 + 1}
+      for i in range(start, min(start + BATCH, count))])
+  db.session.commit()
+
+
+def scan_draw(category, previous):
+  # the previous /quizzes path
+  previous = set(previous)
+  remaining = [q for q in question_rows(Question.category == category) if q.id not in previous]
+  return random.choice(remaining) if remaining else None
+
+
+def measure(draw, draws, questions, previous):
+  times = []
+  for _ in range(draws):
+    category = random.randint(1, len(CATEGORIES))
+    seen = random.sample(range(1, questions + 1), previous)
+    started = time.perf_counter()
+    question = draw(category, seen)
+    times.append(time.perf_counter() - started)
+    assert question is not None and question.id not in seen
+  times.sort()
+  tracemalloc.start()
+  draw(1, [])
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return times[len(times) // 2], times[-1], peak
+
+
+def main():
+  args = parse_args()
+  random.seed(args.seed)
+  app = Flask(__name__)
+  setup_db(app, 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'quizzes.db'))
+  with app.app_context():
+    started = time.perf_counter()
+    fill(args.questions)
+    print('filled %d questions in %.1fs' % (args.questions, time.perf_counter() - started))
+
+    sampler = QuestionSampler(CategoryCatalog(app), app)
+    started = time.perf_counter()
+    sampler.load()
+    loaded = time.perf_counter() - started
+    arrays = sum(len(pool) * pool.itemsize for pool in sampler.pools.values())
+    print('array load %.2fs, %.1f MB' % (loaded, arrays / 1e6))
+
+    print('%-8s %8s %12s %12s %14s' % ('path', 'draws', 'p50 ms', 'max ms', 'peak KB/draw'))
+    for name, draw, draws in (('scan', scan_draw, min(args.draws, 10)),
+                              ('sampler', sampler.draw, args.draws)):
+      p50, worst, peak = measure(draw, draws, args.questions, args.previous)
+      print('%-8s %8d %12.3f %12.3f %14.1f' % (name, draws, p50 * 1000, worst * 1000, peak / 1024.0))
+
+
+if __name__ == '__main__':
+  main()
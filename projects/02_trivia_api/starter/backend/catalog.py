@@ -0,0 +1,114 @@
+import threading
+import time
+import weakref
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models import db, Category, category_rows, catalog_versions
+
+#----------------------------------------------------------------------------#
+# Category catalog.
+#
+# The categories change rarely and are read by most endpoints, so each
+# process keeps them in memory. Every write to the categories table bumps
+# the 'categories' row of catalog_versions: through the ORM below, and in
+# PostgreSQL also through a trigger (see trivia.psql) for writes made
+# outside the app. A process compares its copy against that stamp at most
+# every CATEGORY_CATALOG_CHECK seconds, with a one-row primary key read, and
+# reloads only when it changed; its own commits take effect immediately.
+#----------------------------------------------------------------------------#
+
+NAME = 'categories'
+
+# catalogs expired by commits in this process
+_catalogs = weakref.WeakSet()
+
+def current_version(connection):
+  version = connection.execute(
+    select([catalog_versions.c.version]).where(catalog_versions.c.name == NAME)).scalar()
+  return version or 0
+
+def bump_version(connection):
+  updated = connection.execute(catalog_versions.update()
+                               .where(catalog_versions.c.name == NAME)
+                               .values(version=catalog_versions.c.version + 1))
+  if not updated.rowcount:
+    connection.execute(catalog_versions.insert().values(name=NAME, version=1))
+
+class CategoryCatalog(object):
+
+  def __init__(self, app=None, check_seconds=5):
+    self.check_seconds = check_seconds
+    # CategoryRows ordered by id, and the version they were loaded at
+    self.rows = None
+    self.types = {}
+    self.version = None
+    self.checked = 0
+    self.lock = threading.Lock()
+    _catalogs.add(self)
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('CATEGORY_CATALOG_CHECK', self.check_seconds)
+    self.check_seconds = app.config['CATEGORY_CATALOG_CHECK']
+    app.extensions['category_catalog'] = self
+
+  def expire(self):
+    self.checked = 0
+
+  def _current(self):
+    now = time.monotonic()
+    if self.rows is not None and now - self.checked < self.check_seconds:
+      return self.rows
+    version = current_version(db.session)
+    if self.rows is None or version != self.version:
+      rows = category_rows()
+      with self.lock:
+        self.rows, self.version = rows, version
+        self.types = dict((c.id, c.type) for c in rows)
+    self.checked = now
+    return self.rows
+
+  def categories(self):
+    """CategoryRows of every category, ordered by id."""
+    return self._current()
+
+  def types_by_id(self):
+    """{id: type} of every category."""
+    self._current()
+    return self.types
+
+  def has(self, category_id):
+    self._current()
+    return category_id in self.types
+
+#----------------------------------------------------------------------------#
+# Following writes.
+#----------------------------------------------------------------------------#
+
+@event.listens_for(Session, 'after_flush')
+def _bump_on_category_write(session, flush_context):
+  written = [obj for obj in session.new | session.deleted if isinstance(obj, Category)]
+  written += [obj for obj in session.dirty if isinstance(obj, Category) and session.is_modified(obj)]
+  if written:
+    bump_version(session.connection())
+    session.info['categories_written'] = True
+
+@event.listens_for(Session, 'after_bulk_delete')
+@event.listens_for(Session, 'after_bulk_update')
+def _bump_on_bulk_category_write(context):
+  if context.primary_table is Category.__table__:
+    bump_version(context.session.connection())
+    context.session.info['categories_written'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _expire_catalogs(session):
+  if session.info.pop('categories_written', False):
+    for catalog in list(_catalogs):
+      catalog.expire()
+
+@event.listens_for(Session, 'after_rollback')
+def _keep_catalogs(session):
+  session.info.pop('categories_written', None)
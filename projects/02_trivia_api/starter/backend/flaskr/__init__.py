@@ -2,38 +2,55 @@ import os
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 
-from models import setup_db, db, Question, Category
+from models import setup_db, db, Question, question_rows, question_count
+from querycount import QueryCounter
+from sampler import QuestionSampler
+from quizsessions import QuizSessions
+from catalog import CategoryCatalog
+import search
 
 QUESTIONS_PER_PAGE = 10
 
+# per-request SQL counts; tests assert route budgets with querycount.budget()
+querycount = QueryCounter()
+# categories served from memory, reloaded when their version stamp moves
+catalog = CategoryCatalog()
+# per-category question id arrays /quizzes draws from
+sampler = QuestionSampler(catalog)
+# server-side seen questions of quizzes played by token
+quiz_sessions = QuizSessions()
+
 # Helper functions
-def paginate_questions(request, selection):
+def paginate_questions(request, *criteria):
+  # reads only the requested page: ?after=<question id> continues after that
+  # question (keyset, constant cost at any depth), ?page= skips whole pages
+  after = request.args.get('after', None, type=int)
   page = request.args.get('page', 1, type=int)
-  start = (page - 1) * QUESTIONS_PER_PAGE
-  end = start + QUESTIONS_PER_PAGE
-
-  questions = [q.format() for q in selection]
-  current_questions = questions[start:end]
-  return current_questions
-
-def get_quiz_question(selection, previous_questions):
-  selection_ids = [s.id for s in selection]
-  diff = list(set(selection_ids) - set(previous_questions))
-  question = None
-  if diff and len(diff) > 1:
-    question = Question.query.get(random.choice(diff)).format()
-  elif len(diff) == 1:
-    question = Question.query.get(diff[0]).format()
-  else:
-    question = None
-  return question
+  if after is not None:
+    criteria += (Question.id > after,)
+    page = 1
+  if page < 1:
+    return []
+  selection = question_rows(*criteria, limit=QUESTIONS_PER_PAGE, offset=(page - 1) * QUESTIONS_PER_PAGE)
+  return [q.format() for q in selection]
+
+def next_cursor(current_questions):
+  # ?after= value of the page following a full page
+  if len(current_questions) < QUESTIONS_PER_PAGE:
+    return None
+  return current_questions[-1]['id']
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
   setup_db(app)
+  if app.debug:
+    app.config.setdefault('QUERYCOUNT_ENDPOINT', '/_debug/queries')
+  querycount.init_app(app)
+  sampler.init_app(app)
+  quiz_sessions.init_app(app)
+  catalog.init_app(app)
  
   '''
   Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -55,14 +72,14 @@ def create_app(test_config=None):
   '''
   @app.route('/categories')
   def get_categories():
-    categories = Category.query.all()
+    categories = catalog.types_by_id()
     #formatted_categories = [c.format() for c in categories]
     if len(categories) == 0:
       abort(404)
 
     return jsonify({
       'success': True,
-      'categories': {c.id:c.type for c in categories}
+      'categories': categories
     })
 
   ''' 
@@ -78,19 +95,19 @@ def create_app(test_config=None):
   '''
   @app.route('/questions')
   def get_questions():
-    questions = Question.query.order_by(Question.id).all()
-    current_questions = paginate_questions(request, questions)
+    current_questions = paginate_questions(request)
     
-    categories = Category.query.all()
+    categories = catalog.types_by_id()
 
     if(len(current_questions) == 0) or (len(categories) == 0):
       abort(404)
 
     return jsonify ({
       'questions': current_questions,
-      'total_questions': len(questions),
+      'total_questions': question_count(),
+      'next_cursor': next_cursor(current_questions),
       'current_category': None,
-      'categories': {c.id:c.type for c in categories},
+      'categories': categories,
       'success': True
     })
 
@@ -108,14 +125,13 @@ def create_app(test_config=None):
         abort(404)
       
       question.delete()
-      selection = Question.query.order_by(Question.id).all()
-      current_questions = paginate_questions(request, selection)
+      current_questions = paginate_questions(request)
 
       return jsonify({
         'success': True,
         'deleted': question_id,
         'questions': current_questions,
-        'total_questions': len(Question.query.all())
+        'total_questions': question_count()
       })
     except:
       abort(422)
@@ -144,14 +160,13 @@ def create_app(test_config=None):
       question = Question(question = new_question, answer = answer, category = category, difficulty = difficulty)
       question.insert()
 
-      selection = Question.query.order_by(Question.id).all()
-      current_questions = paginate_questions(request, selection)
+      current_questions = paginate_questions(request)
 
       return jsonify({
         'success': True,
         'created': question.id,
         'questions': current_questions,
-        'total_questions': len(Question.query.all())
+        'total_questions': question_count()
       })
     except:
       abort(422)
@@ -172,14 +187,20 @@ def create_app(test_config=None):
     body = request.get_json()
 
     searchTerm = body.get('searchTerm', None)
+    category = body.get('category', None)
+    difficulty = body.get('difficulty', None)
     try:
-      selection = Question.query.filter(Question.question.ilike('%' + searchTerm + '%')).all()
-      current_questions = paginate_questions(request, selection)
+      # ranked matches in question and answer text, optionally narrowed to
+      # one category and difficulty (see search.py)
+      selection, total = search.search_questions(
+        searchTerm, category=int(category) if category is not None else None,
+        difficulty=int(difficulty) if difficulty is not None else None,
+        page=request.args.get('page', 1, type=int), per_page=QUESTIONS_PER_PAGE)
 
       return jsonify({
         'success': True,
-        'questions': current_questions,
-        'total_questions': len(current_questions)
+        'questions': [q.format() for q in selection],
+        'total_questions': total
         })
     except:
       abort(422)
@@ -193,16 +214,15 @@ def create_app(test_config=None):
   '''
   @app.route('/categories/<int:category_id>/questions', methods = ['GET'])
   def get_questions_by_category(category_id):
-    valid_categories = [c.id for c in Category.query.all()]
-    if category_id not in valid_categories:
+    if not catalog.has(category_id):
       abort(404)
-    selection = Question.query.filter(Question.category == category_id).all()
-    current_questions = paginate_questions(request, selection)
+    current_questions = paginate_questions(request, Question.category == category_id)
 
     return jsonify({
       'success': True,
       'questions': current_questions,
-      'total_questions': len(current_questions)
+      'total_questions': question_count(category_id),
+      'next_cursor': next_cursor(current_questions)
     })
   
   '''
@@ -215,27 +235,42 @@ def create_app(test_config=None):
   one question at a time is displayed, the user is allowed to answer
   and shown whether they were correct or not. 
   '''
+  def quiz_category(body):
+    # "All" and unknown categories draw from every question
+    quiz_category_id = int(body.get('quiz_category', {}).get('id', 0))
+    return quiz_category_id if catalog.has(quiz_category_id) else None
+
   @app.route('/quizzes', methods = ['POST'])
   def quizzes():
     body = request.get_json()
-    previous_questions = body.get('previous_questions', [])
-    quiz_category_id = int(body.get('quiz_category', {}).get('id', 0))
-
-    all_category_ids = [c.id for c in Category.query.all()]
-
-    if (quiz_category_id in all_category_ids):
-      selection = Question.query.filter(Question.category == quiz_category_id).all()
+    token = body.get('session', None)
+    if token is not None:
+      # the session remembers the category and the questions already asked
+      try:
+        question = quiz_sessions.update(token, sampler.draw_for)
+      except KeyError:
+        abort(404)
     else:
-      selection = Question.query.all()
+      previous_questions = body.get('previous_questions', [])
+      question = sampler.draw(quiz_category(body), previous_questions)
 
-    if selection is None:
-      abort(404)
+    return jsonify({
+      'success': True,
+      'question': question.format() if question else None
+      })
 
-    question = get_quiz_question(selection, previous_questions)
+  '''
+  Start a quiz session: the response carries a token to send to /quizzes
+  as "session" instead of the previous questions.
+  '''
+  @app.route('/quizzes/session', methods = ['POST'])
+  def start_quiz_session():
+    body = request.get_json() or {}
+    token, quiz = quiz_sessions.start(quiz_category(body))
 
     return jsonify({
       'success': True,
-      'question': question
+      'session': token
       })
 
   ''' 
@@ -1,5 +1,9 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import time
+from collections import namedtuple
+from sqlalchemy import Column, String, Integer, Index, create_engine, select, func, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, object_session
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -18,6 +22,7 @@ def setup_db(app, database_path=database_path):
     db.app = app
     db.init_app(app)
     db.create_all()
+    install_search_index(db.engine)
 
 '''
 Question
@@ -25,6 +30,8 @@ Question
 '''
 class Question(db.Model):  
   __tablename__ = 'questions'
+  # category pages and counts walk this index instead of the table
+  __table_args__ = (Index('ix_questions_category_id', 'category', 'id'),)
 
   id = Column(Integer, primary_key=True)
   question = Column(String)
@@ -75,4 +82,148 @@ class Category(db.Model):
     return {
       'id': self.id,
       'type': self.type
-    }
\ No newline at end of file
+    }
+
+'''
+Catalog versions
+    a stamp per cached catalog, bumped by every write to what it caches
+    (see catalog.py)
+'''
+catalog_versions = db.Table('catalog_versions',
+  Column('name', String, primary_key=True),
+  Column('version', Integer, nullable=False))
+
+'''
+Search index
+    PostgreSQL: a search_vector column kept by a trigger, question text
+    weighing more than answer, with a GIN index, plus trigram indexes for
+    substring matches. SQLite: an FTS5 table kept by triggers. Created on
+    setup when missing; see search.py for the queries
+'''
+POSTGRES_SEARCH_INDEX = [
+  "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+  "ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_vector tsvector",
+  """CREATE OR REPLACE FUNCTION questions_search_vector() RETURNS trigger LANGUAGE plpgsql AS $$
+     BEGIN
+       NEW.search_vector := setweight(to_tsvector('english', coalesce(NEW.question, '')), 'A') ||
+                            setweight(to_tsvector('english', coalesce(NEW.answer, '')), 'B');
+       RETURN NEW;
+     END
+     $$""",
+  "DROP TRIGGER IF EXISTS questions_search_vector ON questions",
+  """CREATE TRIGGER questions_search_vector BEFORE INSERT OR UPDATE OF question, answer ON questions
+     FOR EACH ROW EXECUTE PROCEDURE questions_search_vector()""",
+  # fires the trigger on the existing rows
+  "UPDATE questions SET question = question",
+  "CREATE INDEX IF NOT EXISTS ix_questions_search_vector ON questions USING gin (search_vector)",
+  "CREATE INDEX IF NOT EXISTS ix_questions_question_trgm ON questions USING gin (question gin_trgm_ops)",
+  "CREATE INDEX IF NOT EXISTS ix_questions_answer_trgm ON questions USING gin (answer gin_trgm_ops)",
+]
+
+SQLITE_SEARCH_INDEX = [
+  """CREATE VIRTUAL TABLE questions_fts USING fts5(
+       question, answer, content='questions', content_rowid='id', tokenize='porter unicode61')""",
+  """CREATE TRIGGER questions_fts_insert AFTER INSERT ON questions BEGIN
+       INSERT INTO questions_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer);
+     END""",
+  """CREATE TRIGGER questions_fts_delete AFTER DELETE ON questions BEGIN
+       INSERT INTO questions_fts (questions_fts, rowid, question, answer)
+       VALUES ('delete', old.id, old.question, old.answer);
+     END""",
+  """CREATE TRIGGER questions_fts_update AFTER UPDATE ON questions BEGIN
+       INSERT INTO questions_fts (questions_fts, rowid, question, answer)
+       VALUES ('delete', old.id, old.question, old.answer);
+       INSERT INTO questions_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer);
+     END""",
+  "INSERT INTO questions_fts (questions_fts) VALUES ('rebuild')",
+]
+
+def install_search_index(engine):
+  with engine.begin() as connection:
+    if connection.dialect.name == 'postgresql':
+      installed = connection.execute(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_name = 'questions' AND column_name = 'search_vector'").first()
+      statements = POSTGRES_SEARCH_INDEX
+    elif connection.dialect.name == 'sqlite':
+      installed = connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'questions_fts'").first()
+      statements = SQLITE_SEARCH_INDEX
+      if not installed and not sqlite_has_fts5(connection):
+        return
+    else:
+      return
+    if not installed:
+      for statement in statements:
+        connection.execute(statement)
+
+def sqlite_has_fts5(connection):
+  try:
+    connection.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(text)")
+  except OperationalError:
+    return False
+  connection.execute("DROP TABLE temp.fts5_probe")
+  return True
+
+'''
+Read models
+    read-only endpoints select just the columns they return with Core and get
+    plain namedtuples back, skipping ORM object construction and the identity map
+'''
+class QuestionRow(namedtuple('QuestionRow', ['id', 'question', 'answer', 'category', 'difficulty'])):
+  __slots__ = ()
+
+  def format(self):
+    return dict(zip(self._fields, self))
+
+CategoryRow = namedtuple('CategoryRow', ['id', 'type'])
+
+def question_rows(*criteria, limit=None, offset=0):
+  query = select([Question.id, Question.question, Question.answer, Question.category, Question.difficulty])
+  for criterion in criteria:
+    query = query.where(criterion)
+  query = query.order_by(Question.id).limit(limit)
+  if offset:
+    query = query.offset(offset)
+  return [QuestionRow._make(r) for r in db.session.execute(query)]
+
+def category_rows():
+  query = select([Category.id, Category.type]).order_by(Category.id)
+  return [CategoryRow._make(r) for r in db.session.execute(query)]
+
+'''
+Question counts
+    COUNT(*) of all questions or of one category, kept for COUNT_TTL seconds
+    and forgotten whenever a commit in this process adds, changes or deletes
+    a question; other processes see such changes within COUNT_TTL
+'''
+COUNT_TTL = 60
+
+# category (None for all) -> (count, expires)
+_counts = {}
+
+def question_count(category=None):
+  cached = _counts.get(category)
+  if cached is not None and cached[1] > time.monotonic():
+    return cached[0]
+  query = select([func.count()]).select_from(Question.__table__)
+  if category is not None:
+    query = query.where(Question.category == category)
+  count = db.session.execute(query).scalar()
+  _counts[category] = (count, time.monotonic() + COUNT_TTL)
+  return count
+
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_update')
+@event.listens_for(Question, 'after_delete')
+def _mark_counts_stale(mapper, connection, target):
+  object_session(target).info['question_counts_stale'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _forget_counts(session):
+  if session.info.pop('question_counts_stale', False):
+    _counts.clear()
+
+@event.listens_for(Session, 'after_rollback')
+def _keep_counts(session):
+  session.info.pop('question_counts_stale', None)
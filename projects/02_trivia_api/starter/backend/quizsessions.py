@@ -0,0 +1,232 @@
+import secrets
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+#----------------------------------------------------------------------------#
+# Quiz sessions.
+#
+# Instead of resending every previous question, a client can start a quiz
+# session (POST /quizzes/session) and send only its token. The server keeps
+# which questions the session has seen as a bitmap indexed by question id,
+# so a request carries one token, a draw (QuestionSampler.draw_for) does
+# constant work however long the quiz runs, and any process can continue a
+# session another one started.
+#
+# Sessions are stored, zlib-compressed, in a pluggable store and expire
+# QUIZ_SESSION_TTL seconds after their last question. Requests of the same
+# session take turns (a lock per token in memory, a version the update
+# checks in sqlite), so two at once never draw the same question:
+#
+#   QUIZ_SESSION_STORE  'memory' (per process, default) or 'sqlite' (a file
+#                       shared by the processes on one host)
+#   QUIZ_SESSION_TTL    seconds a session lives after its last use (3600)
+#   QUIZ_SESSION_MAX    sessions the memory store holds at most (100000)
+#   QUIZ_SESSION_DB     file of the sqlite store ('quiz_sessions.db')
+#----------------------------------------------------------------------------#
+
+class QuizSession(object):
+  """The category of a quiz and the questions it has seen."""
+
+  # category (-1 for all), questions seen
+  HEADER = struct.Struct('<qI')
+
+  def __init__(self, category, seen=None, count=0):
+    self.category = category
+    # bit id of byte id // 8 is set once question id has been asked
+    self.seen = seen if seen is not None else bytearray()
+    self.count = count
+
+  def has_seen(self, id):
+    return id >> 3 < len(self.seen) and bool(self.seen[id >> 3] & (1 << (id & 7)))
+
+  def mark_seen(self, id):
+    if id >> 3 >= len(self.seen):
+      self.seen.extend(bytes((id >> 3) + 1 - len(self.seen)))
+    if not self.has_seen(id):
+      self.seen[id >> 3] |= 1 << (id & 7)
+      self.count += 1
+
+  def seen_ids(self):
+    return [byte * 8 + bit for byte, bits in enumerate(self.seen) if bits
+            for bit in range(8) if bits & (1 << bit)]
+
+  def encode(self):
+    category = self.category if self.category is not None else -1
+    return self.HEADER.pack(category, self.count) + zlib.compress(bytes(self.seen), 1)
+
+  @classmethod
+  def decode(cls, data):
+    category, count = cls.HEADER.unpack_from(data)
+    seen = bytearray(zlib.decompress(data[cls.HEADER.size:]))
+    return cls(category if category >= 0 else None, seen, count)
+
+class MemoryStore(object):
+
+  def __init__(self, ttl=3600, max_sessions=100000):
+    self.ttl = ttl
+    self.max_sessions = max_sessions
+    # token -> (expires, data), least recently used first
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+    # token -> [lock, threads using it] of the sessions being updated
+    self.token_locks = {}
+
+  def get(self, token):
+    with self.lock:
+      entry = self.entries.get(token)
+      if entry is None or entry[0] <= time.time():
+        return None
+      return entry[1]
+
+  def set(self, token, data):
+    now = time.time()
+    with self.lock:
+      self.entries.pop(token, None)
+      self.entries[token] = (now + self.ttl, data)
+      # every entry has the same ttl, so the oldest expire first
+      while self.entries:
+        oldest, (expires, _) = next(iter(self.entries.items()))
+        if expires > now and len(self.entries) <= self.max_sessions:
+          break
+        del self.entries[oldest]
+
+  def update(self, token, change):
+    # stores change(data) of the session; False when there is none
+    with self._locked(token):
+      data = self.get(token)
+      if data is None:
+        return False
+      self.set(token, change(data))
+      return True
+
+  @contextmanager
+  def _locked(self, token):
+    with self.lock:
+      entry = self.token_locks.setdefault(token, [threading.Lock(), 0])
+      entry[1] += 1
+    try:
+      with entry[0]:
+        yield
+    finally:
+      with self.lock:
+        entry[1] -= 1
+        if not entry[1]:
+          del self.token_locks[token]
+
+  def delete(self, token):
+    with self.lock:
+      self.entries.pop(token, None)
+
+class SQLiteStore(object):
+
+  # writes between sweeps of expired sessions
+  SWEEP_EVERY = 1000
+
+  def __init__(self, path, ttl=3600):
+    self.path = path
+    self.ttl = ttl
+    self.local = threading.local()
+    self.writes = 0
+    with self._connection() as connection:
+      connection.execute('CREATE TABLE IF NOT EXISTS quiz_sessions '
+                         '(token TEXT PRIMARY KEY, expires REAL NOT NULL, data BLOB NOT NULL, '
+                         'version INTEGER NOT NULL DEFAULT 0)')
+      # files created before sessions were versioned
+      if 'version' not in [c[1] for c in connection.execute('PRAGMA table_info(quiz_sessions)')]:
+        connection.execute('ALTER TABLE quiz_sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+      connection.execute('CREATE INDEX IF NOT EXISTS ix_quiz_sessions_expires ON quiz_sessions (expires)')
+
+  def _connection(self):
+    # one connection per thread
+    connection = getattr(self.local, 'connection', None)
+    if connection is None:
+      connection = sqlite3.connect(self.path, timeout=5)
+      connection.execute('PRAGMA journal_mode=WAL')
+      connection.execute('PRAGMA synchronous=NORMAL')
+      self.local.connection = connection
+    return connection
+
+  def get(self, token):
+    row = self._connection().execute(
+      'SELECT data FROM quiz_sessions WHERE token = ? AND expires > ?', (token, time.time())).fetchone()
+    return bytes(row[0]) if row is not None else None
+
+  def set(self, token, data):
+    now = time.time()
+    with self._connection() as connection:
+      connection.execute('INSERT OR REPLACE INTO quiz_sessions (token, expires, data) VALUES (?, ?, ?)',
+                         (token, now + self.ttl, data))
+      self.writes += 1
+      if self.writes % self.SWEEP_EVERY == 0:
+        connection.execute('DELETE FROM quiz_sessions WHERE expires <= ?', (now,))
+
+  def update(self, token, change):
+    # stores change(data) of the session unless another request stored it
+    # first, in which case change runs again on that; False when there is none
+    connection = self._connection()
+    while True:
+      row = connection.execute('SELECT data, version FROM quiz_sessions WHERE token = ? AND expires > ?',
+                               (token, time.time())).fetchone()
+      if row is None:
+        return False
+      data = change(bytes(row[0]))
+      with connection:
+        updated = connection.execute(
+          'UPDATE quiz_sessions SET data = ?, expires = ?, version = version + 1 WHERE token = ? AND version = ?',
+          (data, time.time() + self.ttl, token, row[1])).rowcount
+      if updated:
+        return True
+
+  def delete(self, token):
+    with self._connection() as connection:
+      connection.execute('DELETE FROM quiz_sessions WHERE token = ?', (token,))
+
+class QuizSessions(object):
+
+  def __init__(self, app=None):
+    self.store = None
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('QUIZ_SESSION_STORE', 'memory')
+    app.config.setdefault('QUIZ_SESSION_TTL', 3600)
+    app.config.setdefault('QUIZ_SESSION_MAX', 100000)
+    app.config.setdefault('QUIZ_SESSION_DB', 'quiz_sessions.db')
+    backend = app.config['QUIZ_SESSION_STORE']
+    if backend == 'memory':
+      self.store = MemoryStore(app.config['QUIZ_SESSION_TTL'], app.config['QUIZ_SESSION_MAX'])
+    elif backend == 'sqlite':
+      self.store = SQLiteStore(app.config['QUIZ_SESSION_DB'], app.config['QUIZ_SESSION_TTL'])
+    else:
+      raise ValueError('Unknown QUIZ_SESSION_STORE %r' % backend)
+    app.extensions['quiz_sessions'] = self
+
+  def start(self, category):
+    # (token, QuizSession) of a new session
+    token = secrets.token_urlsafe(16)
+    quiz = QuizSession(category)
+    self.store.set(token, quiz.encode())
+    return token, quiz
+
+  def get(self, token):
+    data = self.store.get(token)
+    return QuizSession.decode(data) if data is not None else None
+
+  def update(self, token, change):
+    """Runs change(quiz) on the session and saves it; other requests of the
+    session wait, or make change run again on what they saved. Returns what
+    change returned, or raises KeyError when there is no such session."""
+    results = []
+    def apply(data):
+      quiz = QuizSession.decode(data)
+      results[:] = [change(quiz)]
+      return quiz.encode()
+    if not self.store.update(token, apply):
+      raise KeyError(token)
+    return results[0]
@@ -0,0 +1,237 @@
+import random
+import threading
+import time
+import weakref
+from array import array
+from bisect import bisect_left
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history
+
+from models import db, Question, question_rows
+
+#----------------------------------------------------------------------------#
+# Quiz question sampling.
+#
+# QuestionSampler keeps the ids of all questions, and of each category of
+# the catalog (catalog.py), in sorted compact arrays (8 bytes per id), loaded
+# with one scan the first time a quiz asks for a question. A draw picks
+# uniformly among the ids not in previous_questions by rank, in
+# O(len(previous_questions) * log n) with no table scan, and then reads only
+# the chosen row by primary key.
+#
+# Commits in this process that add, delete or recategorize questions update
+# the arrays; other processes' changes are picked up when the arrays are
+# reloaded after QUIZ_SAMPLER_TTL seconds (and a drawn id that has meanwhile
+# been deleted is simply dropped and drawn again). One request reloads them
+# while the others keep drawing from the old arrays; commits made during the
+# reload are applied to the new arrays as well.
+#
+# Quiz sessions (quizsessions.py) remember the questions they have seen as a
+# bitmap indexed by question id, which means the same in every process: a
+# session draw probes a few random ids of the category against the bitmap
+# and only when nearly all are seen falls back to a rank draw excluding them.
+#----------------------------------------------------------------------------#
+
+# random ids tried before a session's seen questions are excluded by rank
+PROBES = 16
+
+# samplers whose arrays follow commits
+_samplers = weakref.WeakSet()
+
+def _key(category):
+  # categories are integers in the database; the model declares a string
+  return int(category) if category is not None else None
+
+class QuestionSampler(object):
+
+  def __init__(self, catalog, app=None, ttl=300):
+    self.catalog = catalog
+    self.ttl = ttl
+    # category id -> array of question ids, None -> all question ids
+    self.pools = None
+    self.expires = 0
+    self.lock = threading.Lock()
+    # held by the one thread loading the arrays
+    self.load_lock = threading.Lock()
+    # changes committed while the arrays are loaded, to apply to them after
+    self.missed = None
+    _samplers.add(self)
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('QUIZ_SAMPLER_TTL', self.ttl)
+    self.ttl = app.config['QUIZ_SAMPLER_TTL']
+    app.extensions['quiz_sampler'] = self
+
+  def load(self):
+    with self.lock:
+      self.missed = []
+    try:
+      pools = dict((c.id, array('q')) for c in self.catalog.categories())
+      pools[None] = array('q')
+      query = select([Question.id, Question.category]).order_by(Question.id)
+      for id, category in db.session.execute(query.execution_options(stream_results=True)):
+        pools[None].append(id)
+        pool = pools.get(_key(category))
+        if pool is not None:
+          pool.append(id)
+      with self.lock:
+        for change, id, category in self.missed:
+          change(pools, id, category)
+        self.pools = pools
+        self.expires = time.monotonic() + self.ttl
+    finally:
+      with self.lock:
+        self.missed = None
+
+  def _pools(self):
+    if self.pools is None:
+      # nothing to draw from yet: wait for the first load
+      with self.load_lock:
+        if self.pools is None:
+          self.load()
+    elif time.monotonic() >= self.expires and self.load_lock.acquire(False):
+      # expired: this request reloads, the others draw from the old arrays
+      try:
+        if time.monotonic() >= self.expires:
+          self.load()
+      finally:
+        self.load_lock.release()
+    return self.pools
+
+  def draw_id(self, category, previous):
+    """A random question id of category (None for any) not in previous, or
+    None when there is none left."""
+    pools = self._pools()
+    with self.lock:
+      return _draw_excluding(pools.get(_key(category)), previous)
+
+  def draw(self, category, previous):
+    """A random QuestionRow of category not in previous, or None."""
+    previous = set(previous)
+    while True:
+      id = self.draw_id(category, previous)
+      if id is None:
+        return None
+      rows = question_rows(Question.id == id)
+      if rows:
+        return rows[0]
+      # deleted by another process since the arrays were loaded
+      self.remove(id)
+      previous.add(id)
+
+  def draw_for(self, quiz):
+    """A random QuestionRow the quiz session has not seen, or None."""
+    while True:
+      id = self.draw_unseen(quiz)
+      if id is None:
+        return None
+      rows = question_rows(Question.id == id)
+      if rows:
+        return rows[0]
+      self.remove(id)
+
+  def draw_unseen(self, quiz):
+    """A random question id of the quiz session's category it has not seen,
+    marked as seen, or None when none is left."""
+    pools = self._pools()
+    with self.lock:
+      ids = pools.get(_key(quiz.category))
+      if not ids:
+        return None
+      for _ in range(PROBES):
+        id = ids[random.randrange(len(ids))]
+        if not quiz.has_seen(id):
+          break
+      else:
+        id = _draw_excluding(ids, quiz.seen_ids())
+        if id is None:
+          return None
+      quiz.mark_seen(id)
+      return id
+
+  def add(self, id, category):
+    self._change(_add, id, category)
+
+  def remove(self, id, category=None):
+    self._change(_remove, id, category)
+
+  def _change(self, change, id, category):
+    with self.lock:
+      if self.pools is not None:
+        change(self.pools, id, category)
+      if self.missed is not None:
+        self.missed.append((change, id, category))
+
+def _add(pools, id, category):
+  # a category created since the arrays were loaded gets its array here
+  for pool in (pools[None], pools.setdefault(_key(category), array('q'))):
+    i = bisect_left(pool, id)
+    if i == len(pool) or pool[i] != id:
+      pool.insert(i, id)
+
+def _remove(pools, id, category=None):
+  # category is not needed: every pool is looked in, as the category the
+  # question was in may no longer be known
+  for pool in pools.values():
+    i = bisect_left(pool, id)
+    if i < len(pool) and pool[i] == id:
+      del pool[i]
+
+def _draw_excluding(ids, previous):
+  # a random id of the sorted array ids not in previous, or None
+  if not ids:
+    return None
+  # positions of the previous questions that are in the array, ascending
+  excluded = []
+  for id in set(previous):
+    i = bisect_left(ids, id)
+    if i < len(ids) and ids[i] == id:
+      excluded.append(i)
+  excluded.sort()
+  if len(excluded) >= len(ids):
+    return None
+  # the rank-th remaining id is at rank plus the excluded positions at or
+  # before it
+  i = random.randrange(len(ids) - len(excluded))
+  for position in excluded:
+    if position > i:
+      break
+    i += 1
+  return ids[i]
+
+#----------------------------------------------------------------------------#
+# Following commits.
+#----------------------------------------------------------------------------#
+
+def _changes(target):
+  session = object_session(target)
+  return session.info.setdefault('sampler_changes', []) if session is not None else []
+
+@event.listens_for(Question, 'after_insert')
+def _question_inserted(mapper, connection, target):
+  _changes(target).append(('add', target.id, target.category))
+
+@event.listens_for(Question, 'after_delete')
+def _question_deleted(mapper, connection, target):
+  _changes(target).append(('remove', target.id, None))
+
+@event.listens_for(Question, 'after_update')
+def _question_updated(mapper, connection, target):
+  history = get_history(target, 'category')
+  if history.has_changes():
+    _changes(target).append(('remove', target.id, None))
+    _changes(target).append(('add', target.id, target.category))
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+  for change, id, category in session.info.pop('sampler_changes', []):
+    for sampler in list(_samplers):
+      getattr(sampler, change)(id, category)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+  session.info.pop('sampler_changes', None)
@@ -0,0 +1,94 @@
+import re
+
+from sqlalchemy import case, column, func, literal, literal_column, or_, select, table
+
+from models import db, Question, QuestionRow
+
+#----------------------------------------------------------------------------#
+# Question search.
+#
+# Finds the questions whose question or answer text contains the search
+# term, or all of its words as prefixes, ranks the matches, question text
+# counting more, then pages through them in the database. PostgreSQL uses
+# the search_vector and trigram indexes (substring matches ranked by
+# similarity), SQLite the questions_fts FTS5 table (bm25, with substring
+# matches after the word matches); both are created by install_search_index()
+# in models.py. Anything else, or SQLite without FTS5, falls back to unranked
+# substring matching.
+#----------------------------------------------------------------------------#
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+QUESTION_COLUMNS = [Question.id, Question.question, Question.answer, Question.category, Question.difficulty]
+
+questions_fts = table('questions_fts', column('rowid'))
+
+def tokenize(term):
+  return TOKEN.findall((term or '').lower())
+
+# engine url -> 'postgresql', 'fts5' or 'like'
+_backends = {}
+
+def backend():
+  key = str(db.engine.url)
+  if key not in _backends:
+    name = db.engine.dialect.name
+    if name == 'sqlite':
+      with db.engine.connect() as connection:
+        installed = connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'questions_fts'").first()
+      name = 'fts5' if installed else 'like'
+    elif name != 'postgresql':
+      name = 'like'
+    _backends[key] = name
+  return _backends[key]
+
+def _substring(term):
+  # the term is matched literally, with / escaping LIKE wildcards
+  pattern = '%' + term.replace('/', '//').replace('%', '/%').replace('_', '/_') + '%'
+  return Question.question.ilike(pattern, escape='/'), Question.answer.ilike(pattern, escape='/')
+
+def _match(term):
+  # (from clause, WHERE criterion, rank): higher ranks first
+  tokens = tokenize(term)
+  questions = Question.__table__
+  if not term:
+    return questions, None, literal(0.0)
+  kind = backend() if tokens else 'like'
+  if kind == 'postgresql':
+    vector = literal_column('questions.search_vector')
+    tsquery = func.to_tsquery('english', ' & '.join(t + ':*' for t in tokens))
+    in_question, in_answer = _substring(term)
+    rank = (func.ts_rank_cd(vector, tsquery)
+            + func.greatest(func.similarity(Question.question, term), func.similarity(Question.answer, term)))
+    return questions, or_(vector.op('@@')(tsquery), in_question, in_answer), rank
+  if kind == 'fts5':
+    fts = literal_column('questions_fts')
+    query = ' AND '.join('"%s"*' % t for t in tokens)
+    # bm25 is lower for better matches; question text weighs double. MATCH
+    # cannot sit in an OR, so the word matches are joined in and the
+    # substring matches of the other branches are ORed with the join
+    matches = select([questions_fts.c.rowid, (-func.bm25(fts, 2.0, 1.0)).label('rank')]) \
+      .where(fts.op('MATCH')(query)).alias('fts_matches')
+    in_question, in_answer = _substring(term)
+    return (questions.outerjoin(matches, matches.c.rowid == Question.id),
+            or_(matches.c.rowid != None, in_question, in_answer), func.coalesce(matches.c.rank, 0.0))
+  in_question, in_answer = _substring(term)
+  return questions, or_(in_question, in_answer), case([(in_question, 1.0)], else_=0.5)
+
+def search_questions(term, category=None, difficulty=None, page=1, per_page=10):
+  """([QuestionRow] of one page of matches, best first, total matches)."""
+  from_obj, criterion, rank = _match(term)
+  criteria = [] if criterion is None else [criterion]
+  if category is not None:
+    criteria.append(Question.category == category)
+  if difficulty is not None:
+    criteria.append(Question.difficulty == difficulty)
+  query = select(QUESTION_COLUMNS).select_from(from_obj)
+  for c in criteria:
+    query = query.where(c)
+  total = db.session.execute(select([func.count()]).select_from(query.alias('matches'))).scalar()
+  rows = []
+  if page >= 1:
+    query = query.order_by(rank.desc(), Question.id).limit(per_page).offset((page - 1) * per_page)
+    rows = [QuestionRow._make(r) for r in db.session.execute(query)]
+  return rows, total
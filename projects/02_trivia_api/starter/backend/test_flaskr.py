@@ -1,10 +1,16 @@
 import os
+import tempfile
+import threading
 import unittest
 import json
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 
-from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr import create_app, querycount, quiz_sessions, catalog, sampler
+from models import setup_db, db, Question, Category
+from sampler import QuestionSampler
+from catalog import CategoryCatalog
+from quizsessions import QuizSessions
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -118,6 +124,41 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertEqual(data['total_questions'], 0)
 
+    def test_search_questions_ranked_and_filtered(self):
+        res = self.client().post('/questions/search', json={'searchTerm':'soccer world cup', 'category':6})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(sorted(q['id'] for q in data['questions']), [10, 11])
+        self.assertEqual(data['total_questions'], 2)
+
+        res = self.client().post('/questions/search', json={'searchTerm':'soccer', 'category':6, 'difficulty':4})
+        data = json.loads(res.data)
+
+        self.assertEqual([q['id'] for q in data['questions']], [11])
+        self.assertEqual(data['total_questions'], 1)
+
+    def test_search_questions_answer_text(self):
+        res = self.client().post('/questions/search', json={'searchTerm':'uruguay'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([q['id'] for q in data['questions']], [11])
+
+    def test_search_questions_mid_word(self):
+        res = self.client().post('/questions/search', json={'searchTerm':'orld cu'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(sorted(q['id'] for q in data['questions']), [10, 11])
+
+    def test_422_search_questions_bad_filter(self):
+        res = self.client().post('/questions/search', json={'searchTerm':'title', 'difficulty':'hard'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
     def test_get_question_by_category(self):
         res = self.client().get('/categories/1/questions')
         data = json.loads(res.data)
@@ -150,6 +191,69 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertEqual(data['question'], None)
 
+    def test_quiz_session(self):
+        res = self.client().post('/quizzes/session', json={'quiz_category': {'type': 'Sports', 'id': '6'}})
+        token = json.loads(res.data)['session']
+        asked = []
+        while True:
+            with querycount.budget(1):
+                res = self.client().post('/quizzes', json={'session': token})
+            question = json.loads(res.data)['question']
+            if question is None:
+                break
+            asked.append(question['id'])
+
+        self.assertEqual(sorted(asked), [10, 11])
+
+    def test_quiz_session_in_another_process(self):
+        res = self.client().post('/quizzes/session', json={'quiz_category': {'type': 'Sports', 'id': '6'}})
+        token = json.loads(res.data)['session']
+        first = json.loads(self.client().post('/quizzes', json={'session': token}).data)['question']['id']
+        with self.app.app_context():
+            # a fresh sampler has its own id arrays, as in another worker
+            quiz = quiz_sessions.get(token)
+            second = QuestionSampler(CategoryCatalog()).draw_for(quiz)
+
+        self.assertEqual(sorted([first, second.id]), [10, 11])
+
+    def test_quizzes_during_reload(self):
+        self.client().post('/quizzes', json={'previous_questions': [], 'quiz_category': {'id': 0}})
+        sampler.expires = 0
+        # while another request reloads the expired arrays, draws use the old ones
+        with sampler.load_lock:
+            with querycount.budget(1):
+                res = self.client().post('/quizzes', json={'previous_questions': [], 'quiz_category': {'id': 0}})
+
+        self.assertTrue(json.loads(res.data)['question'])
+
+    def test_quiz_session_concurrent_draws(self):
+        for store in ('memory', 'sqlite'):
+            app = Flask(__name__)
+            app.config.update(QUIZ_SESSION_STORE=store,
+                              QUIZ_SESSION_DB=os.path.join(tempfile.mkdtemp(), 'sessions.db'))
+            sessions = QuizSessions(app)
+            token, quiz = sessions.start(None)
+            other = threading.Thread(target=sessions.update, args=(token, lambda quiz: quiz.mark_seen(11)))
+
+            def draw(quiz):
+                quiz.mark_seen(10)
+                # a second request of the session comes in during this draw
+                if not other.is_alive() and other.ident is None:
+                    other.start()
+                other.join(0.2)
+            sessions.update(token, draw)
+            other.join()
+
+            quiz = sessions.get(token)
+            self.assertEqual((quiz.count, quiz.seen_ids()), (2, [10, 11]), store)
+
+    def test_quiz_session_not_found(self):
+        res = self.client().post('/quizzes', json={'session': 'unknown'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
     def test_quizzes_method_not_allowed(self):
         res = self.client().get('/quizzes', json={'previous_questions': [], 'quiz_category': {'type': 'Sports', 'id': '6'}})
         data = json.loads(res.data)
@@ -157,6 +261,96 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 405)
         self.assertEqual(data['success'], False)
 
+    def test_categories_query_budget(self):
+        self.client().get('/categories')
+        # a version check that finds the categories unchanged
+        catalog.expire()
+        with querycount.budget(1):
+            res = self.client().get('/categories')
+
+        self.assertEqual(res.status_code, 200)
+        # served from the catalog until its version check is due
+        with querycount.budget(0):
+            res = self.client().get('/categories')
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_category_write_updates_catalog(self):
+        self.client().get('/categories')
+        with self.app.app_context():
+            category = Category('Music')
+            db.session.add(category)
+            db.session.commit()
+            category_id = category.id
+        try:
+            data = json.loads(self.client().get('/categories').data)
+            self.assertEqual(data['categories'][str(category_id)], 'Music')
+            self.assertEqual(self.client().get('/categories/%d/questions' % category_id).status_code, 200)
+        finally:
+            with self.app.app_context():
+                Category.query.filter(Category.id == category_id).delete()
+                db.session.commit()
+
+    def test_quiz_in_new_category(self):
+        # draw once so the sampler has loaded its arrays before the category exists
+        self.client().post('/quizzes', json={'previous_questions': [], 'quiz_category': {'id': 0}})
+        with self.app.app_context():
+            category = Category('Music')
+            db.session.add(category)
+            db.session.commit()
+            category_id = category.id
+            question = Question('Who wrote Clair de Lune?', 'Debussy', str(category_id), 2)
+            db.session.add(question)
+            db.session.commit()
+            question_id = question.id
+        try:
+            res = self.client().post('/quizzes', json={'previous_questions': [],
+                                                       'quiz_category': {'type': 'Music', 'id': str(category_id)}})
+            self.assertEqual(json.loads(res.data)['question']['id'], question_id)
+        finally:
+            with self.app.app_context():
+                Question.query.filter(Question.id == question_id).delete()
+                Category.query.filter(Category.id == category_id).delete()
+                db.session.commit()
+
+    def test_questions_query_budget(self):
+        # the first request caches the total count
+        self.client().get('/questions')
+        with querycount.budget(2):
+            res = self.client().get('/questions?page=2')
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_questions_keyset_page(self):
+        first = json.loads(self.client().get('/questions').data)
+        res = self.client().get('/questions?after=' + str(first['next_cursor']))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'], json.loads(self.client().get('/questions?page=2').data)['questions'])
+        self.assertEqual(data['total_questions'], first['total_questions'])
+
+    def test_quizzes_query_budget(self):
+        # the first quiz loads the question id arrays; later ones read one row
+        self.client().post('/quizzes', json={'previous_questions': [], 'quiz_category': {'type': 'Sports', 'id': '6'}})
+        with querycount.budget(1):
+            res = self.client().post('/quizzes', json={'previous_questions': [], 'quiz_category': {'type': 'Sports', 'id': '6'}})
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_quizzes_draw_each_question_once(self):
+        expected = [q.id for q in Question.query.filter(Question.category == 1)]
+        previous = []
+        while True:
+            res = self.client().post('/quizzes', json={'previous_questions': previous, 'quiz_category': {'type': 'Science', 'id': '1'}})
+            question = json.loads(res.data)['question']
+            if question is None:
+                break
+            self.assertEqual(question['category'], 1)
+            previous.append(question['id'])
+
+        self.assertEqual(sorted(previous), sorted(expected))
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file